@@ -0,0 +1,266 @@
+# Modo ASGI opcional (pip install -r requirements-asgi.txt; uvicorn asgi:app --workers 4).
+# As rotas de leitura que passam o tempo esperando o banco (/api/dashboard, /api/disponibilidade, /api/busca e
+# /api/movimentacoes) rodam com SQLAlchemy assíncrono, sem prender uma thread por consulta; gráfico e PDFs são
+# renderizados num pool de processos; o /api/stream é uma corrotina por conexão. O resto (cadastros, CSV, anexo do
+# relatório, jobs, métricas) vai pro app Flask de sempre, em ASGI_WSGI_WORKERS threads.
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl
+import asyncio
+import hashlib
+import time
+
+from a2wsgi import WSGIMiddleware
+from flask import g
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags
+from werkzeug.routing import Map, Rule
+
+from mstarsupply import create_app
+from mstarsupply.banco import marcar_replica_fora, replica_disponivel
+from mstarsupply.cache import chave_resposta, guardar_resposta, ler_resposta
+from mstarsupply.cadastros import dados_movimentacoes
+from mstarsupply.consultas import dados_busca, dados_dashboard, dados_disponibilidade
+from mstarsupply.eventos import CABECALHOS_STREAM, formatar_evento, ler_filtros_stream
+from mstarsupply.metricas import registrar_medicao, server_timing
+from mstarsupply.relatorios import iniciar_processo_relatorios, renderizar_no_processo
+
+flask_app = create_app()
+wsgi = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_WORKERS'])
+
+# Mesmo banco do app, trocando o driver pelo assíncrono (DATABASE_URL continua valendo)
+DRIVERS_ASSINCRONOS = {'mysql': 'mysql+aiomysql', 'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+def criar_motor(url, opcoes):
+    url = make_url(url)
+    return create_async_engine(url.set(drivername=DRIVERS_ASSINCRONOS.get(url.get_backend_name(), url.drivername)), **opcoes)
+
+motores = {"primario": criar_motor(flask_app.config['SQLALCHEMY_DATABASE_URI'], flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'])}
+if 'replica' in flask_app.config.get('SQLALCHEMY_BINDS', {}):
+    opcoes_replica = dict(flask_app.config['SQLALCHEMY_BINDS']['replica'])
+    motores["replica"] = criar_motor(opcoes_replica.pop('url'), opcoes_replica)
+
+# Roda a função de consulta (a mesma das rotas do Flask, recebendo a sessão) numa sessão assíncrona.
+# Como no ler_na_replica: vai pra réplica se houver e, se ela falhar, repete no primário.
+async def ler(funcao, *args):
+    usar_replica = 'replica' in motores and replica_disponivel()
+    try:
+        return await executar(motores['replica' if usar_replica else 'primario'], funcao, *args)
+    except OperationalError as erro:
+        if not usar_replica:
+            raise
+        marcar_replica_fora(erro)
+        return await executar(motores['primario'], funcao, *args)
+
+async def executar(motor, funcao, *args):
+    async with AsyncSession(motor) as sessao:
+        return await sessao.run_sync(funcao, *args)
+
+def resposta_json(dados, status=200, cabecalhos=()):
+    # Mesmo corpo do jsonify do Flask, então as ETags batem entre os dois modos
+    return status, [('Content-Type', 'application/json')] + list(cabecalhos), flask_app.json.response(dados).get_data()
+
+async def dashboard(args):
+    return resposta_json(await ler(dados_dashboard))
+
+async def disponibilidade(args):
+    resultado, total = await ler(dados_disponibilidade, args)
+    return resposta_json(resultado, cabecalhos=[] if total is None else [('X-Total-Count', str(total))])
+
+async def busca(args):
+    resultados, proxima = await ler(dados_busca, args)
+    return resposta_json(resultados, cabecalhos=[] if proxima is None else [('X-Proxima-Pagina', str(proxima))])
+
+async def movimentacoes(args, mes, ano):
+    resultado, proximo = await ler(dados_movimentacoes, mes, ano, args)
+    return resposta_json(resultado, cabecalhos=[] if proximo is None else [('X-Proximo-After-Id', str(proximo))])
+
+# Pool de renderização: cada processo monta o próprio app Flask, sem cache de respostas (quem guarda é este processo)
+executor_renderizacao = None
+
+def pool_renderizacao():
+    global executor_renderizacao
+    if executor_renderizacao is None:
+        executor_renderizacao = ProcessPoolExecutor(
+            max_workers=flask_app.config['RENDERIZACAO_WORKERS'],
+            initializer=iniciar_processo_relatorios,
+            initargs=(dict(flask_app.config, CACHE_RESPOSTAS='desligado'),)
+        )
+    return executor_renderizacao
+
+async def renderizar(caminho, query_string, cabecalhos):
+    condicionais = {nome: valor for nome, valor in cabecalhos.items() if nome in ('if-none-match', 'if-modified-since')}
+    return await asyncio.get_running_loop().run_in_executor(
+        pool_renderizacao(), renderizar_no_processo, caminho, query_string, condicionais
+    )
+
+# Rotas atendidas aqui (só GET) e as tags do cache de respostas de cada uma, iguais às das rotas do Flask
+rotas = Map([
+    Rule('/api/dashboard', endpoint='dashboard'),
+    Rule('/api/disponibilidade', endpoint='disponibilidade'),
+    Rule('/api/busca', endpoint='busca'),
+    Rule('/api/movimentacoes/<int:mes>/<int:ano>', endpoint='movimentacoes'),
+    Rule('/api/grafico/<int:mes>/<int:ano>', endpoint='grafico'),
+    Rule('/api/relatorio/<int:mes>/<int:ano>', endpoint='relatorio'),
+    Rule('/api/relatorio_gerencial/<int:mes>/<int:ano>', endpoint='relatorio_gerencial'),
+    Rule('/api/stream', endpoint='stream'),
+]).bind('localhost')
+CONSULTAS = {'dashboard': dashboard, 'disponibilidade': disponibilidade, 'busca': busca, 'movimentacoes': movimentacoes}
+TAGS = {
+    'dashboard': ('mercadorias', 'movimentos'),
+    'disponibilidade': ('mercadorias', 'movimentos'),
+    'movimentacoes': ('mes-{ano}-{mes:02d}',),
+    'relatorio': ('mes-{ano}-{mes:02d}',),
+    'relatorio_gerencial': ('mes-{ano}-{mes:02d}',),
+}
+
+# ETag forte e 304, como o resposta_em_cache faz nas rotas do Flask
+def condicional(cabecalhos_requisicao, status, cabecalhos, corpo):
+    etag = hashlib.sha1(corpo).hexdigest()
+    cabecalhos = [(nome, valor) for nome, valor in cabecalhos if nome.lower() not in ('etag', 'cache-control')]
+    cabecalhos += [('ETag', f'"{etag}"'), ('Cache-Control', 'no-cache')]
+    if parse_etags(cabecalhos_requisicao.get('if-none-match')).contains(etag):
+        return 304, cabecalhos, b''
+    return status, cabecalhos, corpo
+
+async def atender(endpoint, parametros, regra, caminho, query_string, cabecalhos):
+    args = MultiDict(parse_qsl(query_string, keep_blank_values=True))
+    cache = flask_app.extensions.get('cache_respostas') if endpoint in TAGS else None
+    if cache is not None:
+        chave = chave_resposta(caminho, args)
+        versoes = cache.versoes([tag.format(**parametros) for tag in TAGS[endpoint]])
+        entrada = ler_resposta(cache, chave, versoes, regra)
+        if entrada is not None:
+            return condicional(cabecalhos, entrada['status'], entrada['cabecalhos'], entrada['corpo'])
+
+    try:
+        if endpoint in CONSULTAS:
+            status, cabecalhos_resposta, corpo = await CONSULTAS[endpoint](args, **parametros)
+        else:
+            status, cabecalhos_resposta, corpo = await renderizar(caminho, query_string, cabecalhos)
+    except ValueError as erro:
+        return resposta_json({"error": str(erro)}, 400)
+
+    if cache is None or status != 200:
+        return status, cabecalhos_resposta, corpo
+    guardar_resposta(cache, chave, versoes, status, cabecalhos_resposta, corpo)
+    return condicional(cabecalhos, status, cabecalhos_resposta, corpo)
+
+# Cabeçalhos que o Flask põe em toda resposta e as rotas nativas não ganhariam: o CORS do flask_cors (mesmas
+# CORS_ORIGENS do create_app) e o Server-Timing das métricas. Chamar com o g da requisição.
+def com_cabecalhos_do_flask(cabecalhos_requisicao, cabecalhos):
+    extras = [('Server-Timing', server_timing(g))]
+    origem = cabecalhos_requisicao.get('origin')
+    if origem in flask_app.config['CORS_ORIGENS']:
+        extras.append(('Access-Control-Allow-Origin', origem))
+    nomes = {nome.lower() for nome, _ in extras}
+    return [(nome, valor) for nome, valor in cabecalhos if nome.lower() not in nomes] + extras
+
+async def responder(scope, send, status, cabecalhos, corpo):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(nome.lower().encode('latin-1'), valor.encode('latin-1'))
+                    for nome, valor in cabecalhos if nome.lower() not in ('content-length', 'date', 'server')]
+                   + [(b'content-length', str(len(corpo)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else corpo})
+
+async def esperar_desconexao(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+# /api/stream sem thread: a conexão espera a fila da assinatura no loop (quem grava o movimento, numa thread do
+# WSGI ou no socket de IPC, agenda a entrega aqui), com o mesmo heartbeat e os mesmos eventos da rota do Flask.
+# Termina quando o cliente desconecta ou fica pra trás (fila cheia); o navegador reconecta sozinho.
+async def stream(regra, scope, receive, send, cabecalhos_requisicao):
+    args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+    with flask_app.app_context():
+        g.inicio_requisicao = time.perf_counter()
+        try:
+            tipos, mercadoria_id = ler_filtros_stream(args)
+        except ValueError as erro:
+            g.status_resposta = 400
+            registrar_medicao(flask_app, regra, 'GET', g)
+            status, cabecalhos, corpo = resposta_json({"error": str(erro)}, 400)
+            return await responder(scope, send, status, com_cabecalhos_do_flask(cabecalhos_requisicao, cabecalhos), corpo)
+        g.status_resposta = 200
+        registrar_medicao(flask_app, regra, 'GET', g)  # Como no Flask: mede até a resposta começar
+        cabecalhos = com_cabecalhos_do_flask(
+            cabecalhos_requisicao, [('Content-Type', 'text/event-stream; charset=utf-8')] + list(CABECALHOS_STREAM.items())
+        )
+
+    canal = flask_app.extensions['eventos']
+    assinatura = canal.assinar(tipos, mercadoria_id, asyncio.get_running_loop())
+    desconexao = asyncio.ensure_future(esperar_desconexao(receive))
+    proximo = None
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (nome.lower().encode('latin-1'), valor.encode('latin-1')) for nome, valor in cabecalhos
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        while not assinatura.atrasada:
+            if proximo is None:
+                proximo = asyncio.ensure_future(assinatura.fila.get())
+            prontos, _ = await asyncio.wait({proximo, desconexao}, timeout=flask_app.config['EVENTOS_HEARTBEAT'],
+                                            return_when=asyncio.FIRST_COMPLETED)
+            if proximo in prontos:
+                texto, proximo = formatar_evento(*proximo.result()), None
+            elif desconexao in prontos:
+                return
+            else:
+                texto = ": ping\n\n"
+            await send({'type': 'http.response.body', 'body': texto.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        canal.cancelar(assinatura)
+        desconexao.cancel()
+        if proximo is not None:
+            proximo.cancel()
+
+async def ciclo_de_vida(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensagem['type'] == 'lifespan.shutdown':
+            for motor in motores.values():
+                await motor.dispose()
+            if executor_renderizacao is not None:
+                executor_renderizacao.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await ciclo_de_vida(receive, send)
+    if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+        return await wsgi(scope, receive, send)
+    try:
+        regra, parametros = rotas.match(scope['path'], method='GET', return_rule=True)
+    except HTTPException:
+        return await wsgi(scope, receive, send)
+    cabecalhos = {nome.decode('latin-1').lower(): valor.decode('latin-1') for nome, valor in scope['headers']}
+    if regra.endpoint == 'stream':
+        if scope['method'] != 'GET':
+            return await wsgi(scope, receive, send)
+        return await stream(regra, scope, receive, send, cabecalhos)
+    query_string = scope['query_string'].decode('latin-1')
+    if regra.endpoint == 'movimentacoes' and 'formato=ndjson' in query_string:
+        return await wsgi(scope, receive, send)  # Streaming fica com o Flask
+
+    with flask_app.app_context():
+        g.inicio_requisicao = time.perf_counter()
+        g.status_resposta = 500  # Se atender levantar exceção, a medição sai como erro
+        try:
+            status, cabecalhos_resposta, corpo = await atender(
+                regra.endpoint, parametros, regra.rule, scope['path'], query_string, cabecalhos
+            )
+            g.status_resposta = status
+            cabecalhos_resposta = com_cabecalhos_do_flask(cabecalhos, cabecalhos_resposta)
+        finally:
+            registrar_medicao(flask_app, regra, 'GET', g)
+    await responder(scope, send, status, cabecalhos_resposta, corpo)
@@ -0,0 +1,90 @@
+# Benchmark do /api/analytics: compara a agregação vetorizada (soma diária no banco + numpy)
+# com o jeito ingênuo de carregar cada movimento pelo ORM e somar num dicionário em Python.
+#
+# Uso: python benchmarks/analytics.py [--entradas 1000000] [--saidas 500000] [--agrupar tipo,mes] [--database-url URL]
+import argparse
+import json
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import dados
+
+parser = argparse.ArgumentParser(description='Benchmark da API de análise por período')
+parser.add_argument('--database-url', help='Base vazia pro benchmark (padrão: SQLite temporário)')
+parser.add_argument('--mercadorias', type=int, default=5000)
+parser.add_argument('--entradas', type=int, default=1000000)
+parser.add_argument('--saidas', type=int, default=500000)
+parser.add_argument('--agrupar', default='tipo,mes')
+parser.add_argument('--de', default='2022-01-01')
+parser.add_argument('--ate', default='2024-12-31')
+parser.add_argument('--repeticoes', type=int, default=3)
+args = parser.parse_args()
+
+dados.configurar_base(args.database_url)
+from app import app  # noqa: E402
+from mstarsupply.banco import db  # noqa: E402
+from mstarsupply.modelos import Mercadoria, Entrada, Saida  # noqa: E402
+
+dados.comando('criar-tabelas')
+
+# Versão ingênua: um objeto ORM por movimento, chave montada em Python (só tipo/fabricante/local + mes)
+def ingenuo(de, ate, agrupar):
+    mercadorias = {m.id: m for m in Mercadoria.query}
+    somas = defaultdict(lambda: [0, 0])
+    for posicao, modelo in enumerate((Entrada, Saida)):
+        for movimento in modelo.query.filter(modelo.data_hora >= de, modelo.data_hora < ate):
+            mercadoria = mercadorias.get(movimento.mercadoria_id)
+            chave = []
+            for campo in agrupar:
+                if campo == 'mes':
+                    chave.append(movimento.data_hora.strftime('%Y-%m'))
+                elif campo == 'local':
+                    chave.append(movimento.local)
+                elif campo == 'mercadoria':
+                    chave.append(movimento.mercadoria_id)
+                else:
+                    chave.append(getattr(mercadoria, campo) if mercadoria else "Desconhecido")
+            somas[tuple(chave)][posicao] += movimento.quantidade
+    return somas
+
+def cronometrar(funcao):
+    tempos = []
+    for _ in range(args.repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+with app.app_context():
+    inicio = time.perf_counter()
+    dados.popular(mercadorias=args.mercadorias, entradas=args.entradas, saidas=args.saidas)
+    carga = time.perf_counter() - inicio
+
+    agrupar = args.agrupar.split(',')
+    cliente = app.test_client()
+    url = f'/api/analytics?de={args.de}&ate={args.ate}&agrupar={args.agrupar}'
+    tempo_api, resposta = cronometrar(lambda: cliente.get(url).get_json())
+    de = datetime.strptime(args.de, '%Y-%m-%d')
+    ate = datetime.strptime(args.ate, '%Y-%m-%d').replace(hour=23, minute=59, second=59, microsecond=999999)
+    tempo_orm, somas = cronometrar(lambda: ingenuo(de, ate, agrupar))
+    db.session.remove()
+
+    vetorizado = {
+        tuple(str(item["chave"][campo if campo != 'mercadoria' else 'mercadoria_id']) for campo in agrupar):
+            (item["entradas"], item["saidas"])
+        for item in resposta["series"]
+    }
+    referencia = {tuple(str(valor) for valor in chave): tuple(total) for chave, total in somas.items()}
+    print(json.dumps({
+        "dialeto": db.engine.dialect.name,
+        "entradas": args.entradas,
+        "saidas": args.saidas,
+        "agrupar": agrupar,
+        "carga_s": round(carga, 2),
+        "grupos": len(resposta["series"]),
+        "analytics_ms": round(tempo_api * 1000, 2),
+        "orm_ms": round(tempo_orm * 1000, 2),
+        "ganho": round(tempo_orm / max(tempo_api, 0.001), 1),
+        "mesmo_resultado": vetorizado == referencia,
+    }, indent=2, ensure_ascii=False))
@@ -0,0 +1,95 @@
+# Benchmark do arquivamento: popula --anos de movimentos até hoje e mede, antes e depois do flask arquivar (que deixa
+# só os últimos --meses-quentes meses nas tabelas quentes), o tamanho das tabelas quentes, a gravação de um lote de
+# entradas, a busca por local sem data, as movimentações de um mês recente e as de um mês arquivado (que precisam
+# continuar iguais). Com o arquivo as rotas dos meses recentes ficam no tamanho dos meses quentes, seja qual for a
+# idade da base.
+#
+# Uso: python benchmarks/arquivamento.py [--entradas 2000000] [--saidas 1000000] [--mercadorias 2000] [--anos 6] [--meses-quentes 12]
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import dados
+
+parser = argparse.ArgumentParser(description='Benchmark das tabelas quentes antes e depois do arquivamento')
+parser.add_argument('--database-url', help='Base vazia pro benchmark (padrão: SQLite temporário)')
+parser.add_argument('--entradas', type=int, default=2000000)
+parser.add_argument('--saidas', type=int, default=1000000)
+parser.add_argument('--mercadorias', type=int, default=2000)
+parser.add_argument('--anos', type=int, default=6)
+parser.add_argument('--meses-quentes', type=int, default=12)
+parser.add_argument('--lote', type=int, default=1000, help='Entradas por POST /api/entradas/bulk')
+parser.add_argument('--repeticoes', type=int, default=5)
+args = parser.parse_args()
+
+dados.configurar_base(args.database_url)
+os.environ['CACHE_RESPOSTAS'] = 'desligado'
+os.environ['ARQUIVO_MESES_QUENTES'] = str(args.meses_quentes)
+from app import app  # noqa: E402
+from mstarsupply.banco import db  # noqa: E402
+from mstarsupply.modelos import Entrada, Saida, EntradaArquivada, SaidaArquivada  # noqa: E402
+from mstarsupply.estoque import mes_anterior  # noqa: E402
+
+dados.comando('criar-tabelas')
+
+def cronometrar(funcao):
+    tempos = []
+    for _ in range(args.repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return tempos[len(tempos) // 2], resultado
+
+def contar(modelo):
+    return db.session.scalar(db.select(db.func.count()).select_from(modelo))
+
+hoje = datetime.now()
+recente = mes_anterior(hoje.year, hoje.month)
+antigo = (hoje.year - args.anos + 1, 6)
+cliente = app.test_client()
+lotes = iter(range(10 ** 6))
+
+def gravar_lote():
+    dia = f"{hoje:%Y-%m}-{min(hoje.day, 28):02d}"
+    return cliente.post('/api/entradas/bulk', json=[
+        {"mercadoria_id": 1 + (next(lotes) * args.lote + i) % args.mercadorias, "quantidade": 1,
+         "data_hora": f"{dia} 12:00:00", "local": "Doca 1", "custo_unitario": 10}
+        for i in range(args.lote)
+    ]).status_code
+
+def medir():
+    with app.app_context():
+        tamanho = {"entradas": contar(Entrada), "saidas": contar(Saida),
+                   "entradas_arquivo": contar(EntradaArquivada), "saidas_arquivo": contar(SaidaArquivada)}
+    gravacao, _ = cronometrar(gravar_lote)
+    busca, _ = cronometrar(lambda: cliente.get('/api/busca', query_string={'tipo': 'saidas', 'local': 'Filial', 'pagina': 20}).status_code)
+    mes_recente, _ = cronometrar(lambda: cliente.get(f'/api/movimentacoes/{recente[1]}/{recente[0]}', query_string={'local': 'Doca'}).data)
+    mes_antigo, corpo_antigo = cronometrar(lambda: cliente.get(f'/api/movimentacoes/{antigo[1]}/{antigo[0]}', query_string={'local': 'Doca'}).data)
+    return {
+        "tabelas": tamanho,
+        "gravar_lote_ms": round(gravacao * 1000, 2),
+        "busca_local_ms": round(busca * 1000, 2),
+        "movimentacoes_mes_recente_ms": round(mes_recente * 1000, 2),
+        "movimentacoes_mes_arquivado_ms": round(mes_antigo * 1000, 2),
+    }, corpo_antigo
+
+with app.app_context():
+    dialeto = db.engine.dialect.name
+    inicio = datetime(hoje.year - args.anos, hoje.month, 1)
+    dados.popular(mercadorias=args.mercadorias, entradas=args.entradas, saidas=args.saidas,
+                  inicio=inicio, dias=(hoje - inicio).days)
+
+antes, corpo_antes = medir()
+inicio_arquivo = time.perf_counter()
+dados.comando('arquivar')
+arquivamento = time.perf_counter() - inicio_arquivo
+depois, corpo_depois = medir()
+
+print(json.dumps({
+    "dialeto": dialeto, "movimentos": args.entradas + args.saidas, "anos": args.anos,
+    "meses_quentes": args.meses_quentes, "arquivar_s": round(arquivamento, 2),
+    "antes": antes, "depois": depois, "mes_arquivado_igual": corpo_antes == corpo_depois,
+}, indent=2, ensure_ascii=False))
@@ -0,0 +1,61 @@
+# Benchmark da busca: compara o filtro antigo (ILIKE '%termo%' em quatro colunas) com a busca indexada
+# de /api/busca (FULLTEXT no MySQL, LIKE por palavra nos outros bancos) e a busca de entradas por mercadoria.
+#
+# Uso: python benchmarks/busca.py [--mercadorias 1000000] [--database-url mysql+pymysql://...] [--repeticoes 5]
+# O ganho do FULLTEXT só aparece no MySQL; no SQLite o script serve pra conferir o funcionamento.
+import argparse
+import json
+import time
+
+import dados
+
+parser = argparse.ArgumentParser(description='Benchmark da busca de mercadorias')
+parser.add_argument('--database-url', help='Base vazia pro benchmark (padrão: SQLite temporário)')
+parser.add_argument('--mercadorias', type=int, default=1000000)
+parser.add_argument('--entradas', type=int, default=200000)
+parser.add_argument('--repeticoes', type=int, default=5)
+args = parser.parse_args()
+
+dados.configurar_base(args.database_url)
+from app import app  # noqa: E402
+from mstarsupply.banco import db  # noqa: E402
+from mstarsupply.modelos import Mercadoria  # noqa: E402
+
+dados.comando('criar-tabelas')
+
+def cronometrar(executar):
+    tempos = []
+    for _ in range(args.repeticoes):
+        inicio = time.perf_counter()
+        resultado = executar()
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return {"mediana_ms": round(tempos[len(tempos) // 2] * 1000, 2), "min_ms": round(tempos[0] * 1000, 2)}, resultado
+
+with app.app_context():
+    inicio = time.perf_counter()
+    dados.popular(mercadorias=args.mercadorias, entradas=args.entradas, saidas=0)
+    relatorio = {"dialeto": db.engine.dialect.name, "mercadorias": args.mercadorias, "carga_s": round(time.perf_counter() - inicio, 1)}
+    cliente = app.test_client()
+
+    for termo in ('seringa', 'seringa luva', 'REG-00004'):
+        def antigo():
+            return Mercadoria.query.filter(db.or_(
+                Mercadoria.nome.ilike(f'%{termo}%'),
+                Mercadoria.numero_registro.ilike(f'%{termo}%'),
+                Mercadoria.fabricante.ilike(f'%{termo}%'),
+                Mercadoria.tipo.ilike(f'%{termo}%')
+            )).all()
+
+        tempo_antigo, resultado_antigo = cronometrar(antigo)
+        tempo_novo, resposta = cronometrar(lambda: cliente.get('/api/busca', query_string={'q': termo, 'por_pagina': 50}))
+        relatorio[f"mercadorias '{termo}'"] = {
+            "ilike_todas_linhas": dict(tempo_antigo, resultados=len(resultado_antigo)),
+            "busca_indexada_pagina": dict(tempo_novo, resultados=len(resposta.get_json())),
+        }
+
+    tempo, resposta = cronometrar(lambda: cliente.get('/api/busca', query_string={
+        'tipo': 'entradas', 'q': 'seringa', 'de': '2023-01-01', 'ate': '2023-01-31'
+    }))
+    relatorio["entradas 'seringa' em jan/2023"] = dict(tempo, resultados=len(resposta.get_json()))
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
@@ -0,0 +1,63 @@
+# Benchmark do cache de respostas: simula as abas do frontend consultando as rotas de leitura sem nada mudar,
+# com o cache desligado, em memória e em disco, e com revalidação por If-None-Match (304). Mede também a
+# primeira consulta depois de uma entrada gravada (que invalida as tags).
+#
+# Uso: python benchmarks/cache_respostas.py [--mercadorias 5000] [--entradas 200000] [--repeticoes 50]
+import argparse
+import json
+import tempfile
+import time
+
+import dados
+
+parser = argparse.ArgumentParser(description='Benchmark do cache de respostas')
+parser.add_argument('--database-url', help='Base vazia pro benchmark (padrão: SQLite temporário)')
+parser.add_argument('--mercadorias', type=int, default=5000)
+parser.add_argument('--entradas', type=int, default=200000)
+parser.add_argument('--saidas', type=int, default=100000)
+parser.add_argument('--repeticoes', type=int, default=50)
+args = parser.parse_args()
+
+dados.configurar_base(args.database_url)
+from app import app  # noqa: E402
+from mstarsupply.cache import iniciar_cache  # noqa: E402
+
+dados.comando('criar-tabelas')
+
+ROTAS = ['/api/dashboard', '/api/disponibilidade', '/api/mercadorias?limit=100', '/api/movimentacoes/6/2023',
+         '/api/relatorio/6/2023']
+
+def cronometrar(executar):
+    tempos = []
+    for _ in range(args.repeticoes):
+        inicio = time.perf_counter()
+        resposta = executar()
+        resposta.get_data()
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return {"mediana_ms": round(tempos[len(tempos) // 2] * 1000, 3), "status": resposta.status_code}
+
+with app.app_context():
+    inicio = time.perf_counter()
+    dados.popular(mercadorias=args.mercadorias, entradas=args.entradas, saidas=args.saidas)
+    relatorio = {"carga_s": round(time.perf_counter() - inicio, 1), "rotas": {}}
+
+cliente = app.test_client()
+app.config['CACHE_RESPOSTAS_DIR'] = tempfile.mkdtemp()
+for backend in ('desligado', 'memoria', 'disco'):
+    app.config['CACHE_RESPOSTAS'] = backend
+    iniciar_cache(app)
+    for rota in ROTAS:
+        medicoes = relatorio["rotas"].setdefault(rota, {})
+        etag = cliente.get(rota).headers.get('ETag')
+        medicoes[backend] = cronometrar(lambda: cliente.get(rota))
+        if etag:
+            medicoes[f"{backend}_304"] = cronometrar(lambda: cliente.get(rota, headers={'If-None-Match': etag}))
+
+    # Primeira leitura depois de uma gravação no mês: paga a consulta de novo
+    cliente.post('/api/entradas', json={"mercadoria_id": 1, "quantidade": 1, "data_hora": "2023-06-15 10:00:00", "local": "Benchmark"})
+    inicio = time.perf_counter()
+    cliente.get('/api/movimentacoes/6/2023').get_data()
+    relatorio[f"{backend}_apos_gravacao_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+
+print(json.dumps(relatorio, indent=2, ensure_ascii=False))
@@ -0,0 +1,85 @@
+# Benchmark do razão de custos: popula --entradas/--saidas movimentos com custo variando por entrada, mede a
+# reconstrução (flask recalcular-custos) e compara a valorização do estoque no fim de alguns meses lida dos resumos
+# (/api/valorizacao) com o replay de todos os movimentos até o fim do mês, que era o jeito de chegar nela antes.
+#
+# Uso: python benchmarks/custos.py [--entradas 2000000] [--saidas 1000000] [--mercadorias 5000] [--custeio media|fifo]
+import argparse
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+import dados
+
+parser = argparse.ArgumentParser(description='Benchmark da valorização pelo razão de custos x replay')
+parser.add_argument('--database-url', help='Base vazia pro benchmark (padrão: SQLite temporário)')
+parser.add_argument('--entradas', type=int, default=2000000)
+parser.add_argument('--saidas', type=int, default=1000000)
+parser.add_argument('--mercadorias', type=int, default=5000)
+parser.add_argument('--custeio', default='media', choices=('media', 'fifo'))
+parser.add_argument('--meses', default='6/2022,12/2023,12/2024', help='Meses (mes/ano) valorizados')
+parser.add_argument('--repeticoes', type=int, default=3)
+args = parser.parse_args()
+
+dados.configurar_base(args.database_url)
+os.environ['CACHE_RESPOSTAS'] = 'desligado'
+os.environ['CUSTEIO'] = args.custeio
+from app import app  # noqa: E402
+from mstarsupply.banco import db  # noqa: E402
+from mstarsupply.modelos import Entrada, Saida  # noqa: E402
+from mstarsupply.custos import entrar, baixar  # noqa: E402
+from mstarsupply.estoque import intervalo_do_mes  # noqa: E402
+
+dados.comando('criar-tabelas')
+
+# Valor do estoque no fim do mês refazendo o razão com todos os movimentos até lá
+def valor_por_replay(mes, ano):
+    fim = intervalo_do_mes(mes, ano)[1]
+    entradas = db.select(Entrada.mercadoria_id, Entrada.data_hora, db.literal(0).label('tipo'), Entrada.id,
+                         Entrada.quantidade, Entrada.custo_unitario).where(Entrada.data_hora < fim)
+    saidas = db.select(Saida.mercadoria_id, Saida.data_hora, db.literal(1), Saida.id,
+                       Saida.quantidade, db.literal(0.0)).where(Saida.data_hora < fim)
+    movimentos = db.union_all(entradas, saidas).subquery()
+    consulta = db.select(movimentos).order_by(movimentos.c.mercadoria_id, movimentos.c.data_hora, movimentos.c.tipo, movimentos.c.id)
+    estoques, camadas = {}, {}
+    for mercadoria_id, _, tipo, _, quantidade, custo_unitario in db.session.execute(consulta.execution_options(yield_per=10000)):
+        estoque = estoques.setdefault(mercadoria_id, [0, 0.0])
+        fila = camadas.setdefault(mercadoria_id, deque()) if args.custeio == 'fifo' else None
+        if tipo == 0:
+            entrar(estoque, quantidade, custo_unitario, fila)
+        else:
+            baixar(estoque, quantidade, fila)
+    return sum(valor for _, valor in estoques.values())
+
+def cronometrar(funcao):
+    tempos = []
+    for _ in range(args.repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+with app.app_context():
+    inicio = time.perf_counter()
+    dados.popular(mercadorias=args.mercadorias, entradas=args.entradas, saidas=args.saidas,
+                  inicio=datetime(2022, 1, 1), dias=3 * 365)
+    carga = time.perf_counter() - inicio
+    reconstrucao, _ = cronometrar(lambda: dados.comando('recalcular-custos'))
+
+    cliente = app.test_client()
+    relatorio = {"dialeto": db.engine.dialect.name, "custeio": args.custeio, "movimentos": args.entradas + args.saidas,
+                 "carga_s": round(carga, 2), "recalcular_custos_s": round(reconstrucao, 2), "meses": {}}
+    for periodo in args.meses.split(','):
+        mes, ano = (int(parte) for parte in periodo.split('/'))
+        leitura, resposta = cronometrar(lambda: cliente.get(f'/api/valorizacao/{mes}/{ano}').get_json())
+        replay, valor = cronometrar(lambda: valor_por_replay(mes, ano))
+        relatorio["meses"][periodo] = {
+            "valorizacao_ms": round(leitura * 1000, 2),
+            "replay_ms": round(replay * 1000, 2),
+            "ganho": round(replay / max(leitura, 0.000001), 1),
+            "valor_total": resposta["valor_total"],
+            "mesmo_valor": abs(resposta["valor_total"] - valor) < 0.01 * max(1, len(resposta["mercadorias"])),
+        }
+
+print(json.dumps(relatorio, indent=2, ensure_ascii=False))
@@ -0,0 +1,96 @@
+# Gerador de dados sintéticos pros benchmarks: popula Mercadorias, Entradas e Saidas
+# com volume configurável usando INSERTs de várias linhas (sem passar pela API).
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Aponta o app pra base dos benchmarks (SQLite temporário se nenhuma URL for passada).
+# Precisa ser chamado antes de importar o app.
+def configurar_base(database_url=None):
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ['DATABASE_URL'] = database_url
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    return database_url
+
+# Popula a base com mercadorias e movimentos espalhados entre `inicio` e `inicio + dias`, mais os saldos,
+# os resumos mensais, o razão de custos e os fechamentos. As saídas nunca passam das entradas, então os saldos
+# ficam coerentes com o histórico.
+def popular(mercadorias=1000, entradas=100000, saidas=50000, inicio=datetime(2022, 1, 1), dias=3 * 365,
+            semente=42, lote=10000):
+    from mstarsupply.banco import db
+    from mstarsupply.modelos import Mercadoria, Entrada, Saida, SaldoMercadoria
+    from mstarsupply.estoque import totais_do_historico
+
+    sorteio = random.Random(semente)
+    locais = ['Depósito Central', 'Filial Norte', 'Filial Sul', 'Doca 1', 'Doca 2']
+    tipos = ['Medicamento', 'Insumo', 'Equipamento', 'Alimento']
+    fabricantes = [f'Fabricante {i}' for i in range(50)]
+
+    # Nomes com palavras variadas pra busca ter o que ranquear
+    palavras = ['Dipirona', 'Seringa', 'Luva', 'Soro', 'Gaze', 'Máscara', 'Cateter', 'Álcool', 'Termômetro', 'Bisturi']
+    for primeiro in range(1, mercadorias + 1, lote):
+        db.session.execute(db.insert(Mercadoria), [{
+            "id": i,
+            "nome": f"{sorteio.choice(palavras)} {sorteio.choice(palavras)} {i:07d}",
+            "numero_registro": f"REG-{i:07d}",
+            "fabricante": sorteio.choice(fabricantes),
+            "tipo": sorteio.choice(tipos),
+            "descricao": "",
+            "custo_unitario": round(sorteio.uniform(1, 500), 2),
+        } for i in range(primeiro, min(primeiro + lote, mercadorias + 1))])
+        db.session.commit()
+
+    segundos = dias * 24 * 3600
+    custos = dict(db.session.execute(db.select(Mercadoria.id, Mercadoria.custo_unitario)).all())
+
+    # Entradas com o custo variando em volta do custo da mercadoria; o custo das saídas sai do replay no fim
+    def movimentos(quantidade, quantidade_maxima, com_custo):
+        for _ in range(quantidade):
+            movimento = {
+                "mercadoria_id": sorteio.randint(1, mercadorias),
+                "quantidade": sorteio.randint(1, quantidade_maxima),
+                "data_hora": inicio + timedelta(seconds=sorteio.randrange(segundos)),
+                "local": sorteio.choice(locais),
+            }
+            if com_custo:
+                movimento["custo_unitario"] = round(custos[movimento["mercadoria_id"]] * sorteio.uniform(0.8, 1.2), 2)
+            yield movimento
+
+    # Saídas menores que as entradas deixam estoque sobrando na média
+    for modelo, total, maximo in ((Entrada, entradas, 100), (Saida, saidas, 20)):
+        pendentes = []
+        for movimento in movimentos(total, maximo, modelo is Entrada):
+            pendentes.append(movimento)
+            if len(pendentes) >= lote:
+                db.session.execute(db.insert(modelo), pendentes)
+                db.session.commit()
+                pendentes = []
+        if pendentes:
+            db.session.execute(db.insert(modelo), pendentes)
+            db.session.commit()
+
+    saldos = [
+        {"mercadoria_id": id, "total_entradas": e, "total_saidas": s, "saldo": e - s}
+        for id, (e, s) in totais_do_historico().items()
+    ]
+    for primeiro in range(0, len(saldos), lote):
+        db.session.execute(db.insert(SaldoMercadoria), saldos[primeiro:primeiro + lote])
+        db.session.commit()
+
+    # Totais mensais que os relatórios leem e o razão de custos, pelo próprio comando flask recalcular-resumos,
+    # e os fechamentos de saldo dos meses encerrados
+    comando('recalcular-resumos')
+    comando('fechar-saldos')
+
+# Roda um comando do flask (ex.: criar-tabelas) no app dos benchmarks
+def comando(nome, *opcoes):
+    from app import app
+    resultado = app.test_cli_runner().invoke(args=[nome, *opcoes])
+    if resultado.exit_code != 0:
+        raise RuntimeError(f"{nome} falhou: {resultado.output}") from resultado.exception
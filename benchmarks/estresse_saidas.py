@@ -0,0 +1,93 @@
+# Teste de estresse das saídas concorrentes: várias threads registram saídas ao mesmo tempo
+# e no fim confere que nenhuma mercadoria ficou com saldo negativo nem vendeu mais do que entrou.
+#
+# Uso: python benchmarks/estresse_saidas.py [--database-url URL] [--threads 16] [--saidas 4000]
+# Sem --database-url usa um SQLite temporário. A base precisa estar vazia.
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+import dados
+
+parser = argparse.ArgumentParser(description='Teste de estresse das saídas concorrentes')
+parser.add_argument('--database-url', help='Base vazia pra rodar o teste (padrão: SQLite temporário)')
+parser.add_argument('--mercadorias', type=int, default=20)
+parser.add_argument('--estoque', type=int, default=100, help='Estoque inicial de cada mercadoria')
+parser.add_argument('--threads', type=int, default=16)
+parser.add_argument('--saidas', type=int, default=4000, help='Total de saídas tentadas')
+args = parser.parse_args()
+
+dados.configurar_base(args.database_url)
+
+from app import app  # noqa: E402
+from mstarsupply.modelos import Mercadoria, Saida, SaldoMercadoria  # noqa: E402
+from mstarsupply.estoque import totais_do_historico  # noqa: E402
+
+dados.comando('criar-tabelas')
+
+with app.app_context():
+    if Mercadoria.query.count():
+        sys.exit('A base precisa estar vazia pra rodar o teste de estresse')
+
+cliente = app.test_client()
+for i in range(args.mercadorias):
+    cliente.post('/api/mercadorias', json={
+        "nome": f"Estresse {i}", "numero_registro": f"EST-{i}", "fabricante": "Teste", "tipo": "Teste"
+    })
+    cliente.post('/api/entradas', json={
+        "mercadoria_id": i + 1, "quantidade": args.estoque, "data_hora": "2024-01-01 08:00:00", "local": "Depósito"
+    })
+
+resultados = {201: 0, 400: 0, 'outros': 0}
+trava = threading.Lock()
+
+def trabalhador(n):
+    cliente = app.test_client()
+    sorteio = random.Random(n)
+    for _ in range(n):
+        resposta = cliente.post('/api/saidas', json={
+            "mercadoria_id": sorteio.randint(1, args.mercadorias),
+            "quantidade": sorteio.randint(1, 5),
+            "data_hora": "2024-01-02 08:00:00",
+            "local": "Terminal"
+        })
+        with trava:
+            chave = resposta.status_code if resposta.status_code in resultados else 'outros'
+            resultados[chave] += 1
+
+por_thread = args.saidas // args.threads
+threads = [threading.Thread(target=trabalhador, args=(por_thread,)) for _ in range(args.threads)]
+inicio = time.perf_counter()
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+duracao = time.perf_counter() - inicio
+
+with app.app_context():
+    negativos = SaldoMercadoria.query.filter(SaldoMercadoria.saldo < 0).count()
+    historico = totais_do_historico()
+    vendido_a_mais = [mercadoria_id for mercadoria_id, (entradas, saidas) in historico.items() if saidas > entradas]
+    divergentes = [
+        s.mercadoria_id for s in SaldoMercadoria.query.all()
+        if historico.get(s.mercadoria_id, (0, 0)) != (s.total_entradas, s.total_saidas)
+    ]
+    registradas = Saida.query.count()
+
+relatorio = {
+    "threads": args.threads,
+    "tentativas": por_thread * args.threads,
+    "registradas": registradas,
+    "recusadas_sem_estoque": resultados[400],
+    "erros": resultados['outros'],
+    "duracao_s": round(duracao, 3),
+    "saidas_por_segundo": round(por_thread * args.threads / duracao, 1),
+    "saldos_negativos": negativos,
+    "mercadorias_vendidas_a_mais": vendido_a_mais,
+    "saldos_divergentes_do_historico": divergentes,
+}
+print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+sys.exit(1 if negativos or vendido_a_mais or divergentes or resultados['outros'] else 0)
@@ -0,0 +1,63 @@
+# Benchmark da subida do worker: tempo pra importar o app num processo novo (o que cada worker do
+# gunicorn paga ao subir) e quais módulos pesados ficaram carregados depois do import.
+#
+# Uso: python benchmarks/inicializacao.py [--repeticoes 10] [--ref <commit>]
+# Com --ref, mede também o app.py de outro commit (ex.: o anterior à fábrica create_app) pra comparar.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+from io import BytesIO
+
+import dados
+
+parser = argparse.ArgumentParser(description='Benchmark da inicialização do app')
+parser.add_argument('--repeticoes', type=int, default=10)
+parser.add_argument('--ref', help='Commit pra comparar (extraído com git archive)')
+args = parser.parse_args()
+
+PESADOS = ['matplotlib', 'reportlab', 'numpy']
+
+# Roda num processo novo: importa o app e devolve o tempo, os módulos pesados carregados e o RSS
+MEDICAO = '''
+import json, resource, sys, time
+inicio = time.perf_counter()
+import app
+tempo = time.perf_counter() - inicio
+print(json.dumps({
+    "import_s": tempo,
+    "pesados": [m for m in %r if m in sys.modules],
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+''' % (PESADOS,)
+
+def medir(pasta):
+    base = tempfile.mkdtemp()
+    ambiente = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(base, 'inicializacao.db'))
+    execucoes = []
+    for _ in range(args.repeticoes):
+        saida = subprocess.run([sys.executable, '-c', MEDICAO], cwd=pasta, env=ambiente,
+                               capture_output=True, text=True, check=True).stdout
+        execucoes.append(json.loads(saida.strip().splitlines()[-1]))
+    tempos = sorted(e['import_s'] for e in execucoes)
+    return {
+        "import_mediana_ms": round(tempos[len(tempos) // 2] * 1000, 1),
+        "import_min_ms": round(tempos[0] * 1000, 1),
+        "rss_mb": round(max(e['rss_mb'] for e in execucoes), 1),
+        "modulos_pesados": execucoes[-1]['pesados'],
+    }
+
+def extrair_commit(ref):
+    pasta = tempfile.mkdtemp()
+    arquivo = subprocess.run(['git', 'archive', '--format=tar', ref], cwd=dados.RAIZ, capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=BytesIO(arquivo)) as tar:
+        tar.extractall(pasta, filter='data')
+    return pasta
+
+relatorio = {"atual": medir(dados.RAIZ)}
+if args.ref:
+    relatorio[args.ref] = medir(extrair_commit(args.ref))
+print(json.dumps(relatorio, indent=2, ensure_ascii=False))
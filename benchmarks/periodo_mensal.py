@@ -0,0 +1,66 @@
+# Benchmark do filtro mensal: compara o filtro antigo com extract(month/year), que varre a tabela,
+# com a faixa [início, fim) de filtro_do_mes, que usa os índices compostos de data_hora.
+#
+# Uso: python benchmarks/periodo_mensal.py [--linhas 2000000] [--database-url URL] [--repeticoes 5]
+import argparse
+import json
+import time
+
+import dados
+
+parser = argparse.ArgumentParser(description='Benchmark do filtro de período mensal')
+parser.add_argument('--database-url', help='Base vazia pro benchmark (padrão: SQLite temporário)')
+parser.add_argument('--linhas', type=int, default=2000000, help='Quantidade de entradas geradas')
+parser.add_argument('--mercadorias', type=int, default=5000)
+parser.add_argument('--repeticoes', type=int, default=5)
+args = parser.parse_args()
+
+dados.configurar_base(args.database_url)
+from app import app  # noqa: E402
+from mstarsupply.banco import db  # noqa: E402
+from mstarsupply.modelos import Entrada  # noqa: E402
+from mstarsupply.estoque import filtro_do_mes  # noqa: E402
+
+dados.comando('criar-tabelas')
+
+def cronometrar(consulta):
+    tempos = []
+    for _ in range(args.repeticoes):
+        inicio = time.perf_counter()
+        resultado = db.session.execute(consulta).all()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+def plano(consulta):
+    if db.engine.dialect.name == 'sqlite':
+        sql = consulta.compile(db.engine, compile_kwargs={"literal_binds": True})
+        return [linha[-1] for linha in db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}"))]
+    if db.engine.dialect.name == 'mysql':
+        sql = consulta.compile(db.engine, compile_kwargs={"literal_binds": True})
+        return [dict(linha._mapping) for linha in db.session.execute(db.text(f"EXPLAIN {sql}"))]
+    return []
+
+with app.app_context():
+    inicio = time.perf_counter()
+    dados.popular(mercadorias=args.mercadorias, entradas=args.linhas, saidas=0)
+    carga = time.perf_counter() - inicio
+
+    mes, ano = 6, 2023
+    agregado = (Entrada.mercadoria_id, db.func.sum(Entrada.quantidade))
+    consultas = {
+        "extract": db.select(*agregado).where(
+            db.extract('month', Entrada.data_hora) == mes,
+            db.extract('year', Entrada.data_hora) == ano
+        ).group_by(Entrada.mercadoria_id),
+        "faixa": db.select(*agregado).where(
+            filtro_do_mes(Entrada.data_hora, mes, ano)
+        ).group_by(Entrada.mercadoria_id),
+    }
+    relatorio = {"dialeto": db.engine.dialect.name, "linhas": args.linhas, "carga_s": round(carga, 2)}
+    resultados = {}
+    for nome, consulta in consultas.items():
+        tempo, resultados[nome] = cronometrar(consulta)
+        relatorio[nome] = {"tempo_ms": round(tempo * 1000, 2), "plano": plano(consulta)}
+    relatorio["mesmo_resultado"] = sorted(resultados["extract"]) == sorted(resultados["faixa"])
+    relatorio["ganho"] = round(relatorio["extract"]["tempo_ms"] / max(relatorio["faixa"]["tempo_ms"], 0.001), 1)
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False, default=str))
@@ -0,0 +1,65 @@
+# Benchmark do PDF mensal: popula um mês com --linhas movimentos (entradas e saídas) e mede páginas por
+# segundo do /api/relatorio gerado em sequência e com as seções em paralelo (RELATORIO_PARTES), além do
+# relatório gerencial. Mede também o PDF com o histórico resumido (totais por dia, limite por mercadoria, sem
+# histórico) e o anexo com o detalhe completo. O cache de respostas fica desligado.
+#
+# Uso: python benchmarks/relatorio_pdf.py [--linhas 5000] [--mercadorias 500] [--partes 1,2,4] [--limite 10] [--repeticoes 5]
+import argparse
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import dados
+
+parser = argparse.ArgumentParser(description='Benchmark do relatório mensal em PDF')
+parser.add_argument('--database-url', help='Base vazia pro benchmark (padrão: SQLite temporário)')
+parser.add_argument('--linhas', type=int, default=5000, help='Entradas + saídas do mês medido')
+parser.add_argument('--mercadorias', type=int, default=500)
+parser.add_argument('--partes', default='1,2,4', help='Valores de RELATORIO_PARTES medidos')
+parser.add_argument('--limite', type=int, default=10, help='Linhas por mercadoria e tipo no modo com limite')
+parser.add_argument('--repeticoes', type=int, default=5)
+args = parser.parse_args()
+
+dados.configurar_base(args.database_url)
+os.environ['CACHE_RESPOSTAS'] = 'desligado'
+from app import app  # noqa: E402
+
+dados.comando('criar-tabelas')
+with app.app_context():
+    entradas = args.linhas * 2 // 3
+    dados.popular(mercadorias=args.mercadorias, entradas=entradas, saidas=args.linhas - entradas,
+                  inicio=datetime(2023, 6, 1), dias=30)
+
+partes_medidas = [int(partes) for partes in args.partes.split(',')]
+app.config['RELATORIOS_WORKERS'] = max(partes_medidas)
+cliente = app.test_client()
+
+def medir(rota):
+    cliente.get(rota)  # Aquece (imports do reportlab e os processos do pool)
+    tempos = []
+    for _ in range(args.repeticoes):
+        inicio = time.perf_counter()
+        corpo = cliente.get(rota).data
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    mediana = tempos[len(tempos) // 2]
+    paginas = len(re.findall(rb'/Type\s*/Page[^s]', corpo))
+    return {"mediana_s": round(mediana, 3), "paginas": paginas, "paginas_s": round(paginas / mediana, 1),
+            "tamanho_kb": round(len(corpo) / 1024, 1)}
+
+relatorio = {"linhas": args.linhas, "mercadorias": args.mercadorias, "relatorio": {}}
+for partes in partes_medidas:
+    app.config['RELATORIO_PARTES'] = partes
+    relatorio["relatorio"][f"partes_{partes}"] = medir('/api/relatorio/6/2023')
+app.config['RELATORIO_PARTES'] = 1
+relatorio["historico"] = {
+    "diario": medir('/api/relatorio/6/2023?historico=diario'),
+    f"limite_{args.limite}": medir(f'/api/relatorio/6/2023?limite={args.limite}'),
+    "nenhum": medir('/api/relatorio/6/2023?historico=nenhum'),
+    "anexo": medir('/api/relatorio/6/2023/anexo'),
+}
+relatorio["relatorio_gerencial"] = medir('/api/relatorio_gerencial/6/2023')
+
+print(json.dumps(relatorio, indent=2, ensure_ascii=False))
@@ -0,0 +1,67 @@
+# Benchmark do saldo numa data: popula --anos de movimentos, grava os fechamentos mensais (flask fechar-saldos) e
+# compara /api/disponibilidade?em=... em datas espalhadas pelo histórico com a soma de todos os movimentos até a
+# data. Com os fechamentos o tempo fica no tamanho de um mês de movimentos, seja a data do primeiro ou do último ano.
+#
+# Uso: python benchmarks/saldo_em.py [--entradas 2000000] [--saidas 1000000] [--mercadorias 2000] [--anos 5]
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import dados
+
+parser = argparse.ArgumentParser(description='Benchmark do saldo num instante: fechamentos x soma do histórico')
+parser.add_argument('--database-url', help='Base vazia pro benchmark (padrão: SQLite temporário)')
+parser.add_argument('--entradas', type=int, default=2000000)
+parser.add_argument('--saidas', type=int, default=1000000)
+parser.add_argument('--mercadorias', type=int, default=2000)
+parser.add_argument('--anos', type=int, default=5)
+parser.add_argument('--repeticoes', type=int, default=3)
+args = parser.parse_args()
+
+dados.configurar_base(args.database_url)
+os.environ['CACHE_RESPOSTAS'] = 'desligado'
+from app import app  # noqa: E402
+from mstarsupply.banco import db  # noqa: E402
+from mstarsupply.modelos import Mercadoria  # noqa: E402
+from mstarsupply.estoque import movimentos_liquidos  # noqa: E402
+
+dados.comando('criar-tabelas')
+
+# Saldo de todas as mercadorias somando o histórico inteiro até a data (o jeito sem fechamentos)
+def saldos_pela_soma(ate):
+    uniao = db.union_all(*movimentos_liquidos(db.session, None, ate)).subquery()
+    consulta = db.select(Mercadoria.id, db.func.coalesce(db.func.sum(uniao.c.saldo), 0)).outerjoin(
+        uniao, uniao.c.mercadoria_id == Mercadoria.id
+    ).group_by(Mercadoria.id)
+    return {id: int(saldo) for id, saldo in db.session.execute(consulta)}
+
+def cronometrar(funcao):
+    tempos = []
+    for _ in range(args.repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+with app.app_context():
+    inicio = datetime(2020, 1, 1)
+    dados.popular(mercadorias=args.mercadorias, entradas=args.entradas, saidas=args.saidas, inicio=inicio, dias=args.anos * 365)
+    fechamento, _ = cronometrar(lambda: dados.comando('fechar-saldos', '--refazer'))  # O popular já fechou uma vez
+
+    cliente = app.test_client()
+    relatorio = {"dialeto": db.engine.dialect.name, "movimentos": args.entradas + args.saidas, "anos": args.anos,
+                 "fechar_saldos_s": round(fechamento, 2), "datas": {}}
+    for ano in range(inicio.year, inicio.year + args.anos):
+        em = datetime(ano, 7, 20, 12, 0, 0)
+        leitura, resposta = cronometrar(lambda: cliente.get('/api/disponibilidade', query_string={'em': str(em)}).get_json())
+        soma, saldos = cronometrar(lambda: saldos_pela_soma(em.replace(second=1)))
+        relatorio["datas"][str(em)] = {
+            "fechamentos_ms": round(leitura * 1000, 2),
+            "soma_ms": round(soma * 1000, 2),
+            "ganho": round(soma / max(leitura, 0.000001), 1),
+            "mesmo_saldo": {m["id"]: m["disponibilidade"] for m in resposta} == saldos,
+        }
+
+print(json.dumps(relatorio, indent=2, ensure_ascii=False))
@@ -0,0 +1,92 @@
+# Benchmark do /api/stream contra um servidor já rodando: abre muitas conexões SSE ociosas (sockets num
+# selector, sem uma thread por conexão), registra entradas e mede quanto tempo cada evento leva pra chegar
+# em todas as conexões.
+#
+# Uso (o servidor precisa ser o modo ASGI pra aguentar milhares de conexões, veja o README):
+#   EVENTOS_IPC_DIR=/tmp/mstarsupply-eventos uvicorn asgi:app --workers 4 --port 8000
+#   python benchmarks/stream.py --url http://localhost:8000 --conexoes 2000 --mercadoria-id 1
+import argparse
+import json
+import selectors
+import socket
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+parser = argparse.ArgumentParser(description='Benchmark das conexões SSE de /api/stream')
+parser.add_argument('--url', default='http://localhost:8000')
+parser.add_argument('--conexoes', type=int, default=1000)
+parser.add_argument('--eventos', type=int, default=10, help='Entradas registradas (um evento movimento cada)')
+parser.add_argument('--mercadoria-id', type=int, default=1, help='Mercadoria existente usada nas entradas')
+parser.add_argument('--espera', type=float, default=10, help='Segundos esperando cada evento chegar em todas')
+args = parser.parse_args()
+
+endereco = urlsplit(args.url)
+host, porta = endereco.hostname, endereco.port or 80
+
+seletor = selectors.DefaultSelector()
+inicio = time.perf_counter()
+for _ in range(args.conexoes):
+    conexao = socket.create_connection((host, porta))
+    conexao.sendall(f"GET /api/stream?tipos=movimento HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    conexao.setblocking(False)
+    seletor.register(conexao, selectors.EVENT_READ, {"pendente": b""})
+
+# Lê o que chegou e devolve quantos eventos "movimento" cada conexão recebeu
+def ler(prazo):
+    recebidos = {}
+    while time.perf_counter() < prazo:
+        for chave, _ in seletor.select(timeout=0.05):
+            try:
+                dados = chave.fileobj.recv(65536)
+            except BlockingIOError:
+                continue
+            if not dados:
+                seletor.unregister(chave.fileobj)
+                continue
+            quantidade = dados.count(b"event: movimento")
+            if quantidade:
+                recebidos[chave.fileobj] = recebidos.get(chave.fileobj, 0) + quantidade
+        if len(recebidos) >= len(seletor.get_map()):
+            break
+    return recebidos
+
+# Espera todas as conexões receberem o retry inicial (sinal de que já estão inscritas no canal)
+def esperar_inscricao(prazo):
+    inscritas = set()
+    while time.perf_counter() < prazo and len(inscritas) < len(seletor.get_map()):
+        for chave, _ in seletor.select(timeout=0.05):
+            try:
+                dados = chave.fileobj.recv(65536)
+            except BlockingIOError:
+                continue
+            if not dados:
+                seletor.unregister(chave.fileobj)
+            elif b"retry:" in dados:
+                inscritas.add(chave.fileobj)
+    return len(inscritas)
+
+inscritas = esperar_inscricao(time.perf_counter() + 30)
+abertura = time.perf_counter() - inicio
+
+latencias, entregas = [], []
+for numero in range(args.eventos):
+    corpo = json.dumps({"mercadoria_id": args.mercadoria_id, "quantidade": 1,
+                        "data_hora": "2024-01-01 00:00:00", "local": "Benchmark stream"}).encode()
+    pedido = urllib.request.Request(f"{args.url}/api/entradas", data=corpo, headers={"Content-Type": "application/json"})
+    inicio = time.perf_counter()
+    urllib.request.urlopen(pedido).read()
+    recebidos = ler(inicio + args.espera)
+    latencias.append(time.perf_counter() - inicio)
+    entregas.append(len(recebidos))
+
+latencias.sort()
+print(json.dumps({
+    "conexoes_abertas": len(seletor.get_map()),
+    "conexoes_inscritas": inscritas,
+    "abertura_s": round(abertura, 2),
+    "eventos": args.eventos,
+    "entregues_por_evento_min": min(entregas),
+    "todas_mediana_ms": round(latencias[len(latencias) // 2] * 1000, 1),
+    "todas_max_ms": round(latencias[-1] * 1000, 1),
+}, indent=2, ensure_ascii=False))
@@ -0,0 +1,247 @@
+# Suíte de benchmark de todas as rotas do app: popula uma base sintética, chama cada rota pelo test client
+# do Flask e grava um JSON com p50/p95/p99, vazão, consultas SQL por requisição e pico de memória (RSS).
+# O JSON leva o commit, então dá pra comparar execuções e barrar deploy quando uma rota piorar.
+#
+# Uso:
+#   python benchmarks/suite.py --perfil pequeno --saida base.json
+#   python benchmarks/suite.py --perfil pequeno --comparar base.json --portoes relatorio,disponibilidade --tolerancia 0.2
+#
+# Perfis: pequeno (1k mercadorias / 100k entradas), medio (10k / 1M), grande (100k / 10M). Os tamanhos
+# também podem ser passados direto. Com --database-url e --reusar, uma base já populada é aproveitada
+# (popular 10M de linhas demora); as rotas de escrita rodam por último pra não mexer nas medições de leitura.
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import dados
+
+PERFIS = {
+    "pequeno": {"mercadorias": 1000, "entradas": 100000, "saidas": 50000},
+    "medio": {"mercadorias": 10000, "entradas": 1000000, "saidas": 500000},
+    "grande": {"mercadorias": 100000, "entradas": 10000000, "saidas": 5000000},
+}
+
+parser = argparse.ArgumentParser(description='Benchmark de todas as rotas do app')
+parser.add_argument('--database-url', help='Base pro benchmark (padrão: SQLite temporário)')
+parser.add_argument('--perfil', choices=sorted(PERFIS), default='pequeno')
+parser.add_argument('--mercadorias', type=int)
+parser.add_argument('--entradas', type=int)
+parser.add_argument('--saidas', type=int)
+parser.add_argument('--reusar', action='store_true', help='Não popula se a base já tiver mercadorias')
+parser.add_argument('--requisicoes', type=int, default=30, help='Requisições medidas por rota')
+parser.add_argument('--aquecimento', type=int, default=3, help='Requisições descartadas antes de medir')
+parser.add_argument('--rotas', help='Só essas rotas (nomes separados por vírgula)')
+parser.add_argument('--cache-respostas', action='store_true',
+                    help='Mede com o cache de respostas ligado (por padrão fica desligado pra medir as consultas)')
+parser.add_argument('--saida', help='Arquivo pra gravar o JSON (padrão: só imprime)')
+parser.add_argument('--comparar', help='JSON de uma execução anterior pra comparar')
+parser.add_argument('--portoes', default='relatorio,relatorio_gerencial,disponibilidade,disponibilidade_mercadoria',
+                    help='Rotas que reprovam a execução se o p95 piorar além da tolerância')
+parser.add_argument('--tolerancia', type=float, default=0.2, help='Piora aceita no p95 (0.2 = 20%%)')
+args = parser.parse_args()
+
+tamanhos = dict(PERFIS[args.perfil])
+for campo in tamanhos:
+    if getattr(args, campo) is not None:
+        tamanhos[campo] = getattr(args, campo)
+
+dados.configurar_base(args.database_url)
+from sqlalchemy import event  # noqa: E402
+from app import app  # noqa: E402
+from mstarsupply.banco import db  # noqa: E402
+from mstarsupply.modelos import Mercadoria, RelatorioJob  # noqa: E402
+
+dados.comando('criar-tabelas')
+
+# Cache de gráficos e relatórios numa pasta própria, apagada no fim
+pasta_temporaria = tempfile.mkdtemp()
+app.config['GRAFICO_CACHE_DIR'] = os.path.join(pasta_temporaria, 'graficos')
+app.config['RELATORIOS_DIR'] = os.path.join(pasta_temporaria, 'relatorios')
+if not args.cache_respostas:
+    app.extensions['cache_respostas'] = None  # Senão as rotas de leitura medidas seriam só acertos do cache
+
+def commit_atual():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=dados.RAIZ, capture_output=True, text=True).stdout.strip()
+        sujo = bool(subprocess.run(['git', 'status', '--porcelain', '--', 'app.py', 'mstarsupply'], cwd=dados.RAIZ,
+                                   capture_output=True, text=True).stdout.strip())
+        return commit + ('-sujo' if sujo else '') if commit else None
+    except OSError:
+        return None
+
+def rss_atual_mb():
+    try:
+        with open('/proc/self/statm') as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError):
+        return None
+
+def rss_pico_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024  # bytes no macOS, KB no Linux
+
+def percentil(tempos, p):
+    ordenados = sorted(tempos)
+    posicao = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[posicao]
+
+# Contador de consultas SQL de toda a engine (o test client roda tudo nesta thread)
+consultas = [0]
+
+with app.app_context():
+    if args.reusar and Mercadoria.query.first() is not None:
+        carga = None
+        tamanhos = {"mercadorias": Mercadoria.query.count(), "reusada": True}
+    else:
+        inicio = time.perf_counter()
+        dados.popular(**tamanhos)
+        carga = round(time.perf_counter() - inicio, 2)
+    mercadorias = db.session.execute(db.select(db.func.max(Mercadoria.id))).scalar() or 1
+    dialeto = db.engine.dialect.name
+
+    @event.listens_for(db.engine, 'after_cursor_execute')
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        consultas[0] += 1
+
+mes, ano = 6, 2023
+sequencia = [0]
+
+def proximo():
+    sequencia[0] += 1
+    return sequencia[0]
+
+def limpar_graficos():
+    shutil.rmtree(app.config['GRAFICO_CACHE_DIR'], ignore_errors=True)
+
+def mercadoria_sorteada():
+    return proximo() * 7919 % mercadorias + 1
+
+def ultimo_job():
+    with app.app_context():
+        return db.session.execute(db.select(db.func.max(RelatorioJob.id))).scalar() or 1
+
+def lote(quantidade):
+    return [{
+        "mercadoria_id": mercadoria_sorteada(), "quantidade": 1,
+        "data_hora": "2023-06-15 10:00:00", "local": "Benchmark"
+    } for _ in range(quantidade)]
+
+# Rotas medidas: nome -> (método, url, corpo, preparação antes de cada requisição)
+# O gráfico é medido frio (sem cache) e quente; as escritas ficam no fim.
+ROTAS = {
+    "mercadorias": ('GET', lambda: '/api/mercadorias?limit=100', None, None),
+    "mercadorias_ndjson": ('GET', lambda: '/api/mercadorias?formato=ndjson', None, None),
+    "disponibilidade_mercadoria": ('GET', lambda: f'/api/mercadorias/{mercadoria_sorteada()}/disponibilidade', None, None),
+    "disponibilidade": ('GET', lambda: '/api/disponibilidade', None, None),
+    "disponibilidade_alerta": ('GET', lambda: '/api/disponibilidade?alerta=Estoque%20Baixo&por_pagina=100', None, None),
+    "disponibilidade_em": ('GET', lambda: f'/api/disponibilidade?em={ano}-{mes:02d}-15%2012:00:00', None, None),
+    "movimentacoes": ('GET', lambda: f'/api/movimentacoes/{mes}/{ano}', None, None),
+    "movimentacoes_keyset": ('GET', lambda: f'/api/movimentacoes/{mes}/{ano}?tipo=entradas&limit=500', None, None),
+    "dashboard": ('GET', lambda: '/api/dashboard', None, None),
+    "grafico_frio": ('GET', lambda: f'/api/grafico/{mes}/{ano}', None, limpar_graficos),
+    "grafico_quente": ('GET', lambda: f'/api/grafico/{mes}/{ano}', None, None),
+    "relatorio": ('GET', lambda: f'/api/relatorio/{mes}/{ano}', None, None),
+    "relatorio_gerencial": ('GET', lambda: f'/api/relatorio_gerencial/{mes}/{ano}', None, None),
+    "relatorio_csv": ('GET', lambda: f'/api/relatorio_csv/{mes}/{ano}', None, None),
+    "movimentacoes_csv": ('GET', lambda: f'/api/relatorio_csv/{mes}/{ano}?modo=movimentacoes', None, None),
+    "analytics": ('GET', lambda: '/api/analytics?de=2023-01-01&ate=2023-12-31&agrupar=tipo,mes', None, None),
+    "busca_mercadorias": ('GET', lambda: '/api/busca?q=dipirona', None, None),
+    "busca_movimentacoes": ('GET', lambda: '/api/busca?q=seringa&tipo=entradas', None, None),
+    "relatorios_job": ('POST', lambda: '/api/relatorios', lambda: {"tipo": "relatorio_csv", "mes": mes, "ano": ano}, None),
+    "relatorios_status": ('GET', lambda: f'/api/relatorios/{ultimo_job()}', None, None),
+    "metrics": ('GET', lambda: '/api/metrics', None, None),
+    "cadastrar_mercadoria": ('POST', lambda: '/api/mercadorias', lambda: {
+        "nome": f"Benchmark {proximo()}", "numero_registro": f"BENCH-{os.getpid()}-{sequencia[0]}",
+        "fabricante": "Benchmark", "tipo": "Benchmark"
+    }, None),
+    "entrada": ('POST', lambda: '/api/entradas', lambda: lote(1)[0], None),
+    "saida": ('POST', lambda: '/api/saidas', lambda: lote(1)[0], None),
+    "entradas_bulk": ('POST', lambda: '/api/entradas/bulk', lambda: lote(1000), None),
+    "saidas_bulk": ('POST', lambda: '/api/saidas/bulk', lambda: lote(1000), None),
+}
+
+def medir(nome, metodo, url, corpo, preparar):
+    cliente = app.test_client()
+    tempos, status, consultas_rota = [], {}, 0
+    for i in range(args.aquecimento + args.requisicoes):
+        if preparar:
+            preparar()
+        endereco, dados_corpo = url(), corpo() if corpo else None  # Montados fora da medição
+        consultas_antes = consultas[0]
+        inicio = time.perf_counter()
+        resposta = cliente.open(endereco, method=metodo, json=dados_corpo)
+        resposta.get_data()  # Consome o corpo: as rotas em streaming só trabalham aqui
+        resposta.close()
+        duracao = time.perf_counter() - inicio
+        if i >= args.aquecimento:
+            tempos.append(duracao)
+            consultas_rota += consultas[0] - consultas_antes
+            status[resposta.status_code] = status.get(resposta.status_code, 0) + 1
+    return {
+        "requisicoes": len(tempos),
+        "p50_ms": round(percentil(tempos, 50) * 1000, 2),
+        "p95_ms": round(percentil(tempos, 95) * 1000, 2),
+        "p99_ms": round(percentil(tempos, 99) * 1000, 2),
+        "media_ms": round(sum(tempos) / len(tempos) * 1000, 2),
+        "req_por_s": round(len(tempos) / sum(tempos), 1),
+        "consultas_por_req": round(consultas_rota / len(tempos), 1),
+        "rss_atual_mb": round(rss_atual_mb(), 1) if rss_atual_mb() is not None else None,
+        "rss_pico_mb": round(rss_pico_mb(), 1),
+        "status": {str(codigo): quantidade for codigo, quantidade in sorted(status.items())},
+    }
+
+escolhidas = args.rotas.split(',') if args.rotas else list(ROTAS)
+desconhecidas = [nome for nome in escolhidas if nome not in ROTAS]
+if desconhecidas:
+    sys.exit(f"Rotas desconhecidas: {', '.join(desconhecidas)} (disponíveis: {', '.join(ROTAS)})")
+
+resultado = {
+    "commit": commit_atual(),
+    "data": datetime.now().isoformat(timespec='seconds'),
+    "python": platform.python_version(),
+    "dialeto": dialeto,
+    "tamanhos": tamanhos,
+    "carga_s": carga,
+    "requisicoes_por_rota": args.requisicoes,
+    "cache_respostas": args.cache_respostas,
+    "rotas": {},
+}
+try:
+    for nome in escolhidas:
+        resultado["rotas"][nome] = medir(nome, *ROTAS[nome])
+finally:
+    shutil.rmtree(pasta_temporaria, ignore_errors=True)
+
+# Comparação com uma execução anterior: variação do p95 por rota e reprovação nos portões
+codigo_saida = 0
+if args.comparar:
+    with open(args.comparar) as arquivo:
+        anterior = json.load(arquivo)
+    portoes = set(args.portoes.split(',')) if args.portoes else set()
+    comparacao = {"commit_anterior": anterior.get("commit"), "rotas": {}, "reprovadas": []}
+    for nome, atual in resultado["rotas"].items():
+        antes = anterior.get("rotas", {}).get(nome)
+        if not antes or not antes.get("p95_ms"):
+            continue
+        variacao = atual["p95_ms"] / antes["p95_ms"] - 1
+        comparacao["rotas"][nome] = {"p95_antes_ms": antes["p95_ms"], "p95_ms": atual["p95_ms"], "variacao": round(variacao, 3)}
+        if nome in portoes and variacao > args.tolerancia:
+            comparacao["reprovadas"].append(nome)
+    resultado["comparacao"] = comparacao
+    if comparacao["reprovadas"]:
+        codigo_saida = 1
+
+texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+if args.saida:
+    with open(args.saida, 'w') as arquivo:
+        arquivo.write(texto + '\n')
+print(texto)
+sys.exit(codigo_saida)
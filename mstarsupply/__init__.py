@@ -0,0 +1,23 @@
+from flask import Flask
+from flask_cors import CORS
+
+from .configuracao import configurar
+from .banco import db
+from .cache import iniciar_cache
+from .eventos import iniciar_eventos
+
+# Monta o app. Os imports pesados (matplotlib, reportlab, numpy) ficam dentro das funções que usam,
+# então o worker sobe sem carregar nada disso. As tabelas não são criadas aqui: use `flask criar-tabelas`.
+def create_app(configuracao=None):
+    app = Flask(__name__)
+    configurar(app, configuracao)
+    CORS(app, resources={r"/api/*": {"origins": app.config['CORS_ORIGENS']}})  # Ajusta o CORS pra permitir o frontend
+    db.init_app(app)
+    iniciar_cache(app)
+    iniciar_eventos(app)
+
+    from . import metricas, estoque, custos, cadastros, consultas, graficos, relatorios, eventos
+    for modulo in (metricas, estoque, custos, cadastros, consultas, graficos, relatorios, eventos):
+        app.register_blueprint(modulo.bp)
+
+    return app
@@ -0,0 +1,53 @@
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql.dml import UpdateBase
+import functools
+import time
+
+from .metricas import incrementar
+
+# Sessão que manda as leituras pra réplica quando a requisição (ou job) pediu com g.usar_replica.
+# Escritas (flush, INSERT/UPDATE/DELETE) continuam sempre no primário.
+class SessaoComReplica(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) \
+                and has_app_context() and g.get('usar_replica'):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={"class_": SessaoComReplica})
+
+# Estado da réplica: depois de uma falha as leituras ficam no primário por REPLICA_ESPERA segundos
+estado_replica = {"fora_ate": 0.0}
+
+def replica_disponivel():
+    return 'replica' in current_app.config.get('SQLALCHEMY_BINDS', {}) and time.monotonic() >= estado_replica["fora_ate"]
+
+def marcar_replica_fora(erro):
+    estado_replica["fora_ate"] = time.monotonic() + current_app.config['REPLICA_ESPERA']
+    incrementar('mstarsupply_replica_falhas_total', ())
+    current_app.logger.warning("Réplica indisponível, lendo do primário por %ss: %s", current_app.config['REPLICA_ESPERA'], erro)
+
+# Executa uma leitura na réplica (se houver); se a réplica falhar, repete no primário.
+# Só serve pra funções que não gravam nada, já que podem rodar duas vezes.
+def ler_na_replica(funcao, *args, **kwargs):
+    g.usar_replica = replica_disponivel()
+    try:
+        return funcao(*args, **kwargs)
+    except OperationalError as erro:
+        if not g.usar_replica:
+            raise
+        db.session.rollback()
+        marcar_replica_fora(erro)
+        g.usar_replica = False
+        return funcao(*args, **kwargs)
+
+# Decorator pras rotas só de leitura que podem ir pra réplica (relatórios, gráfico, busca, dashboard).
+# Respostas em streaming continuam lendo da réplica enquanto geram o corpo; uma falha no meio do stream não é repetida.
+def leitura_na_replica(rota):
+    @functools.wraps(rota)
+    def na_replica(*args, **kwargs):
+        return ler_na_replica(rota, *args, **kwargs)
+    return na_replica
@@ -0,0 +1,187 @@
+from flask import current_app, request
+from collections import OrderedDict
+from urllib.parse import urlencode
+import functools
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+
+from .metricas import incrementar
+
+# Cache das respostas das rotas de leitura que o frontend fica consultando (dashboard, listagens, mensais).
+# A chave é a rota com os parâmetros. Cada entrada guarda a versão das tags de que depende e só é servida se
+# nenhuma mudou (as gravações trocam a versão com invalidar_respostas) e se ainda está dentro do TTL.
+# A resposta sai com ETag forte (hash do corpo): o navegador revalida com If-None-Match e recebe 304 sem corpo.
+
+# Grava o arquivo de cache num temporário e troca de uma vez (usado também pelos gráficos e relatórios)
+def gravar_arquivo_cache(caminho, conteudo):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temporario, 'wb') as arquivo:
+            if isinstance(conteudo, bytes):
+                arquivo.write(conteudo)
+            elif hasattr(conteudo, 'read'):  # Arquivo já pronto (BytesIO ou temporário)
+                shutil.copyfileobj(conteudo, arquivo)
+            else:  # Pedaços vindos de um gerador
+                for parte in conteudo:
+                    arquivo.write(parte)
+        os.replace(temporario, caminho)  # Troca atômica, ninguém lê arquivo pela metade
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+# LRU do processo. Com vários workers cada um tem o seu e só vê as invalidações feitas nele mesmo
+# (nos outros a resposta velha vale até o TTL); pra isso existe o CacheDisco.
+class CacheMemoria:
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.entradas = OrderedDict()
+        self.versoes_tags = {}
+        self.trava = threading.Lock()
+
+    def ler(self, chave):
+        with self.trava:
+            entrada = self.entradas.get(chave)
+            if entrada is not None:
+                self.entradas.move_to_end(chave)
+            return entrada
+
+    def gravar(self, chave, entrada):
+        with self.trava:
+            self.entradas[chave] = entrada
+            self.entradas.move_to_end(chave)
+            while len(self.entradas) > self.maximo:
+                self.entradas.popitem(last=False)
+
+    def remover(self, chave):
+        with self.trava:
+            self.entradas.pop(chave, None)
+
+    def versoes(self, tags):
+        with self.trava:
+            return tuple(self.versoes_tags.get(tag, 0) for tag in tags)
+
+    def invalidar(self, tags):
+        with self.trava:
+            for tag in tags:
+                self.versoes_tags[tag] = self.versoes_tags.get(tag, 0) + 1
+
+# Cache numa pasta compartilhada entre os workers, com as versões das tags em arquivos .versao
+# (o mesmo esquema do cache dos gráficos). Entradas vencidas são apagadas quando alguém tenta ler.
+class CacheDisco:
+    def __init__(self, pasta):
+        self.pasta = pasta
+
+    def caminho(self, nome):
+        return os.path.join(self.pasta, nome)
+
+    def ler(self, chave):
+        try:
+            with open(self.caminho(f"{chave}.resposta"), 'rb') as arquivo:
+                return pickle.load(arquivo)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def gravar(self, chave, entrada):
+        gravar_arquivo_cache(self.caminho(f"{chave}.resposta"), pickle.dumps(entrada))
+
+    def remover(self, chave):
+        try:
+            os.remove(self.caminho(f"{chave}.resposta"))
+        except FileNotFoundError:
+            pass
+
+    def versoes(self, tags):
+        versoes = []
+        for tag in tags:
+            try:
+                with open(self.caminho(f"tag_{tag}.versao")) as arquivo:
+                    versoes.append(arquivo.read().strip())
+            except FileNotFoundError:
+                versoes.append('inicial')
+        return tuple(versoes)
+
+    def invalidar(self, tags):
+        for tag in tags:
+            gravar_arquivo_cache(self.caminho(f"tag_{tag}.versao"), uuid.uuid4().hex.encode())
+
+# Escolhe o backend pelo CACHE_RESPOSTAS (memoria, disco ou desligado); chamado pelo create_app
+def iniciar_cache(app):
+    tipo = app.config['CACHE_RESPOSTAS']
+    if tipo == 'memoria':
+        cache = CacheMemoria(app.config['CACHE_RESPOSTAS_MAX'])
+    elif tipo == 'disco':
+        cache = CacheDisco(app.config['CACHE_RESPOSTAS_DIR'])
+    elif tipo in ('desligado', '', None):
+        cache = None
+    else:
+        raise ValueError(f"CACHE_RESPOSTAS inválido: {tipo!r} (use memoria, disco ou desligado)")
+    app.extensions['cache_respostas'] = cache
+
+# Chamado pelas gravações: toda resposta guardada que depende de alguma dessas tags deixa de valer
+def invalidar_respostas(tags):
+    cache = current_app.extensions.get('cache_respostas')
+    if cache is not None:
+        cache.invalidar(list(tags))
+
+def chave_resposta(caminho, args):
+    parametros = urlencode(sorted(args.items(multi=True)))
+    return hashlib.sha1(f"{caminho}?{parametros}".encode()).hexdigest()
+
+# Entrada guardada que ainda vale pras versões atuais das tags, ou None (apaga a vencida)
+def ler_resposta(cache, chave, versoes, rota):
+    entrada = cache.ler(chave)
+    if entrada is not None and (entrada['versoes'] != versoes or entrada['expira_em'] <= time.time()):
+        cache.remover(chave)
+        entrada = None
+    resultado = 'acerto' if entrada is not None else 'falta'
+    incrementar('mstarsupply_cache_respostas_total', (('rota', rota), ('resultado', resultado)))
+    return entrada
+
+def guardar_resposta(cache, chave, versoes, status, cabecalhos, corpo):
+    if len(corpo) <= current_app.config['CACHE_RESPOSTAS_MAX_CORPO']:
+        cache.gravar(chave, {
+            "versoes": versoes,
+            "expira_em": time.time() + current_app.config['CACHE_RESPOSTAS_TTL'],
+            "status": status,
+            "cabecalhos": [(nome, valor) for nome, valor in cabecalhos if nome != 'Content-Length'],
+            "corpo": corpo,
+        })
+
+# Decorator pras rotas de leitura. As tags podem usar os parâmetros da rota, ex.: 'mes-{ano}-{mes:02d}'.
+# Só respostas 200 com o corpo pronto são guardadas (as em streaming, como o CSV, passam direto).
+def resposta_em_cache(*tags):
+    def decorador(view):
+        @functools.wraps(view)
+        def em_cache(**kwargs):
+            cache = current_app.extensions.get('cache_respostas')
+            if cache is None:
+                return view(**kwargs)
+
+            chave = chave_resposta(request.path, request.args)
+            # As versões são lidas antes dos dados: se chegar uma gravação durante a consulta, a entrada já nasce velha
+            versoes = cache.versoes([tag.format(**kwargs) for tag in tags])
+
+            entrada = ler_resposta(cache, chave, versoes, request.url_rule.rule)
+            if entrada is not None:
+                resposta = current_app.response_class(entrada['corpo'], status=entrada['status'], headers=entrada['cabecalhos'])
+            else:
+                resposta = current_app.make_response(view(**kwargs))
+                if resposta.status_code != 200 or (resposta.is_streamed and not resposta.direct_passthrough):
+                    return resposta
+                if (resposta.content_length or 0) > current_app.config['CACHE_RESPOSTAS_MAX_CORPO']:
+                    return resposta  # Arquivo grande (PDF em temporário): vai direto, sem ler pra memória
+                resposta.direct_passthrough = False  # send_file de um BytesIO: o corpo já está todo na memória
+                guardar_resposta(cache, chave, versoes, resposta.status_code, resposta.headers.items(), resposta.get_data())
+
+            resposta.set_etag(hashlib.sha1(resposta.get_data()).hexdigest())
+            resposta.cache_control.no_cache = True  # O navegador sempre revalida com If-None-Match
+            return resposta.make_conditional(request)
+        return em_cache
+    return decorador
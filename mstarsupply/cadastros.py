@@ -0,0 +1,390 @@
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from io import TextIOWrapper
+from datetime import datetime
+import csv
+import json
+
+from .banco import db
+from .modelos import Mercadoria, Entrada, Saida, SaldoMercadoria, LIMITE_ESTOQUE_BAIXO
+from .estoque import (
+    filtro_do_mes, movimentos_do_mes, atualizar_saldo, dados_do_movimento, atualizar_resumo_mensal, reservar_saldo, saldo_atual
+)
+from .consultas import prefixo_like
+from .custos import ler_custo_unitario, custos_padrao, registrar_camadas, custear_saidas
+from .graficos import invalidar_graficos
+from .relatorios import invalidar_relatorios
+from .cache import resposta_em_cache, invalidar_respostas
+from .eventos import publicar
+
+# Cadastros de mercadorias e movimentos (um a um e em lote) e as listagens
+bp = Blueprint('cadastros', __name__)
+
+def meses_dos_movimentos(datas):
+    return {(data.year, data.month) for data in datas}
+
+# Chamado depois do commit de entradas/saídas, com as datas dos movimentos gravados (os relatórios já foram
+# invalidados na transação deles, com invalidar_relatorios)
+def apos_gravar_movimentos(datas):
+    meses = meses_dos_movimentos(datas)
+    invalidar_graficos(meses)
+    invalidar_respostas(['movimentos'] + [f'mes-{ano}-{mes:02d}' for ano, mes in meses])
+
+# Eventos ao vivo de um movimento gravado (tipo entradas ou saidas), com o saldo da mercadoria depois dele
+def publicar_movimento(tipo, movimento, saldo):
+    anterior = saldo - movimento['quantidade'] if tipo == 'entradas' else saldo + movimento['quantidade']
+    alerta = {"mercadoria_id": movimento['mercadoria_id'], "saldo": saldo}
+    publicar('movimento', dict(movimento, tipo=tipo))
+    publicar('saldo', alerta)
+    if anterior >= LIMITE_ESTOQUE_BAIXO > saldo:
+        publicar('estoque_baixo', alerta)
+    elif anterior < LIMITE_ESTOQUE_BAIXO <= saldo:
+        publicar('estoque_normal', alerta)
+
+# API pra cadastrar mercadoria
+@bp.route('/api/mercadorias', methods=['POST'])
+def cadastrar_mercadoria():
+    data = request.json
+    nova_mercadoria = Mercadoria(
+        nome=data['nome'],
+        numero_registro=data['numero_registro'],
+        fabricante=data['fabricante'],
+        tipo=data['tipo'],
+        descricao=data.get('descricao', ''),
+        custo_unitario=float(data.get('custo_unitario', 0.0))  # Novo campo no cadastro
+    )
+    db.session.add(nova_mercadoria)
+    db.session.flush()
+    db.session.add(SaldoMercadoria(mercadoria_id=nova_mercadoria.id))
+    db.session.commit()
+    invalidar_respostas(['mercadorias'])
+    return jsonify({"message": "Mercadoria cadastrada"}), 201
+
+# Paginação por cursor (keyset): after_id é o último id já recebido e limit o tamanho da página.
+# Devolve (after_id, limit); limit None quando o cliente não pediu paginação.
+def ler_cursor(args):
+    after_id = args.get('after_id', 0, type=int)
+    limit = args.get('limit', type=int)
+    if limit is None and 'after_id' in args:
+        limit = 100
+    if limit is not None:
+        limit = min(max(limit, 1), 1000)
+    return after_id, limit
+
+# Executa a consulta (ordenada por id) a partir do cursor e monta a página.
+# X-Proximo-After-Id vem na resposta quando ainda há linhas depois dessa página.
+def pagina_por_cursor(sessao, consulta, coluna_id, formatar, after_id, limit):
+    consulta = consulta.where(coluna_id > after_id).order_by(coluna_id)
+    if limit is None:
+        return [formatar(linha) for linha in sessao.execute(consulta)], None
+    linhas = sessao.execute(consulta.limit(limit + 1)).all()
+    proximo = linhas[limit - 1].id if len(linhas) > limit else None
+    return [formatar(linha) for linha in linhas[:limit]], proximo
+
+# Resposta NDJSON (um objeto JSON por linha) lida de um cursor no servidor, pra quem quer tudo sem paginar
+def resposta_ndjson(*consultas):
+    def gerar():
+        for consulta, formatar in consultas:
+            pendentes = []
+            for linha in db.session.execute(consulta.execution_options(stream_results=True, yield_per=1000)):
+                pendentes.append(json.dumps(formatar(linha), ensure_ascii=False) + '\n')
+                if len(pendentes) >= 1000:
+                    yield ''.join(pendentes)
+                    pendentes = []
+            if pendentes:
+                yield ''.join(pendentes)
+    return Response(stream_with_context(gerar()), mimetype='application/x-ndjson')
+
+def mercadoria_resumida(m):
+    return {"id": m.id, "nome": m.nome, "custo_unitario": m.custo_unitario}
+
+# API pra listar mercadorias
+# Opcionais: after_id e limit (paginação por cursor), tipo (filtro) e formato=ndjson (tudo em stream)
+@bp.route('/api/mercadorias', methods=['GET'])
+@resposta_em_cache('mercadorias')
+def listar_mercadorias():
+    consulta = db.select(Mercadoria.id, Mercadoria.nome, Mercadoria.custo_unitario)
+    if request.args.get('tipo'):
+        consulta = consulta.where(Mercadoria.tipo == request.args['tipo'])
+
+    after_id, limit = ler_cursor(request.args)
+    if request.args.get('formato') == 'ndjson':
+        return resposta_ndjson((consulta.where(Mercadoria.id > after_id).order_by(Mercadoria.id), mercadoria_resumida))
+
+    mercadorias, proximo = pagina_por_cursor(db.session, consulta, Mercadoria.id, mercadoria_resumida, after_id, limit)
+    resposta = jsonify(mercadorias)
+    if proximo is not None:
+        resposta.headers['X-Proximo-After-Id'] = str(proximo)
+    return resposta
+
+# API pra verificar disponibilidade de uma mercadoria
+@bp.route('/api/mercadorias/<int:id>/disponibilidade', methods=['GET'])
+@resposta_em_cache('movimentos')
+def verificar_disponibilidade(id):
+    disponibilidade = saldo_atual(id)
+    return jsonify({"disponibilidade": disponibilidade})
+
+# API pra cadastrar entrada (custo_unitario opcional, sem ele vale o custo da mercadoria); validada como as linhas da importação
+@bp.route('/api/entradas', methods=['POST'])
+def cadastrar_entrada():
+    try:
+        nova_entrada = Entrada(**validar_movimento(request.get_json(silent=True)))
+    except ValueError as erro:
+        return jsonify({"error": str(erro)}), 400
+    custos = custos_padrao([nova_entrada.mercadoria_id])  # Também diz se a mercadoria existe, como no lote
+    if nova_entrada.mercadoria_id not in custos:
+        return jsonify({"error": "Mercadoria não encontrada"}), 404
+    if nova_entrada.custo_unitario is None:
+        nova_entrada.custo_unitario = custos[nova_entrada.mercadoria_id]
+    db.session.add(nova_entrada)
+    atualizar_saldo(nova_entrada.mercadoria_id, entradas=nova_entrada.quantidade,
+                    valor=nova_entrada.quantidade * nova_entrada.custo_unitario)
+    registrar_camadas([dados_do_movimento(nova_entrada)])
+    atualizar_resumo_mensal([dados_do_movimento(nova_entrada)], 'entradas')
+    invalidar_relatorios(meses_dos_movimentos([nova_entrada.data_hora]))
+    # Lidos antes do commit, com a linha do saldo ainda travada por esta transação
+    saldo, evento = saldo_atual(nova_entrada.mercadoria_id), movimento_resumido(nova_entrada)
+    db.session.commit()
+    apos_gravar_movimentos([nova_entrada.data_hora])
+    publicar_movimento('entradas', evento, saldo)
+    return jsonify({"message": "Entrada registrada"}), 201
+
+# API pra cadastrar saída (validada como as linhas da importação)
+@bp.route('/api/saidas', methods=['POST'])
+def cadastrar_saida():
+    try:
+        movimento = validar_movimento(request.get_json(silent=True))
+    except ValueError as erro:
+        return jsonify({"error": str(erro)}), 400
+    movimento.pop('custo_unitario')  # O custo da saída vem do razão
+    nova_saida = Saida(**movimento)
+
+    # Verifica e reserva a disponibilidade num passo só, antes de registrar a saída
+    if not reservar_saldo(nova_saida.mercadoria_id, nova_saida.quantidade):
+        db.session.rollback()
+        return jsonify({"error": "Quantidade insuficiente em estoque"}), 400
+
+    # Custo da baixa pelo razão, com o saldo ainda travado pelo UPDATE do reservar_saldo
+    saldo, valor = db.session.execute(
+        db.select(SaldoMercadoria.saldo, SaldoMercadoria.valor).where(SaldoMercadoria.mercadoria_id == nova_saida.mercadoria_id)
+    ).one()
+    movimento = dados_do_movimento(nova_saida)
+    custear_saidas([movimento], {nova_saida.mercadoria_id: [saldo + nova_saida.quantidade, valor]})
+    nova_saida.custo_unitario = movimento['custo_unitario']
+    db.session.add(nova_saida)
+    atualizar_resumo_mensal([dados_do_movimento(nova_saida)], 'saidas')
+    invalidar_relatorios(meses_dos_movimentos([nova_saida.data_hora]))
+    saldo, evento = saldo_atual(nova_saida.mercadoria_id), movimento_resumido(nova_saida)
+    db.session.commit()
+    apos_gravar_movimentos([nova_saida.data_hora])
+    publicar_movimento('saidas', evento, saldo)
+    return jsonify({"message": "Saída registrada"}), 201
+
+# Importação em lote: lê as linhas de um array JSON ou de um CSV enviado como text/csv (lido em stream)
+def linhas_da_importacao():
+    if request.mimetype == 'text/csv':
+        return csv.DictReader(TextIOWrapper(request.stream, encoding='utf-8-sig'))
+    linhas = request.get_json(silent=True)
+    if not isinstance(linhas, list):
+        raise ValueError("Envie um array JSON ou um CSV (text/csv)")
+    return linhas
+
+# Valida uma linha da importação e devolve o movimento pronto pra inserir.
+# custo_unitario é opcional (nas saídas é sempre calculado pelo razão de custos).
+def validar_movimento(linha):
+    if not isinstance(linha, dict):
+        raise ValueError("Linha inválida")
+    try:
+        mercadoria_id = int(linha['mercadoria_id'])
+        quantidade = int(linha['quantidade'])
+        data_hora = datetime.strptime(str(linha['data_hora']), '%Y-%m-%d %H:%M:%S')
+        local = str(linha['local']).strip()
+    except KeyError as campo:
+        raise ValueError(f"Campo obrigatório ausente: {campo}")
+    except (TypeError, ValueError):
+        raise ValueError("Valor inválido em mercadoria_id, quantidade ou data_hora")
+    if quantidade <= 0:
+        raise ValueError("Quantidade inválida")
+    if not local:
+        raise ValueError("Local obrigatório")
+    return {"mercadoria_id": mercadoria_id, "quantidade": quantidade, "data_hora": data_hora, "local": local,
+            "custo_unitario": ler_custo_unitario(linha.get('custo_unitario'))}
+
+# Grava um lote de entradas (INSERT de várias linhas) e soma nos saldos e no valor do estoque, sem commit
+def gravar_lote_entradas(lote, erros):
+    custos = custos_padrao(m['mercadoria_id'] for _, m in lote)  # Também diz quais mercadorias existem
+    validas = []
+    for numero, movimento in lote:
+        if movimento['mercadoria_id'] in custos:
+            if movimento['custo_unitario'] is None:
+                movimento['custo_unitario'] = custos[movimento['mercadoria_id']]
+            validas.append(movimento)
+        else:
+            erros.append({"linha": numero, "erro": "Mercadoria não encontrada"})
+    if validas:
+        db.session.execute(db.insert(Entrada), validas)
+    por_mercadoria = {}
+    for movimento in validas:
+        totais = por_mercadoria.setdefault(movimento['mercadoria_id'], [0, 0.0])
+        totais[0] += movimento['quantidade']
+        totais[1] += movimento['quantidade'] * movimento['custo_unitario']
+    for mercadoria_id, (quantidade, valor) in por_mercadoria.items():
+        atualizar_saldo(mercadoria_id, entradas=quantidade, valor=valor)
+    registrar_camadas(validas)
+    atualizar_resumo_mensal(validas, 'entradas')
+    return len(validas)
+
+# Grava um lote de saídas aplicando a regra de disponibilidade na ordem das linhas, sem commit.
+# Os saldos das mercadorias do lote ficam travados (FOR UPDATE) até o commit; o custo de cada saída sai do razão.
+def gravar_lote_saidas(lote, erros):
+    estoques = {
+        mercadoria_id: [saldo, valor] for mercadoria_id, saldo, valor in db.session.execute(
+            db.select(SaldoMercadoria.mercadoria_id, SaldoMercadoria.saldo, SaldoMercadoria.valor)
+            .where(SaldoMercadoria.mercadoria_id.in_({m['mercadoria_id'] for _, m in lote}))
+            .with_for_update()
+        )
+    }
+    saldos = {mercadoria_id: saldo for mercadoria_id, (saldo, _) in estoques.items()}
+    validas = []
+    por_mercadoria = {}
+    for numero, movimento in lote:
+        mercadoria_id = movimento['mercadoria_id']
+        if mercadoria_id not in saldos:
+            erros.append({"linha": numero, "erro": "Mercadoria não encontrada"})
+        elif saldos[mercadoria_id] < movimento['quantidade']:
+            erros.append({"linha": numero, "erro": "Quantidade insuficiente em estoque"})
+        else:
+            saldos[mercadoria_id] -= movimento['quantidade']
+            por_mercadoria[mercadoria_id] = por_mercadoria.get(mercadoria_id, 0) + movimento['quantidade']
+            validas.append(movimento)
+    custear_saidas(validas, estoques)
+    if validas:
+        db.session.execute(db.insert(Saida), validas)
+    for mercadoria_id, quantidade in por_mercadoria.items():
+        if not reservar_saldo(mercadoria_id, quantidade):
+            raise RuntimeError("Saldo alterado durante a importação")
+    atualizar_resumo_mensal(validas, 'saidas')
+    return len(validas)
+
+# Processa a importação em lotes, cada lote na sua própria transação
+def importar_movimentos(gravar_lote):
+    try:
+        linhas = linhas_da_importacao()
+    except ValueError as erro:
+        return jsonify({"error": str(erro)}), 400
+
+    tamanho_lote = current_app.config['TAMANHO_LOTE_IMPORTACAO']
+    erros = []
+    recebidas = 0
+    registradas = 0
+
+    def gravar(lote):
+        for tentativa in range(3):  # Repete o lote se o saldo mudou por uma saída concorrente
+            erros_lote = []
+            try:
+                gravadas = gravar_lote(lote, erros_lote)
+                invalidar_relatorios(meses_dos_movimentos(movimento['data_hora'] for _, movimento in lote))
+                db.session.commit()
+            except RuntimeError:
+                db.session.rollback()
+                continue
+            apos_gravar_movimentos(movimento['data_hora'] for _, movimento in lote)
+            publicar('importacao', {"movimentos": gravadas})  # Um aviso por lote em vez de um evento por linha
+            erros.extend(erros_lote)
+            return gravadas
+        erros.extend({"linha": numero, "erro": "Conflito de concorrência, reenvie a linha"} for numero, _ in lote)
+        return 0
+
+    lote = []
+    try:
+        for numero, linha in enumerate(linhas, start=1):
+            recebidas += 1
+            try:
+                lote.append((numero, validar_movimento(linha)))
+            except ValueError as erro:
+                erros.append({"linha": numero, "erro": str(erro)})
+            if len(lote) >= tamanho_lote:
+                registradas += gravar(lote)
+                lote = []
+    except (UnicodeDecodeError, csv.Error) as erro:
+        erros.append({"linha": recebidas, "erro": f"CSV inválido: {erro}"})
+    if lote:  # Inclusive as linhas já lidas antes de um erro no CSV
+        registradas += gravar(lote)
+
+    erros.sort(key=lambda e: e['linha'])
+    return jsonify({
+        "recebidas": recebidas,
+        "registradas": registradas,
+        "total_erros": len(erros),
+        "erros": erros[:1000]  # Limita o relatório pra não estourar a resposta
+    }), 200
+
+# API pra cadastrar entradas em lote (array JSON ou CSV com mercadoria_id,quantidade,data_hora,local)
+@bp.route('/api/entradas/bulk', methods=['POST'])
+def cadastrar_entradas_lote():
+    return importar_movimentos(gravar_lote_entradas)
+
+# API pra cadastrar saídas em lote, respeitando a disponibilidade na ordem das linhas
+@bp.route('/api/saidas/bulk', methods=['POST'])
+def cadastrar_saidas_lote():
+    return importar_movimentos(gravar_lote_saidas)
+
+def movimento_resumido(m):
+    return {"id": m.id, "mercadoria_id": m.mercadoria_id, "quantidade": m.quantidade, "data_hora": m.data_hora.isoformat(), "local": m.local,
+            "custo_unitario": m.custo_unitario}
+
+# Consultas de /api/movimentacoes por tabela: {"entradas"|"saidas": (modelo, consulta)}.
+# Separadas da execução pra servir às rotas do Flask e ao modo ASGI (asgi.py).
+def consultas_movimentacoes(sessao, mes, ano, args):
+    tipo = args.get('tipo')
+    if tipo not in (None, 'entradas', 'saidas'):
+        raise ValueError("Tipo inválido!")
+    if ler_cursor(args)[1] is not None and tipo is None:
+        raise ValueError("Informe tipo=entradas ou tipo=saidas pra paginar")
+
+    consultas = {}
+    for nome, modelo in (('entradas', Entrada), ('saidas', Saida)):
+        if tipo not in (None, nome):
+            continue
+        modelo = movimentos_do_mes(sessao, modelo, mes, ano)
+        consulta = db.select(
+            modelo.id, modelo.mercadoria_id, modelo.quantidade, modelo.data_hora, modelo.local, modelo.custo_unitario
+        ).where(filtro_do_mes(modelo.data_hora, mes, ano))
+        if args.get('mercadoria_id', type=int) is not None:
+            consulta = consulta.where(modelo.mercadoria_id == args.get('mercadoria_id', type=int))
+        if args.get('local'):
+            consulta = consulta.where(modelo.local.like(prefixo_like(args['local']), escape='\\'))
+        consultas[nome] = (modelo, consulta)
+    return consultas
+
+# Devolve ({"entradas": [...], "saidas": [...]}, próximo after_id ou None)
+def dados_movimentacoes(sessao, mes, ano, args):
+    consultas = consultas_movimentacoes(sessao, mes, ano, args)
+    after_id, limit = ler_cursor(args)
+    resultado = {"entradas": [], "saidas": []}
+    proximo = None
+    for nome, (modelo, consulta) in consultas.items():
+        resultado[nome], proximo = pagina_por_cursor(sessao, consulta, modelo.id, movimento_resumido, after_id, limit)
+    return resultado, proximo
+
+# API pra listar entradas e saídas por mês e ano (pra usar no gráfico e relatório)
+# Opcionais: mercadoria_id, local (prefixo), tipo=entradas|saidas, formato=ndjson e,
+# com tipo escolhido, after_id e limit (paginação por cursor sobre os ids daquela tabela)
+@bp.route('/api/movimentacoes/<int:mes>/<int:ano>', methods=['GET'])
+@resposta_em_cache('mes-{ano}-{mes:02d}')
+def listar_movimentacoes(mes, ano):
+    try:
+        if request.args.get('formato') == 'ndjson':
+            consultas = consultas_movimentacoes(db.session, mes, ano, request.args)
+            after_id = ler_cursor(request.args)[0]
+            return resposta_ndjson(*[
+                (consulta.where(modelo.id > after_id).order_by(modelo.id), lambda m, nome=nome: dict(movimento_resumido(m), tipo=nome))
+                for nome, (modelo, consulta) in consultas.items()
+            ])
+        resultado, proximo = dados_movimentacoes(db.session, mes, ano, request.args)
+    except ValueError as erro:
+        return jsonify({"error": str(erro)}), 400
+
+    resposta = jsonify(resultado)
+    if proximo is not None:
+        resposta.headers['X-Proximo-After-Id'] = str(proximo)
+    return resposta
@@ -0,0 +1,371 @@
+from flask import Blueprint, current_app, jsonify, request
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.mysql import match
+import re
+
+from .banco import db, leitura_na_replica
+from .cache import resposta_em_cache
+from .modelos import Mercadoria, Entrada, Saida, SaldoMercadoria, LIMITE_ESTOQUE_BAIXO
+from .estoque import saldos_em, corte_do_arquivo, movimentos_do_periodo
+
+# Consultas só de leitura: dashboard, disponibilidade, análises e busca.
+# As funções dados_* recebem a sessão e os parâmetros em vez de usar db.session e request: as mesmas consultas
+# rodam nas rotas do Flask e no modo ASGI (asgi.py), lá dentro de uma sessão assíncrona com run_sync.
+# Parâmetro inválido vira ValueError com a mensagem do erro 400.
+bp = Blueprint('consultas', __name__)
+
+def dados_dashboard(sessao):
+    total_mercadorias = sessao.scalar(db.select(db.func.count()).select_from(Mercadoria))
+    entradas_recentes = sessao.scalars(db.select(Entrada).order_by(Entrada.data_hora.desc()).limit(5)).all()
+    saidas_recentes = sessao.scalars(db.select(Saida).order_by(Saida.data_hora.desc()).limit(5)).all()
+    entradas_data = [{"mercadoria_id": e.mercadoria_id, "quantidade": e.quantidade, "data_hora": e.data_hora.isoformat()} for e in entradas_recentes]
+    saidas_data = [{"mercadoria_id": s.mercadoria_id, "quantidade": s.quantidade, "data_hora": s.data_hora.isoformat()} for s in saidas_recentes]
+    return {
+        "total_mercadorias": total_mercadorias,
+        "entradas_recentes": entradas_data,
+        "saidas_recentes": saidas_data
+    }
+
+# API pra dashboard (resumo)
+@bp.route('/api/dashboard', methods=['GET'])
+@resposta_em_cache('mercadorias', 'movimentos')
+@leitura_na_replica
+def dashboard():
+    return jsonify(dados_dashboard(db.session))
+
+# Devolve (mercadorias com saldo e alerta, total pra X-Total-Count ou None sem paginação)
+def dados_disponibilidade(sessao, args):
+    if args.get('em'):
+        # Saldo num instante passado: último fechamento mais os movimentos desde ele
+        saldos = saldos_em(sessao, ler_instante(args['em']))
+        saldo = db.func.coalesce(saldos.c.saldo, 0)
+        consulta = db.select(Mercadoria.id, Mercadoria.nome, saldo).outerjoin(saldos, saldos.c.mercadoria_id == Mercadoria.id)
+    else:
+        # Uma consulta só: mercadorias com o saldo materializado (sem linha de saldo = 0)
+        saldo = db.func.coalesce(SaldoMercadoria.saldo, 0)
+        consulta = db.select(Mercadoria.id, Mercadoria.nome, saldo).outerjoin(
+            SaldoMercadoria, SaldoMercadoria.mercadoria_id == Mercadoria.id
+        )
+
+    alerta = args.get('alerta')
+    if alerta == "Estoque Baixo":
+        consulta = consulta.where(saldo < LIMITE_ESTOQUE_BAIXO)
+    elif alerta == "Normal":
+        consulta = consulta.where(saldo >= LIMITE_ESTOQUE_BAIXO)
+    elif alerta is not None:
+        raise ValueError("Alerta inválido!")
+
+    ordenar = args.get('ordenar')
+    if ordenar == 'saldo':
+        consulta = consulta.order_by(saldo.asc(), Mercadoria.id)
+    elif ordenar == '-saldo':
+        consulta = consulta.order_by(saldo.desc(), Mercadoria.id)
+    elif ordenar is None:
+        consulta = consulta.order_by(Mercadoria.id)
+    else:
+        raise ValueError("Ordenação inválida!")
+
+    # Paginação só quando pedida, sem ela continua devolvendo tudo
+    total = None
+    if 'pagina' in args:
+        pagina = max(args.get('pagina', 1, type=int), 1)
+        por_pagina = min(max(args.get('por_pagina', 50, type=int), 1), 1000)
+        total = sessao.scalar(db.select(db.func.count()).select_from(consulta.order_by(None).subquery()))
+        consulta = consulta.limit(por_pagina).offset((pagina - 1) * por_pagina)
+
+    resultado = []
+    for id, nome, disponibilidade in sessao.execute(consulta):
+        alerta = "Estoque Baixo" if disponibilidade < LIMITE_ESTOQUE_BAIXO else "Normal"
+        resultado.append({
+            "id": id,
+            "nome": nome,
+            "disponibilidade": disponibilidade,
+            "alerta": alerta
+        })
+    return resultado, total
+
+# API pra verificar disponibilidade detalhada de todas as mercadorias
+# Parâmetros opcionais: alerta=Estoque Baixo|Normal, ordenar=saldo|-saldo, pagina e por_pagina e
+# em (saldo naquele instante, AAAA-MM-DD HH:MM:SS ou só a data pro fim do dia)
+@bp.route('/api/disponibilidade', methods=['GET'])
+@resposta_em_cache('mercadorias', 'movimentos')
+def verificar_disponibilidade_todas():
+    try:
+        resultado, total = dados_disponibilidade(db.session, request.args)
+    except ValueError as erro:
+        return jsonify({"error": str(erro)}), 400
+    resposta = jsonify(resultado)
+    if total is not None:
+        resposta.headers['X-Total-Count'] = str(total)
+    return resposta
+
+# Padrão LIKE 'texto%' com os curingas do próprio texto escapados (busca por prefixo usa índice, '%texto%' não)
+def prefixo_like(texto):
+    return texto.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+# Filtro e relevância da busca de mercadorias.
+# No MySQL usa o índice FULLTEXT (cada palavra vira um prefixo de palavra obrigatório). Em outros bancos, ou com
+# palavras menores que o token mínimo do FULLTEXT (3 letras), cada palavra do termo tem que aparecer em alguma das
+# colunas em qualquer posição (LIKE '%palavra%', sem índice), então continua achando tudo que o '%termo%' antigo
+# achava ("cirúrgica" acha "Luva cirúrgica"); nome igual ou começando pelo termo vem primeiro.
+def busca_mercadoria(termo, dialeto):
+    palavras = re.findall(r'\w+', termo)
+    if not palavras:
+        return db.true(), db.literal(0)
+    colunas = (Mercadoria.nome, Mercadoria.numero_registro, Mercadoria.fabricante, Mercadoria.tipo)
+    if dialeto == 'mysql' and all(len(p) >= 3 for p in palavras):
+        relevancia = match(*colunas, against=' '.join(f'+{p}*' for p in palavras)).in_boolean_mode()
+        return relevancia > 0, relevancia
+    relevancia = db.case(
+        (Mercadoria.nome == termo.strip(), 3),
+        (Mercadoria.nome.like(prefixo_like(termo), escape='\\'), 2),
+        else_=1
+    )
+    return db.and_(*(
+        db.or_(*(coluna.like('%' + prefixo_like(palavra), escape='\\') for coluna in colunas)) for palavra in palavras
+    )), relevancia
+
+# Lê uma data do parâmetro (AAAA-MM-DD ou DD/MM/AAAA); devolve None se não for data
+def ler_data(valor):
+    for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(valor.strip(), formato)
+        except ValueError:
+            pass
+    return None
+
+# Lê o ?em= de /api/disponibilidade e devolve o limite exclusivo dos movimentos que entram no saldo:
+# com hora, os movimentos até aquele segundo; só com a data, o dia inteiro
+def ler_instante(valor):
+    for formato in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(valor.strip(), formato) + timedelta(seconds=1)
+        except (ValueError, OverflowError):
+            pass
+    data = ler_data(valor)
+    if data is None or data.year > 9998:
+        raise ValueError("Data inválida em em (use AAAA-MM-DD ou AAAA-MM-DD HH:MM:SS)")
+    return data + timedelta(days=1)
+
+# Dimensões e períodos aceitos em /api/analytics?agrupar=...
+DIMENSOES_ANALYTICS = ('mercadoria', 'tipo', 'fabricante', 'local')
+PERIODOS_ANALYTICS = ('dia', 'semana', 'mes')
+
+# Busca os movimentos do intervalo já somados no banco até o menor grão pedido (mercadoria, local se
+# precisar, dia se precisar) e devolve as colunas como listas, prontas pra virar arrays
+def colunas_analytics(modelo, inicio, fim, por_local, por_dia):
+    colunas = [modelo.mercadoria_id]
+    if por_local:
+        colunas.append(modelo.local)
+    if por_dia:
+        colunas.append(db.func.date(modelo.data_hora))
+    consulta = db.select(*colunas, db.func.sum(modelo.quantidade)).where(
+        modelo.data_hora >= inicio, modelo.data_hora < fim
+    ).group_by(*colunas)
+    linhas = db.session.connection().execute(consulta).all()  # Core direto, sem o custo de montar linhas do ORM
+    return [list(coluna) for coluna in zip(*linhas)] if linhas else [[] for _ in range(len(colunas) + 1)]
+
+# Converte valores em códigos inteiros (o array de códigos e os valores distintos, em ordem)
+def codificar(valores):
+    import numpy as np
+    distintos, codigos = np.unique(np.asarray(valores, dtype=object), return_inverse=True)
+    return codigos.reshape(-1).astype(np.int64), distintos
+
+# API de análise por período: totais e séries de entradas/saídas entre de e ate (AAAA-MM-DD, ate inclusivo)
+# agrupar: lista separada por vírgula de mercadoria, tipo, fabricante, local e no máximo um período (dia, semana, mes)
+# movimento: entradas, saidas ou ambos (padrão)
+@bp.route('/api/analytics', methods=['GET'])
+@leitura_na_replica
+def analytics():
+    import numpy as np  # Só carregado no primeiro uso, a maioria dos workers nunca precisa
+
+    de = ler_data(request.args.get('de', ''))
+    ate = ler_data(request.args.get('ate', ''))
+    if de is None or ate is None or ate < de or ate.year > 9998:  # O fim do intervalo é ate + 1 dia
+        return jsonify({"error": "Informe de e ate (AAAA-MM-DD)"}), 400
+    agrupar = [campo for campo in request.args.get('agrupar', '').split(',') if campo]
+    periodos = [campo for campo in agrupar if campo in PERIODOS_ANALYTICS]
+    if any(campo not in DIMENSOES_ANALYTICS + PERIODOS_ANALYTICS for campo in agrupar) or len(periodos) > 1 \
+            or len(set(agrupar)) != len(agrupar):
+        return jsonify({"error": "Agrupamento inválido!"}), 400
+    movimento = request.args.get('movimento', 'ambos')
+    if movimento not in ('entradas', 'saidas', 'ambos'):
+        return jsonify({"error": "Movimento inválido!"}), 400
+    periodo = periodos[0] if periodos else None
+
+    # Colunas das duas tabelas concatenadas, com um indicador de saída
+    ids, quantidades, locais, dias, eh_saida = [], [], [], [], []
+    for campo, modelo in (('entradas', Entrada), ('saidas', Saida)):
+        if movimento not in ('ambos', campo):
+            continue
+        modelo = movimentos_do_periodo(db.session, modelo, de, ate + timedelta(days=1))
+        colunas = colunas_analytics(modelo, de, ate + timedelta(days=1), 'local' in agrupar, periodo is not None)
+        ids += colunas[0]
+        quantidades += colunas[-1]
+        if 'local' in agrupar:
+            locais += colunas[1]
+        if periodo is not None:
+            dias += colunas[-2]
+        eh_saida += [campo == 'saidas'] * len(colunas[0])
+
+    ids = np.asarray(ids, dtype=np.int64)
+    quantidades = np.asarray(quantidades, dtype=np.int64)
+    eh_saida = np.asarray(eh_saida, dtype=bool)
+    entradas_qtd = np.where(eh_saida, 0, quantidades)
+    saidas_qtd = np.where(eh_saida, quantidades, 0)
+    totais = {
+        "entradas": int(entradas_qtd.sum()),
+        "saidas": int(saidas_qtd.sum()),
+        "saldo": int(entradas_qtd.sum() - saidas_qtd.sum()),
+    }
+    if not agrupar:
+        return jsonify({"de": de.date().isoformat(), "ate": ate.date().isoformat(), "agrupar": [], "totais": totais, "series": []})
+
+    # Posição de cada movimento no array de mercadorias (ordenado por id), pra buscar tipo/fabricante
+    # de forma vetorizada; ids sem mercadoria ficam com posição -1
+    chaves = []
+    decodificar = []
+    if any(campo in agrupar for campo in ('mercadoria', 'tipo', 'fabricante')):
+        mercadorias = db.session.execute(
+            db.select(Mercadoria.id, Mercadoria.nome, Mercadoria.tipo, Mercadoria.fabricante).order_by(Mercadoria.id)
+        ).all()
+        ids_mercadorias = np.asarray([m.id for m in mercadorias], dtype=np.int64)
+        posicao = np.clip(np.searchsorted(ids_mercadorias, ids), 0, max(len(mercadorias) - 1, 0))
+        if len(mercadorias):
+            posicao = np.where(ids_mercadorias[posicao] == ids, posicao, -1)
+        else:
+            posicao = np.full(len(ids), -1, dtype=np.int64)
+        nomes = {m.id: m.nome for m in mercadorias}
+
+    for campo in agrupar:
+        if campo == 'mercadoria':
+            chaves.append(ids)
+            decodificar.append(lambda codigo: {"mercadoria_id": int(codigo), "nome": nomes.get(int(codigo), "Desconhecido")})
+        elif campo in ('tipo', 'fabricante'):
+            codigos_atributo, distintos = codificar([getattr(m, campo) for m in mercadorias] or [''])
+            chaves.append(np.where(posicao >= 0, codigos_atributo[posicao], -1))
+            decodificar.append(lambda codigo, campo=campo, distintos=distintos: {campo: distintos[codigo] if codigo >= 0 else "Desconhecido"})
+        elif campo == 'local':
+            codigos_local, distintos_local = codificar(locais or [''])
+            chaves.append(codigos_local[:len(ids)])
+            decodificar.append(lambda codigo: {"local": distintos_local[codigo]})
+        else:
+            datas = np.asarray(dias, dtype='datetime64[D]')
+            if campo == 'semana':  # Começo da semana (segunda-feira); 1970-01-01 foi uma quinta
+                datas = datas - ((datas.astype(np.int64) + 3) % 7)
+                chaves.append(datas.astype(np.int64))
+                decodificar.append(lambda codigo: {"semana": str(np.datetime64(int(codigo), 'D'))})
+            elif campo == 'mes':
+                chaves.append(datas.astype('datetime64[M]').astype(np.int64))
+                decodificar.append(lambda codigo: {"mes": str(np.datetime64(int(codigo), 'M'))})
+            else:
+                chaves.append(datas.astype(np.int64))
+                decodificar.append(lambda codigo: {"dia": str(np.datetime64(int(codigo), 'D'))})
+
+    # Agrupamento vetorizado: uma linha por combinação de chaves, somas com bincount
+    grupos, inverso = np.unique(np.stack(chaves, axis=1), axis=0, return_inverse=True)
+    inverso = inverso.reshape(-1)
+    if len(grupos) > current_app.config['ANALYTICS_MAX_GRUPOS']:
+        return jsonify({"error": f"Resultado com {len(grupos)} grupos, reduza o período ou o agrupamento"}), 400
+    entradas_grupo = np.bincount(inverso, weights=entradas_qtd, minlength=len(grupos)).astype(np.int64)
+    saidas_grupo = np.bincount(inverso, weights=saidas_qtd, minlength=len(grupos)).astype(np.int64)
+
+    series = []
+    for grupo, entradas, saidas in zip(grupos.tolist(), entradas_grupo.tolist(), saidas_grupo.tolist()):
+        chave = {}
+        for codigo, decodificar_chave in zip(grupo, decodificar):
+            chave.update(decodificar_chave(codigo))
+        series.append({"chave": chave, "entradas": entradas, "saidas": saidas, "saldo": entradas - saidas})
+    return jsonify({"de": de.date().isoformat(), "ate": ate.date().isoformat(), "agrupar": agrupar, "totais": totais, "series": series})
+
+# Devolve (resultados da página, número da próxima página ou None)
+def dados_busca(sessao, args):
+    termo = args.get('q', '')
+    tipo = args.get('tipo', 'mercadorias')
+    pagina = max(args.get('pagina', 1, type=int), 1)
+    por_pagina = min(max(args.get('por_pagina', 50, type=int), 1), 200)
+    dialeto = sessao.get_bind().dialect.name
+
+    def paginar(consulta, formatar):
+        # Busca um a mais pra saber se existe próxima página sem precisar de COUNT
+        linhas = sessao.execute(consulta.limit(por_pagina + 1).offset((pagina - 1) * por_pagina)).all()
+        return [formatar(linha) for linha in linhas[:por_pagina]], pagina + 1 if len(linhas) > por_pagina else None
+
+    if tipo == 'mercadorias':
+        # Busca mercadorias por nome, número de registro, fabricante ou tipo
+        filtro, relevancia = busca_mercadoria(termo, dialeto)
+        consulta = db.select(
+            Mercadoria.id, Mercadoria.nome, Mercadoria.numero_registro, Mercadoria.fabricante,
+            Mercadoria.tipo, Mercadoria.descricao, Mercadoria.custo_unitario
+        ).where(filtro).order_by(relevancia.desc(), Mercadoria.id)
+        return paginar(consulta, lambda m: {
+            'id': m.id,
+            'nome': m.nome,
+            'numero_registro': m.numero_registro,
+            'fabricante': m.fabricante,
+            'tipo': m.tipo,
+            'descricao': m.descricao,
+            'custo_unitario': m.custo_unitario
+        })
+
+    elif tipo in ('entradas', 'saidas'):
+        # Busca entradas/saídas pelo nome da mercadoria (join) ou pela data, no período [desde, ate)
+        datas = {}
+        for parametro in ('de', 'ate'):
+            if args.get(parametro):
+                datas[parametro] = ler_data(args[parametro])
+                if datas[parametro] is None or datas[parametro].year > 9998:  # O fim do período é o dia seguinte
+                    raise ValueError(f'Data inválida em {parametro}!')
+        dia = ler_data(termo)
+        if dia is not None and dia.year > 9998:
+            raise ValueError('Data inválida em q!')
+        inicios = [data for data in (dia, datas.get('de')) if data is not None]
+        fins = [data + timedelta(days=1) for data in (dia, datas.get('ate')) if data is not None]
+        desde, ate = max(inicios, default=None), min(fins, default=None)
+
+        # Sem data (q de data ou de) a busca fica nos meses que ainda não foram arquivados
+        modelo = Entrada if tipo == 'entradas' else Saida
+        if desde is None:
+            desde = corte_do_arquivo(sessao)
+        modelo = movimentos_do_periodo(sessao, modelo, desde, ate)
+        consulta = db.select(
+            modelo.id, Mercadoria.nome, modelo.quantidade, modelo.data_hora, modelo.local
+        ).outerjoin(Mercadoria, Mercadoria.id == modelo.mercadoria_id)
+
+        if desde is not None:
+            consulta = consulta.where(modelo.data_hora >= desde)
+        if ate is not None:
+            consulta = consulta.where(modelo.data_hora < ate)
+        if dia is None and termo.strip():
+            consulta = consulta.where(busca_mercadoria(termo, dialeto)[0])
+
+        local = args.get('local', '').strip()
+        if local:
+            consulta = consulta.where(modelo.local.like(prefixo_like(local), escape='\\'))
+
+        consulta = consulta.order_by(modelo.data_hora.desc(), modelo.id.desc())
+        return paginar(consulta, lambda m: {
+            'id': m.id,
+            'mercadoria': m.nome or 'Desconhecido',
+            'quantidade': m.quantidade,
+            'data_hora': m.data_hora.isoformat(),
+            'local': m.local
+        })
+
+    raise ValueError('Tipo de busca inválido!')
+
+# API pra busca (paginada: pagina e por_pagina; X-Proxima-Pagina indica se há mais resultados)
+# Mercadorias: cada palavra de q casa com nome, número de registro, fabricante ou tipo, ordenado por relevância.
+# Entradas/saídas: q é o nome da mercadoria ou uma data; filtros opcionais local, de e ate (AAAA-MM-DD).
+# Sem data (nem q de data nem de) só procura nos meses não arquivados; pra buscar no arquivo informe o período.
+@bp.route('/api/busca', methods=['GET'])
+@leitura_na_replica
+def buscar():
+    try:
+        resultados, proxima = dados_busca(db.session, request.args)
+    except ValueError as erro:
+        return jsonify({'error': str(erro)}), 400
+    resposta = jsonify(resultados)
+    if proxima is not None:
+        resposta.headers['X-Proxima-Pagina'] = str(proxima)
+    return resposta
@@ -0,0 +1,287 @@
+from flask import Blueprint, current_app, jsonify, request
+from collections import deque
+import click
+
+from .banco import db, leitura_na_replica
+from .cache import resposta_em_cache, invalidar_respostas
+from .modelos import Mercadoria, Entrada, Saida, SaldoMercadoria, CamadaCusto, ResumoMensal
+from .estoque import tabelas_de_movimento
+
+# Razão de custos: cada entrada grava o custo unitário dela, o saldo de cada mercadoria carrega o valor do estoque
+# e cada saída é baixada pelo custo médio (valor / saldo) ou, com CUSTEIO = 'fifo', consumindo as camadas
+# (o que resta de cada entrada) da mais antiga pra mais nova. O resumo mensal guarda o custo das entradas e das
+# baixas e o saldo/valor no fim do mês, então a valorização de um mês é uma leitura, não um replay do histórico.
+bp = Blueprint('custos', __name__, cli_group=None)
+
+METODOS_CUSTEIO = ('media', 'fifo')
+
+def custeio_fifo():
+    metodo = current_app.config['CUSTEIO']
+    if metodo not in METODOS_CUSTEIO:
+        raise ValueError(f"CUSTEIO inválido: {metodo!r} (use media ou fifo)")
+    return metodo == 'fifo'
+
+# Custo unitário vindo do cadastro ou da importação; None quando não veio (usa o da mercadoria)
+def ler_custo_unitario(valor):
+    if valor is None or valor == '':
+        return None
+    try:
+        custo = float(valor)
+    except (TypeError, ValueError):
+        raise ValueError("Custo unitário inválido")
+    if not custo >= 0:  # Também recusa nan
+        raise ValueError("Custo unitário inválido")
+    return custo
+
+# Custo padrão das mercadorias, pras entradas que chegam sem custo
+def custos_padrao(ids):
+    return dict(db.session.execute(
+        db.select(Mercadoria.id, Mercadoria.custo_unitario).where(Mercadoria.id.in_(set(ids)))
+    ).all())
+
+# Entrada no estoque ([saldo, valor]) e, no fifo, uma camada nova no fim da fila.
+# Cada camada é [origem, quantidade, custo_unitario]: origem é o id da linha em CamadasCusto ou, no replay, a data da entrada.
+def entrar(estoque, quantidade, custo_unitario, camadas=None, origem=None):
+    estoque[0] += quantidade
+    estoque[1] += quantidade * custo_unitario
+    if camadas is not None:
+        camadas.append([origem, quantidade, custo_unitario])
+
+# Baixa a quantidade do estoque ([saldo, valor]) e devolve o custo dela. Sem camadas é o custo médio; com camadas
+# consome da mais antiga pra mais nova, e o que não tiver camada (estoque de antes do fifo) sai pelo médio do resto.
+# Saída que zera o estoque leva o valor inteiro, então não sobra resíduo de arredondamento.
+def baixar(estoque, quantidade, camadas=None):
+    saldo, valor = estoque
+    if quantidade >= saldo:
+        custo = valor
+        if camadas is not None:
+            camadas.clear()
+    elif camadas is None:
+        custo = valor * quantidade / saldo
+    else:
+        custo, falta = 0.0, quantidade
+        while falta and camadas:
+            camada = camadas[0]
+            usado = min(falta, camada[1])
+            custo += usado * camada[2]
+            camada[1] -= usado
+            falta -= usado
+            if not camada[1]:
+                camadas.popleft()
+        if falta:
+            custo += (valor - custo) * falta / (saldo - quantidade + falta)
+    estoque[0] = saldo - quantidade
+    estoque[1] = valor - custo
+    return custo
+
+# Camadas das entradas gravadas (dicts com mercadoria_id, quantidade, data_hora e custo_unitario), sem commit
+def registrar_camadas(movimentos):
+    if custeio_fifo() and movimentos:
+        db.session.execute(db.insert(CamadaCusto), [{
+            "mercadoria_id": m['mercadoria_id'], "data_hora": m['data_hora'],
+            "quantidade": m['quantidade'], "custo_unitario": m['custo_unitario'],
+        } for m in movimentos])
+
+# Camadas em aberto das mercadorias, em ordem de consumo: {id: deque([id_camada, quantidade, custo])}
+def camadas_abertas(ids):
+    camadas = {}
+    consulta = db.select(CamadaCusto.id, CamadaCusto.mercadoria_id, CamadaCusto.quantidade, CamadaCusto.custo_unitario).where(
+        CamadaCusto.mercadoria_id.in_(set(ids))
+    ).order_by(CamadaCusto.mercadoria_id, CamadaCusto.data_hora, CamadaCusto.id)
+    for id, mercadoria_id, quantidade, custo_unitario in db.session.execute(consulta):
+        camadas.setdefault(mercadoria_id, deque()).append([id, quantidade, custo_unitario])
+    return camadas
+
+# Custeia as saídas (dicts com mercadoria_id e quantidade, na ordem em que são gravadas) e grava custo_unitario em
+# cada uma. estoques é {mercadoria_id: [saldo, valor]} de antes das saídas. Tira o custo do valor do estoque e
+# atualiza as camadas, sem commit. Quem chama já travou as linhas do saldo (reservar_saldo ou FOR UPDATE), então
+# as camadas da mercadoria não mudam no meio.
+def custear_saidas(movimentos, estoques):
+    fifo = custeio_fifo()
+    camadas = camadas_abertas({m['mercadoria_id'] for m in movimentos}) if fifo else {}
+    antes = {camada[0]: camada[1] for fila in camadas.values() for camada in fila}
+    custos = {}
+    for movimento in movimentos:
+        mercadoria_id = movimento['mercadoria_id']
+        fila = camadas.setdefault(mercadoria_id, deque()) if fifo else None
+        custo = baixar(estoques[mercadoria_id], movimento['quantidade'], fila)
+        movimento['custo_unitario'] = custo / movimento['quantidade']
+        custos[mercadoria_id] = custos.get(mercadoria_id, 0.0) + custo
+
+    for mercadoria_id, custo in custos.items():
+        db.session.execute(
+            db.update(SaldoMercadoria).where(SaldoMercadoria.mercadoria_id == mercadoria_id)
+            .values(valor=SaldoMercadoria.valor - custo)
+        )
+    if fifo:
+        depois = {camada[0]: camada[1] for fila in camadas.values() for camada in fila}
+        consumidas = [id for id in antes if id not in depois]
+        if consumidas:
+            db.session.execute(db.delete(CamadaCusto).where(CamadaCusto.id.in_(consumidas)))
+        alteradas = [{"id": id, "quantidade": quantidade} for id, quantidade in depois.items() if quantidade != antes[id]]
+        if alteradas:
+            db.session.execute(db.update(CamadaCusto), alteradas)
+
+# Refaz o razão inteiro a partir dos movimentos, uma faixa de mercadorias por vez (cada uma lida pelos índices
+# mercadoria_id + data_hora), juntando as tabelas de arquivo quando houver. Entradas antes das saídas no mesmo
+# instante. Gera, por faixa: (custos das saídas {tabela: {id: custo_unitario}}, estoques {mercadoria_id: [saldo, valor]}, camadas que sobraram
+# {mercadoria_id: deque}, resumos {(mercadoria_id, ano, mes): dict})
+def replay_de_custos(passo=500):
+    fifo = custeio_fifo()
+    entradas, saidas = tabelas_de_movimento(db.session, Entrada), tabelas_de_movimento(db.session, Saida)
+    maximo = max(db.session.scalar(db.select(db.func.max(tabela.mercadoria_id))) or 0 for tabela in entradas + saidas)
+    for inicio in range(0, maximo + 1, passo):
+        partes = [db.select(
+            tabela.mercadoria_id, tabela.data_hora, db.literal(0).label('tipo'), tabela.id, tabela.quantidade,
+            db.func.coalesce(tabela.custo_unitario, Mercadoria.custo_unitario, 0).label('custo_unitario'),
+            db.literal(0).label('origem'),
+        ).outerjoin(Mercadoria, Mercadoria.id == tabela.mercadoria_id).where(
+            tabela.mercadoria_id >= inicio, tabela.mercadoria_id < inicio + passo
+        ) for tabela in entradas]
+        partes += [db.select(
+            tabela.mercadoria_id, tabela.data_hora, db.literal(1), tabela.id, tabela.quantidade, db.literal(0.0),
+            db.literal(origem),
+        ).where(tabela.mercadoria_id >= inicio, tabela.mercadoria_id < inicio + passo) for origem, tabela in enumerate(saidas)]
+        movimentos = db.union_all(*partes).subquery()
+        consulta = db.select(movimentos).order_by(
+            movimentos.c.mercadoria_id, movimentos.c.data_hora, movimentos.c.tipo, movimentos.c.id
+        )
+
+        custos, estoques, camadas, resumos = {tabela: {} for tabela in saidas}, {}, {}, {}
+        for mercadoria_id, data_hora, tipo, id, quantidade, custo_unitario, origem in db.session.execute(consulta):
+            estoque = estoques.setdefault(mercadoria_id, [0, 0.0])
+            fila = camadas.setdefault(mercadoria_id, deque()) if fifo else None
+            resumo = resumos.get((mercadoria_id, data_hora.year, data_hora.month))
+            if resumo is None:
+                resumo = resumos[(mercadoria_id, data_hora.year, data_hora.month)] = {
+                    "entradas": 0, "saidas": 0, "custo_entradas": 0.0, "custo_saidas": 0.0
+                }
+            if tipo == 0:
+                entrar(estoque, quantidade, custo_unitario, fila, data_hora)
+                resumo["entradas"] += quantidade
+                resumo["custo_entradas"] += quantidade * custo_unitario
+            else:
+                custo = baixar(estoque, quantidade, fila)
+                custos[saidas[origem]][id] = custo / quantidade
+                resumo["saidas"] += quantidade
+                resumo["custo_saidas"] += custo
+            resumo["saldo_final"], resumo["valor_final"] = estoque
+        if estoques:
+            yield custos, estoques, camadas, resumos
+
+def em_lotes(linhas, tamanho=1000):
+    linhas = list(linhas)
+    for inicio in range(0, len(linhas), tamanho):
+        yield linhas[inicio:inicio + tamanho]
+
+# Reconstrói o razão: custo das entradas antigas (o da mercadoria), custo de cada saída, valor dos saldos,
+# camadas do fifo e os resumos mensais. Sem commit; devolve os meses (ano, mes) com movimento.
+def reconstruir_custos():
+    for tabela in tabelas_de_movimento(db.session, Entrada):
+        db.session.execute(
+            db.update(tabela).where(tabela.custo_unitario.is_(None)).values(
+                custo_unitario=db.select(Mercadoria.custo_unitario).where(Mercadoria.id == tabela.mercadoria_id).scalar_subquery()
+            )
+        )
+    db.session.execute(db.update(SaldoMercadoria).values(valor=0.0))
+    db.session.execute(db.delete(CamadaCusto))
+    db.session.execute(db.delete(ResumoMensal))
+    saldos = set(db.session.scalars(db.select(SaldoMercadoria.mercadoria_id)))
+    meses = set()
+    for custos, estoques, camadas, resumos in replay_de_custos():
+        for tabela, custos_tabela in custos.items():
+            for lote in em_lotes({"id": id, "custo_unitario": custo} for id, custo in custos_tabela.items()):
+                db.session.execute(db.update(tabela), lote)
+        for lote in em_lotes({"mercadoria_id": id, "valor": estoque[1]} for id, estoque in estoques.items() if id in saldos):
+            db.session.execute(db.update(SaldoMercadoria), lote)
+        for lote in em_lotes({"mercadoria_id": id, "data_hora": camada[0], "quantidade": camada[1], "custo_unitario": camada[2]}
+                             for id, fila in camadas.items() for camada in fila):
+            db.session.execute(db.insert(CamadaCusto), lote)
+        for lote in em_lotes(dict(totais, mercadoria_id=id, ano=ano, mes=mes) for (id, ano, mes), totais in resumos.items()):
+            db.session.execute(db.insert(ResumoMensal), lote)
+        meses.update((ano, mes) for _, ano, mes in resumos)
+    return meses
+
+# Comando pra reconstruir (ou só verificar) o razão de custos: flask recalcular-custos [--verificar].
+# Rode depois de mudar o CUSTEIO ou de gravar movimentos com data anterior a meses já fechados.
+@bp.cli.command('recalcular-custos')
+@click.option('--verificar', is_flag=True, help='Só compara o valor dos saldos e dos resumos com o replay, sem alterar nada.')
+def recalcular_custos(verificar):
+    if not verificar:
+        meses = reconstruir_custos()
+        db.session.commit()
+        invalidar_respostas(['movimentos'] + [f'mes-{ano}-{mes:02d}' for ano, mes in meses])
+        click.echo(f"Razão de custos ({current_app.config['CUSTEIO']}) reconstruído em {len(meses)} mês(es)")
+        return
+
+    valores = dict(db.session.execute(db.select(SaldoMercadoria.mercadoria_id, SaldoMercadoria.valor)).all())
+    gravados = {
+        (r.mercadoria_id, r.ano, r.mes): (r.custo_entradas, r.custo_saidas, r.saldo_final, r.valor_final)
+        for r in ResumoMensal.query.all()
+    }
+    divergentes = 0
+    for _, estoques, _, resumos in replay_de_custos():
+        for mercadoria_id, (_, valor) in estoques.items():
+            if mercadoria_id in valores and abs(valores[mercadoria_id] - valor) > 0.01:
+                divergentes += 1
+                click.echo(f"Mercadoria {mercadoria_id}: valor gravado {valores[mercadoria_id]:.2f}, histórico {valor:.2f}")
+        for (mercadoria_id, ano, mes), totais in sorted(resumos.items()):
+            esperado = (totais["custo_entradas"], totais["custo_saidas"], totais["saldo_final"], totais["valor_final"])
+            atual = gravados.get((mercadoria_id, ano, mes))
+            if atual is None or any(abs(a - b) > 0.01 for a, b in zip(atual, esperado)):
+                divergentes += 1
+                click.echo(f"Mercadoria {mercadoria_id} em {mes:02d}/{ano}: gravado {atual}, histórico {esperado}")
+    click.echo(f"{divergentes} divergência(s)")
+    if divergentes:
+        raise SystemExit(1)
+
+# Valorização do estoque no fim do mês (mes, ano): pra cada mercadoria, o resumo mensal mais recente até o período
+# (mercadoria sem movimento no mês continua com o saldo e o valor do último mês movimentado).
+# Opcional: mercadoria_id. Devolve {"mes", "ano", "custeio", "valor_total", "mercadorias": [...]}.
+def dados_valorizacao(sessao, mes, ano, args):
+    if not 1 <= mes <= 12:
+        raise ValueError("Mês inválido!")
+    # Último mês movimentado de cada mercadoria até o período (agregado pela chave primária, sem ordenar o
+    # histórico inteiro), juntado de volta nos resumos pela chave
+    periodo = db.func.max(ResumoMensal.ano * 100 + ResumoMensal.mes)
+    ultimos = db.select(ResumoMensal.mercadoria_id, periodo.label('periodo')).where(
+        db.or_(ResumoMensal.ano < ano, db.and_(ResumoMensal.ano == ano, ResumoMensal.mes <= mes))
+    )
+    if args.get('mercadoria_id', type=int) is not None:
+        ultimos = ultimos.where(ResumoMensal.mercadoria_id == args.get('mercadoria_id', type=int))
+    ultimos = ultimos.group_by(ResumoMensal.mercadoria_id).subquery()
+    consulta = db.select(
+        ResumoMensal.mercadoria_id, Mercadoria.nome, ResumoMensal.ano, ResumoMensal.mes, ResumoMensal.saldo_final,
+        ResumoMensal.valor_final, ResumoMensal.custo_entradas, ResumoMensal.custo_saidas
+    ).join(ultimos, db.and_(
+        ResumoMensal.mercadoria_id == ultimos.c.mercadoria_id,
+        ResumoMensal.ano == ultimos.c.periodo // 100,
+        ResumoMensal.mes == ultimos.c.periodo % 100
+    )).outerjoin(Mercadoria, Mercadoria.id == ResumoMensal.mercadoria_id).order_by(ResumoMensal.mercadoria_id)
+
+    mercadorias = []
+    valor_total = 0.0
+    for id, nome, ano_resumo, mes_resumo, saldo, valor, custo_entradas, custo_saidas in sessao.execute(consulta):
+        no_mes = (ano_resumo, mes_resumo) == (ano, mes)
+        mercadorias.append({
+            "id": id,
+            "nome": nome,
+            "saldo": saldo,
+            "valor": round(valor, 2),
+            "custo_medio": round(valor / saldo, 4) if saldo else 0.0,
+            "custo_entradas": round(custo_entradas, 2) if no_mes else 0.0,
+            "custo_saidas": round(custo_saidas, 2) if no_mes else 0.0,
+        })
+        valor_total += valor
+    return {"mes": mes, "ano": ano, "custeio": current_app.config['CUSTEIO'], "valor_total": round(valor_total, 2),
+            "mercadorias": mercadorias}
+
+# API pra valorização do estoque no fim de um mês
+@bp.route('/api/valorizacao/<int:mes>/<int:ano>', methods=['GET'])
+@resposta_em_cache('movimentos')
+@leitura_na_replica
+def valorizacao(mes, ano):
+    try:
+        return jsonify(dados_valorizacao(db.session, mes, ano, request.args))
+    except ValueError as erro:
+        return jsonify({"error": str(erro)}), 400
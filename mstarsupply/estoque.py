@@ -0,0 +1,564 @@
+from flask import Blueprint, current_app
+from datetime import datetime
+from functools import partial
+from sqlalchemy.exc import IntegrityError
+import click
+
+from .banco import db
+from .modelos import (
+    Mercadoria, Entrada, Saida, EntradaArquivada, SaidaArquivada, Arquivamento, SaldoMercadoria, ResumoMensal, FechamentoSaldo
+)
+from .cache import invalidar_respostas
+
+# Saldos, totais mensais e os comandos de manutenção (registrados direto no flask, sem grupo)
+bp = Blueprint('estoque', __name__, cli_group=None)
+
+# Intervalo [início, fim) de um mês, pra filtrar data_hora por faixa e aproveitar os índices
+def intervalo_do_mes(mes, ano):
+    inicio = datetime(ano, mes, 1)
+    fim = datetime(ano + 1, 1, 1) if mes == 12 else datetime(ano, mes + 1, 1)
+    return inicio, fim
+
+# Filtro do período (mes, ano) sobre uma coluna de data; mês inválido não traz nada
+def filtro_do_mes(coluna, mes, ano):
+    if not 1 <= mes <= 12 or not 1 <= ano <= 9998:
+        return db.false()
+    inicio, fim = intervalo_do_mes(mes, ano)
+    return db.and_(coluna >= inicio, coluna < fim)
+
+def mes_anterior(ano, mes):
+    return (ano - 1, 12) if mes == 1 else (ano, mes - 1)
+
+def proximo_mes(ano, mes):
+    return (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+# Filtros de período nas tabelas mensais (colunas ano e mes), escritos com OR pra aproveitar os índices
+def periodo_antes(modelo, ano, mes):
+    return db.or_(modelo.ano < ano, db.and_(modelo.ano == ano, modelo.mes < mes))
+
+def periodo_depois(modelo, ano, mes):
+    return db.or_(modelo.ano > ano, db.and_(modelo.ano == ano, modelo.mes > mes))
+
+# Tabela de arquivo de cada tabela de movimentos (flask arquivar)
+ARQUIVOS = {Entrada: EntradaArquivada, Saida: SaidaArquivada}
+
+# Corte do último arquivamento: só movimentos com data antes dele podem estar no arquivo (None = nada arquivado)
+def corte_do_arquivo(sessao):
+    return sessao.scalar(db.select(db.func.max(Arquivamento.corte)))
+
+# Tabelas onde estão os movimentos do modelo (Entrada ou Saida) com data a partir de `desde` (None = o histórico
+# inteiro): só a quente quando o período começa no corte ou depois, senão ela e a de arquivo
+def tabelas_de_movimento(sessao, modelo, desde=None):
+    corte = corte_do_arquivo(sessao)
+    if corte is None or (desde is not None and desde >= corte):
+        return [modelo]
+    return [modelo, ARQUIVOS[modelo]]
+
+# Movimentos do modelo com data em [desde, ate), pra consultar no lugar dele (movimentos.data_hora, .id etc.):
+# o próprio modelo ou, se o período pega meses arquivados, um alias sobre o UNION ALL das duas tabelas com a faixa
+# de datas dentro de cada parte (assim cada uma usa o seu índice). Os filtros de quem consulta continuam valendo.
+def movimentos_do_periodo(sessao, modelo, desde=None, ate=None):
+    tabelas = tabelas_de_movimento(sessao, modelo, desde)
+    if len(tabelas) == 1:
+        return modelo
+    partes = []
+    for tabela in tabelas:
+        filtros = []
+        if desde is not None:
+            filtros.append(tabela.data_hora >= desde)
+        if ate is not None:
+            filtros.append(tabela.data_hora < ate)
+        partes.append(db.select(*(getattr(tabela, coluna.key) for coluna in modelo.__table__.columns)).where(*filtros))
+    return db.aliased(modelo, db.union_all(*partes).subquery(), adapt_on_names=True)
+
+# Mesmo que movimentos_do_periodo, pro mês (mes, ano)
+def movimentos_do_mes(sessao, modelo, mes, ano):
+    if not 1 <= mes <= 12 or not 1 <= ano <= 9998:
+        return modelo  # O filtro_do_mes de quem consulta já não traz nada
+    return movimentos_do_periodo(sessao, modelo, *intervalo_do_mes(mes, ano))
+
+# Comando pra criar as tabelas que ainda não existem: flask criar-tabelas.
+# Roda no deploy (não mais a cada worker que sobe), só no primário: a réplica recebe o schema pela replicação.
+@bp.cli.command('criar-tabelas')
+def criar_tabelas():
+    db.create_all(bind_key=None)
+    click.echo("Tabelas criadas")
+
+# Comando pra criar os índices que faltam em tabelas já existentes (o create_all só cria tabelas novas)
+@bp.cli.command('criar-indices')
+def criar_indices():
+    for tabela in db.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            indice.create(db.engine, checkfirst=True)
+            click.echo(f"{tabela.name}: {indice.name}")
+
+# Comando pra criar as colunas novas em tabelas já existentes (o create_all não altera tabelas), ex.: os
+# custos das entradas e saídas. Colunas obrigatórias novas têm server_default, então as linhas antigas ficam válidas.
+@bp.cli.command('criar-colunas')
+def criar_colunas():
+    inspetor = db.inspect(db.engine)
+    nomes = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as conexao:
+        for tabela in db.metadata.sorted_tables:
+            if not inspetor.has_table(tabela.name):
+                continue
+            existentes = {coluna['name'] for coluna in inspetor.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name in existentes:
+                    continue
+                definicao = f"{nomes.quote(coluna.name)} {coluna.type.compile(dialect=db.engine.dialect)}"
+                if coluna.server_default is not None:
+                    definicao += f" NOT NULL DEFAULT {coluna.server_default.arg}"
+                conexao.execute(db.text(f"ALTER TABLE {nomes.quote(tabela.name)} ADD COLUMN {definicao}"))
+                click.echo(f"{tabela.name}: {coluna.name}")
+
+# Soma os incrementos na linha identificada pela chave, criando a linha se ela ainda não existir.
+# inicial (opcional) devolve os valores de partida da linha nova, somados aos incrementos (ex.: o saldo do mês anterior).
+def somar_ou_criar(modelo, chave, inicial=None, **incrementos):
+    filtro = [getattr(modelo, coluna) == valor for coluna, valor in chave.items()]
+    valores = {coluna: getattr(modelo, coluna) + valor for coluna, valor in incrementos.items()}
+    if db.session.execute(db.update(modelo).where(*filtro).values(**valores)).rowcount:
+        return
+    partida = inicial() if inicial else {}
+    try:
+        with db.session.begin_nested():
+            db.session.add(modelo(**chave, **{coluna: partida.get(coluna, 0) + valor for coluna, valor in incrementos.items()}))
+    except IntegrityError:  # Outra transação criou a linha ao mesmo tempo, então agora o UPDATE pega
+        if not db.session.execute(db.update(modelo).where(*filtro).values(**valores)).rowcount:
+            raise  # Não era corrida (ex.: chave estrangeira inexistente): não segue sem somar
+
+# Soma entradas/saídas no saldo da mercadoria e o custo das entradas no valor do estoque
+# (sem commit, fica na transação do movimento)
+def atualizar_saldo(mercadoria_id, entradas=0, saidas=0, valor=0.0):
+    somar_ou_criar(
+        SaldoMercadoria, {"mercadoria_id": mercadoria_id},
+        total_entradas=entradas, total_saidas=saidas, saldo=entradas - saidas, valor=valor
+    )
+
+def dados_do_movimento(movimento):
+    return {"mercadoria_id": movimento.mercadoria_id, "quantidade": movimento.quantidade, "data_hora": movimento.data_hora,
+            "custo_unitario": movimento.custo_unitario}
+
+# Saldo e valor no fim do último mês com movimento da mercadoria antes de (ano, mes), ponto de partida de um mês novo
+def fim_do_mes_anterior(mercadoria_id, ano, mes):
+    anterior = db.session.execute(
+        db.select(ResumoMensal.saldo_final, ResumoMensal.valor_final)
+        .where(ResumoMensal.mercadoria_id == mercadoria_id, periodo_antes(ResumoMensal, ano, mes))
+        .order_by(ResumoMensal.ano.desc(), ResumoMensal.mes.desc()).limit(1)
+    ).first()
+    return anterior._asdict() if anterior else {}
+
+# Soma os movimentos (dicts com mercadoria_id, quantidade, data_hora e custo_unitario) nos totais mensais e nos
+# fechamentos de saldo, sem commit. campo é 'entradas' ou 'saidas'.
+# saldo_final e valor_final são acumulados: o movimento entra no mês dele e em todos os meses seguintes já gravados
+# da mercadoria, e um mês novo parte do fim do último mês anterior. Movimento com data antiga acerta o saldo de
+# fim dos meses seguintes; o valor anda só pelo custo dele (o custo das saídas gravadas depois não é refeito,
+# pra isso existe o flask recalcular-custos).
+def atualizar_resumo_mensal(movimentos, campo):
+    por_mes = {}
+    for movimento in movimentos:
+        chave = (movimento['mercadoria_id'], movimento['data_hora'].year, movimento['data_hora'].month)
+        totais = por_mes.setdefault(chave, [0, 0.0])
+        totais[0] += movimento['quantidade']
+        totais[1] += movimento['quantidade'] * (movimento['custo_unitario'] or 0.0)
+    if not por_mes:
+        return
+    sinal = 1 if campo == 'entradas' else -1
+    # Meses seguintes já gravados, num executemany só (no caso comum não existem e nada muda)
+    db.session.connection().execute(
+        db.update(ResumoMensal).where(
+            ResumoMensal.mercadoria_id == db.bindparam('p_id'),
+            periodo_depois(ResumoMensal, db.bindparam('p_ano'), db.bindparam('p_mes'))
+        ).values(saldo_final=ResumoMensal.saldo_final + db.bindparam('p_saldo'),
+                 valor_final=ResumoMensal.valor_final + db.bindparam('p_valor')),
+        [{"p_id": mercadoria_id, "p_ano": ano, "p_mes": mes, "p_saldo": sinal * quantidade, "p_valor": sinal * custo}
+         for (mercadoria_id, ano, mes), (quantidade, custo) in por_mes.items()]
+    )
+    for (mercadoria_id, ano, mes), (quantidade, custo) in sorted(por_mes.items()):
+        somar_ou_criar(
+            ResumoMensal, {"mercadoria_id": mercadoria_id, "ano": ano, "mes": mes},
+            inicial=partial(fim_do_mes_anterior, mercadoria_id, ano, mes),
+            **{campo: quantidade, f"custo_{campo}": custo, "saldo_final": sinal * quantidade, "valor_final": sinal * custo}
+        )
+    ajustar_fechamentos({chave: sinal * quantidade for chave, (quantidade, _) in por_mes.items()})
+
+# Leva as quantidades ({(mercadoria_id, ano, mes): quantidade com sinal}) pros fechamentos a partir do mês de cada
+# uma. Só movimento com data num mês já fechado mexe aqui; no caso comum é uma consulta que não acha nada.
+# As linhas que já existem andam num executemany; mercadoria que ainda não tinha fechamento ganha as linhas que faltam.
+def ajustar_fechamentos(quantidades):
+    primeiro = min((ano, mes) for _, ano, mes in quantidades)
+    periodos = [tuple(periodo) for periodo in db.session.execute(
+        db.select(FechamentoSaldo.ano, FechamentoSaldo.mes).where(~periodo_antes(FechamentoSaldo, *primeiro)).distinct()
+    )]
+    afetadas = {chave: quantidade for chave, quantidade in quantidades.items() if any(p >= chave[1:] for p in periodos)}
+    if not afetadas:
+        return
+    db.session.connection().execute(
+        db.update(FechamentoSaldo).where(
+            FechamentoSaldo.mercadoria_id == db.bindparam('p_id'),
+            ~periodo_antes(FechamentoSaldo, db.bindparam('p_ano'), db.bindparam('p_mes'))
+        ).values(saldo=FechamentoSaldo.saldo + db.bindparam('p_saldo')),
+        [{"p_id": mercadoria_id, "p_ano": ano, "p_mes": mes, "p_saldo": quantidade}
+         for (mercadoria_id, ano, mes), quantidade in afetadas.items()]
+    )
+
+    inicio = {}
+    for mercadoria_id, ano, mes in afetadas:
+        inicio[mercadoria_id] = min(inicio.get(mercadoria_id, (ano, mes)), (ano, mes))
+    existentes = {}
+    for mercadoria_id, ano, mes in db.session.execute(
+        db.select(FechamentoSaldo.mercadoria_id, FechamentoSaldo.ano, FechamentoSaldo.mes).where(
+            FechamentoSaldo.mercadoria_id.in_(inicio), ~periodo_antes(FechamentoSaldo, *primeiro)
+        )
+    ):
+        existentes.setdefault(mercadoria_id, set()).add((ano, mes))
+    faltando = [{
+        "mercadoria_id": mercadoria_id, "ano": periodo[0], "mes": periodo[1],
+        "saldo": sum(q for (id, ano, mes), q in afetadas.items() if id == mercadoria_id and (ano, mes) <= periodo),
+    } for mercadoria_id, desde in inicio.items() for periodo in periodos
+        if periodo >= desde and periodo not in existentes.get(mercadoria_id, ())]
+    if faltando:
+        db.session.execute(db.insert(FechamentoSaldo), faltando)
+
+# Baixa a quantidade do saldo de forma atômica: o UPDATE só acontece se houver estoque
+# e trava a linha da mercadoria até o commit, então só saídas do mesmo produto esperam umas pelas outras
+def reservar_saldo(mercadoria_id, quantidade):
+    resultado = db.session.execute(
+        db.update(SaldoMercadoria)
+        .where(SaldoMercadoria.mercadoria_id == mercadoria_id, SaldoMercadoria.saldo >= quantidade)
+        .values(
+            total_saidas=SaldoMercadoria.total_saidas + quantidade,
+            saldo=SaldoMercadoria.saldo - quantidade
+        )
+    )
+    return resultado.rowcount == 1
+
+# Saldo atual da mercadoria (busca pela chave primária, não depende do histórico)
+def saldo_atual(mercadoria_id):
+    saldo = db.session.get(SaldoMercadoria, mercadoria_id)
+    return saldo.saldo if saldo else 0
+
+# Recalcula os totais de todas as mercadorias a partir do histórico de entradas e saídas
+def totais_do_historico():
+    entradas, saidas = (dict(db.session.execute(
+        db.select(modelo.mercadoria_id, db.func.sum(modelo.quantidade)).group_by(modelo.mercadoria_id)
+    ).all()) for modelo in (movimentos_do_periodo(db.session, Entrada), movimentos_do_periodo(db.session, Saida)))
+    ids = db.session.scalars(db.select(Mercadoria.id)).all()
+    return {id: (int(entradas.get(id) or 0), int(saidas.get(id) or 0)) for id in ids}
+
+# Comando pra reconstruir (ou só verificar) os saldos: flask recalcular-saldos [--verificar]
+@bp.cli.command('recalcular-saldos')
+@click.option('--verificar', is_flag=True, help='Só compara os saldos gravados com o histórico, sem alterar nada.')
+def recalcular_saldos(verificar):
+    gravados = {s.mercadoria_id: s for s in SaldoMercadoria.query.all()}
+    divergencias = 0
+    for mercadoria_id, (total_entradas, total_saidas) in totais_do_historico().items():
+        saldo = gravados.get(mercadoria_id)
+        esperado = (total_entradas, total_saidas, total_entradas - total_saidas)
+        atual = (saldo.total_entradas, saldo.total_saidas, saldo.saldo) if saldo else None
+        if atual == esperado:
+            continue
+        divergencias += 1
+        click.echo(f"Mercadoria {mercadoria_id}: gravado {atual}, histórico {esperado}")
+        if verificar:
+            continue
+        if saldo is None:
+            saldo = SaldoMercadoria(mercadoria_id=mercadoria_id)
+            db.session.add(saldo)
+        saldo.total_entradas, saldo.total_saidas, saldo.saldo = esperado
+
+    if verificar:
+        click.echo(f"{divergencias} saldo(s) divergente(s)")
+        if divergencias:
+            raise SystemExit(1)
+    else:
+        db.session.commit()
+        invalidar_respostas(['movimentos'])
+        click.echo(f"{divergencias} saldo(s) corrigido(s)")
+
+# Comando pra reconstruir (ou só verificar) os totais mensais a partir dos movimentos:
+# flask recalcular-resumos [--verificar]. A reconstrução refaz o razão de custos inteiro (veja recalcular-custos).
+@bp.cli.command('recalcular-resumos')
+@click.option('--verificar', is_flag=True, help='Só compara as quantidades gravadas com o histórico, sem alterar nada.')
+def recalcular_resumos(verificar):
+    if not verificar:
+        from .custos import reconstruir_custos  # custos importa este módulo
+        meses = reconstruir_custos()
+        db.session.commit()
+        invalidar_respostas(['movimentos'] + [f'mes-{ano}-{mes:02d}' for ano, mes in meses])
+        click.echo(f"Resumos mensais e custos de {len(meses)} mês(es) reconstruídos")
+        return
+
+    historico = {}
+    for modelo, campo in ((Entrada, 'entradas'), (Saida, 'saidas')):
+        modelo = movimentos_do_periodo(db.session, modelo)
+        ano = db.extract('year', modelo.data_hora)
+        mes = db.extract('month', modelo.data_hora)
+        consulta = db.select(
+            modelo.mercadoria_id, ano, mes, db.func.sum(modelo.quantidade)
+        ).group_by(modelo.mercadoria_id, ano, mes)
+        for mercadoria_id, ano_linha, mes_linha, quantidade in db.session.execute(consulta):
+            linha = historico.setdefault((mercadoria_id, int(ano_linha), int(mes_linha)), {"entradas": 0, "saidas": 0})
+            linha[campo] = int(quantidade)
+
+    gravados = {
+        (r.mercadoria_id, r.ano, r.mes): {"entradas": r.entradas, "saidas": r.saidas}
+        for r in ResumoMensal.query.all()
+    }
+    divergentes = [chave for chave in set(historico) | set(gravados) if historico.get(chave) != gravados.get(chave)]
+    for mercadoria_id, ano, mes in sorted(divergentes):
+        click.echo(f"Mercadoria {mercadoria_id} em {mes:02d}/{ano}: gravado {gravados.get((mercadoria_id, ano, mes))}, histórico {historico.get((mercadoria_id, ano, mes))}")
+    click.echo(f"{len(divergentes)} resumo(s) divergente(s)")
+    if divergentes:
+        raise SystemExit(1)
+
+# Entradas menos saídas por mercadoria com data_hora em [desde, ate) (desde None = desde o começo), como partes
+# de um UNION ALL com as colunas (mercadoria_id, saldo)
+def movimentos_liquidos(sessao, desde, ate):
+    partes = []
+    for modelo, sinal in ((Entrada, 1), (Saida, -1)):
+        modelo = movimentos_do_periodo(sessao, modelo, desde, ate)
+        filtro = [modelo.data_hora < ate] if desde is None else [modelo.data_hora >= desde, modelo.data_hora < ate]
+        partes.append(db.select(
+            modelo.mercadoria_id.label('mercadoria_id'), (sinal * db.func.sum(modelo.quantidade)).label('saldo')
+        ).where(*filtro).group_by(modelo.mercadoria_id))
+    return partes
+
+# Saldo de cada mercadoria antes do instante `ate` (exclusivo): o último fechamento que termina até lá mais os
+# movimentos entre o fim dele e `ate`. Com os fechamentos em dia isso é no máximo um mês e pouco de movimentos,
+# não importa a idade da base; sem fechamento nenhum soma o histórico inteiro. Devolve a subconsulta
+# (mercadoria_id, saldo), só com as mercadorias já movimentadas.
+def saldos_em(sessao, ate):
+    fechamento = sessao.execute(
+        db.select(FechamentoSaldo.ano, FechamentoSaldo.mes).where(periodo_antes(FechamentoSaldo, ate.year, ate.month))
+        .order_by(FechamentoSaldo.ano.desc(), FechamentoSaldo.mes.desc()).limit(1)
+    ).first()
+    partes, desde = [], None
+    if fechamento is not None:
+        partes.append(db.select(FechamentoSaldo.mercadoria_id, FechamentoSaldo.saldo).where(
+            FechamentoSaldo.ano == fechamento.ano, FechamentoSaldo.mes == fechamento.mes
+        ))
+        desde = intervalo_do_mes(fechamento.mes, fechamento.ano)[1]
+    partes += movimentos_liquidos(sessao, desde, ate)
+    uniao = db.union_all(*partes).subquery()
+    return db.select(
+        uniao.c.mercadoria_id, db.cast(db.func.sum(uniao.c.saldo), db.Integer).label('saldo')
+    ).group_by(uniao.c.mercadoria_id).subquery()
+
+# Comando pra gravar os fechamentos de saldo de cada mês encerrado, do mês seguinte ao último fechamento até --ate
+# (padrão: o mês passado). Rode todo mês, ex.: no cron do dia 1; a primeira vez fecha desde o primeiro movimento.
+# Cada mês custa uma passada nos movimentos dele e é gravado na sua própria transação.
+# --refazer apaga e refaz todos os fechamentos; --verificar só compara os gravados com o histórico.
+@bp.cli.command('fechar-saldos')
+@click.option('--ate', help='Último mês a fechar, no formato AAAA-MM (padrão: o mês passado).')
+@click.option('--refazer', is_flag=True, help='Apaga os fechamentos e refaz desde o primeiro movimento.')
+@click.option('--verificar', is_flag=True, help='Só compara os fechamentos gravados com o histórico, sem alterar nada.')
+def fechar_saldos(ate, refazer, verificar):
+    if ate:
+        try:
+            alvo = datetime.strptime(ate, '%Y-%m')
+        except ValueError:
+            raise click.BadParameter("use AAAA-MM", param_hint='--ate')
+        alvo = (alvo.year, alvo.month)
+    else:
+        hoje = datetime.now()
+        alvo = mes_anterior(hoje.year, hoje.month)
+    if refazer and not verificar:
+        db.session.execute(db.delete(FechamentoSaldo))
+
+    ultimo = None if refazer or verificar else db.session.execute(
+        db.select(FechamentoSaldo.ano, FechamentoSaldo.mes)
+        .order_by(FechamentoSaldo.ano.desc(), FechamentoSaldo.mes.desc()).limit(1)
+    ).first()
+    if ultimo is not None:
+        saldos = dict(db.session.execute(db.select(FechamentoSaldo.mercadoria_id, FechamentoSaldo.saldo).where(
+            FechamentoSaldo.ano == ultimo.ano, FechamentoSaldo.mes == ultimo.mes
+        )).all())
+        periodo = proximo_mes(ultimo.ano, ultimo.mes)
+    else:
+        saldos = {}
+        tabelas = tabelas_de_movimento(db.session, Entrada) + tabelas_de_movimento(db.session, Saida)
+        primeiro = min((data for data in (db.session.scalar(db.select(db.func.min(tabela.data_hora))) for tabela in tabelas)
+                        if data is not None), default=None)
+        if primeiro is None:
+            db.session.commit()
+            click.echo("Nenhum movimento pra fechar")
+            return
+        periodo = (primeiro.year, primeiro.month)
+
+    fechados = divergentes = 0
+    while periodo <= alvo:
+        inicio, fim = intervalo_do_mes(periodo[1], periodo[0])
+        uniao = db.union_all(*movimentos_liquidos(db.session, inicio, fim)).subquery()
+        for mercadoria_id, quantidade in db.session.execute(
+            db.select(uniao.c.mercadoria_id, db.func.sum(uniao.c.saldo)).group_by(uniao.c.mercadoria_id)
+        ):
+            saldos[mercadoria_id] = saldos.get(mercadoria_id, 0) + int(quantidade)
+
+        if verificar:
+            gravados = dict(db.session.execute(db.select(FechamentoSaldo.mercadoria_id, FechamentoSaldo.saldo).where(
+                FechamentoSaldo.ano == periodo[0], FechamentoSaldo.mes == periodo[1]
+            )).all())
+            for mercadoria_id in sorted(set(saldos) | set(gravados)):
+                if gravados and gravados.get(mercadoria_id, 0) != saldos.get(mercadoria_id, 0):
+                    divergentes += 1
+                    click.echo(f"Mercadoria {mercadoria_id} em {periodo[1]:02d}/{periodo[0]}: gravado {gravados.get(mercadoria_id)}, histórico {saldos.get(mercadoria_id, 0)}")
+        else:
+            linhas = [{"mercadoria_id": id, "ano": periodo[0], "mes": periodo[1], "saldo": saldo} for id, saldo in saldos.items()]
+            for inicio_lote in range(0, len(linhas), 1000):
+                db.session.execute(db.insert(FechamentoSaldo), linhas[inicio_lote:inicio_lote + 1000])
+            db.session.commit()
+        fechados += 1
+        periodo = proximo_mes(*periodo)
+
+    if verificar:
+        click.echo(f"{divergentes} fechamento(s) divergente(s)")
+        if divergentes:
+            raise SystemExit(1)
+    else:
+        db.session.commit()
+        click.echo(f"{fechados} mês(es) fechado(s)")
+
+# Comando pra arquivar os movimentos de meses antigos: flask arquivar [--ate AAAA-MM] (padrão: tudo antes dos últimos
+# ARQUIVO_MESES_QUENTES meses). As entradas e saídas com data até o fim do mês --ate passam pras tabelas de arquivo,
+# então as tabelas quentes (gravações, buscas, saldos recentes) ficam do tamanho dos meses recentes. O mês tem que
+# estar fechado (flask fechar-saldos), pra saldo numa data depois dele não precisar ler o arquivo. As leituras por
+# período juntam as duas tabelas sozinhas (movimentos_do_periodo). O corte é gravado antes de mover e cada lote de
+# ARQUIVO_LOTE linhas (INSERT no arquivo + DELETE na quente) é uma transação, então dá pra interromper e rodar de
+# novo; rodar de novo com o mesmo corte só leva movimentos gravados depois com data antiga.
+@bp.cli.command('arquivar')
+@click.option('--ate', help='Último mês a arquivar, no formato AAAA-MM (padrão: antes dos últimos ARQUIVO_MESES_QUENTES meses).')
+def arquivar(ate):
+    if ate:
+        try:
+            alvo = datetime.strptime(ate, '%Y-%m')
+        except ValueError:
+            raise click.BadParameter("use AAAA-MM", param_hint='--ate')
+        alvo = (alvo.year, alvo.month)
+    else:
+        hoje = datetime.now()
+        alvo = (hoje.year, hoje.month)
+        for _ in range(current_app.config['ARQUIVO_MESES_QUENTES'] + 1):
+            alvo = mes_anterior(*alvo)
+    fechado = db.session.scalar(
+        db.select(FechamentoSaldo.mercadoria_id).where(db.not_(periodo_antes(FechamentoSaldo, *alvo))).limit(1)
+    )
+    if fechado is None:
+        raise click.ClickException(f"{alvo[1]:02d}/{alvo[0]} ainda não foi fechado, rode flask fechar-saldos antes")
+
+    corte = intervalo_do_mes(alvo[1], alvo[0])[1]
+    anterior = corte_do_arquivo(db.session)
+    if anterior is None or corte > anterior:
+        registro = Arquivamento(corte=corte, iniciado_em=datetime.now())
+        db.session.add(registro)
+        db.session.commit()
+    else:
+        registro = db.session.scalar(db.select(Arquivamento).order_by(Arquivamento.corte.desc()).limit(1))
+        corte = anterior
+
+    lote = current_app.config['ARQUIVO_LOTE']
+    for modelo in (Entrada, Saida):
+        colunas = [coluna.key for coluna in modelo.__table__.columns]
+        # O maior id fica na tabela quente: o SQLite reaproveita ids acima do maior existente e repetiria um arquivado
+        ultimo_id = db.session.scalar(db.select(db.func.max(modelo.id)))
+        movidos = 0
+        while True:
+            ids = db.session.scalars(
+                db.select(modelo.id).where(modelo.data_hora < corte, modelo.id != ultimo_id).limit(lote)
+            ).all()
+            if not ids:
+                break
+            db.session.execute(db.insert(ARQUIVOS[modelo]).from_select(
+                colunas, db.select(*(getattr(modelo, coluna) for coluna in colunas)).where(modelo.id.in_(ids))
+            ))
+            db.session.execute(db.delete(modelo).where(modelo.id.in_(ids)))
+            db.session.commit()
+            movidos += len(ids)
+        if modelo is Entrada:
+            registro.entradas += movidos
+        else:
+            registro.saidas += movidos
+        click.echo(f"{modelo.__tablename__}: {movidos} movimento(s) arquivado(s)")
+    registro.concluido_em = datetime.now()
+    db.session.commit()
+    click.echo(f"Movimentos antes de {corte:%d/%m/%Y} arquivados")
+
+# Totais do mês por mercadoria, lidos por um cursor no servidor: uma linha por mercadoria movimentada,
+# em ordem de id, sem carregar o mês inteiro na memória. Mercadorias que não existem mais vêm com nome None.
+# Com USAR_RESUMO_MENSAL lê a tabela ResumosMensais, senão agrupa os movimentos do mês. Nos dois casos o
+# custo é o de cada movimento (o custo da mercadoria só entra nos movimentos antigos, sem custo gravado).
+def linhas_resumo_do_mes(mes, ano):
+    if current_app.config['USAR_RESUMO_MENSAL']:
+        consulta = db.select(
+            ResumoMensal.mercadoria_id, ResumoMensal.entradas, ResumoMensal.saidas,
+            ResumoMensal.custo_entradas, ResumoMensal.custo_saidas, Mercadoria.nome, Mercadoria.custo_unitario
+        ).outerjoin(Mercadoria, Mercadoria.id == ResumoMensal.mercadoria_id).where(
+            ResumoMensal.ano == ano, ResumoMensal.mes == mes
+        ).order_by(ResumoMensal.mercadoria_id)
+    else:
+        agrupados = []
+        for modelo, campo in ((Entrada, 'entradas'), (Saida, 'saidas')):
+            modelo = movimentos_do_mes(db.session, modelo, mes, ano)
+            quantidade = db.func.sum(modelo.quantidade)
+            custo = db.func.sum(modelo.quantidade * db.func.coalesce(modelo.custo_unitario, Mercadoria.custo_unitario, 0))
+            agrupados.append(db.select(
+                modelo.mercadoria_id.label('mercadoria_id'),
+                (quantidade if campo == 'entradas' else db.literal(0)).label('entradas'),
+                (quantidade if campo == 'saidas' else db.literal(0)).label('saidas'),
+                (custo if campo == 'entradas' else db.literal(0)).label('custo_entradas'),
+                (custo if campo == 'saidas' else db.literal(0)).label('custo_saidas'),
+            ).outerjoin(Mercadoria, Mercadoria.id == modelo.mercadoria_id).where(
+                filtro_do_mes(modelo.data_hora, mes, ano)
+            ).group_by(modelo.mercadoria_id))
+        movimentos = db.union_all(*agrupados).subquery()
+        consulta = db.select(
+            movimentos.c.mercadoria_id, db.func.sum(movimentos.c.entradas), db.func.sum(movimentos.c.saidas),
+            db.func.sum(movimentos.c.custo_entradas), db.func.sum(movimentos.c.custo_saidas),
+            Mercadoria.nome, Mercadoria.custo_unitario,
+        ).outerjoin(Mercadoria, Mercadoria.id == movimentos.c.mercadoria_id).group_by(
+            movimentos.c.mercadoria_id, Mercadoria.nome, Mercadoria.custo_unitario
+        ).order_by(movimentos.c.mercadoria_id)
+
+    resultado = db.session.execute(consulta.execution_options(stream_results=True, yield_per=1000))
+    for mercadoria_id, entradas, saidas, custo_entradas, custo_saidas, nome, custo_unitario in resultado:
+        yield {
+            "id": mercadoria_id,
+            "nome": nome,
+            "custo_unitario": custo_unitario or 0.0,
+            "entradas": int(entradas or 0),
+            "saidas": int(saidas or 0),
+            "custo_entradas": custo_entradas or 0.0,
+            "custo_saidas": custo_saidas or 0.0,
+        }
+
+# Totais gerais acumulados linha a linha (soma quantidades de todas, custos só das mercadorias cadastradas)
+def novo_total_geral():
+    return {"total_entradas": 0, "total_saidas": 0, "custo_entradas": 0, "custo_saidas": 0, "mercadorias_movimentadas": 0}
+
+def somar_no_total(total, linha):
+    total["total_entradas"] += linha["entradas"]
+    total["total_saidas"] += linha["saidas"]
+    if linha["nome"] is not None:
+        total["custo_entradas"] += linha["custo_entradas"]
+        total["custo_saidas"] += linha["custo_saidas"]
+        total["mercadorias_movimentadas"] += 1
+
+# Resumo do mês inteiro: as linhas de linhas_resumo_do_mes e os totais gerais
+def resumo_do_mes(mes, ano):
+    resumo = novo_total_geral()
+    resumo["linhas"] = list(linhas_resumo_do_mes(mes, ano))
+    for linha in resumo["linhas"]:
+        somar_no_total(resumo, linha)
+    return resumo
+
+# Totais do mês agrupados pelo nome da mercadoria (usado nos gráficos)
+def totais_por_nome(resumo, desconhecido="Desconhecido"):
+    entradas_por_mercadoria = {}
+    saidas_por_mercadoria = {}
+    for linha in resumo["linhas"]:
+        nome = linha["nome"] if linha["nome"] is not None else desconhecido.format(id=linha["id"])
+        if linha["entradas"]:
+            entradas_por_mercadoria[nome] = entradas_por_mercadoria.get(nome, 0) + linha["entradas"]
+        if linha["saidas"]:
+            saidas_por_mercadoria[nome] = saidas_por_mercadoria.get(nome, 0) + linha["saidas"]
+    return entradas_por_mercadoria, saidas_por_mercadoria
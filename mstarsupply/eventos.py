@@ -0,0 +1,195 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+import asyncio
+import json
+import os
+import queue
+import socket
+import threading
+
+bp = Blueprint('eventos', __name__)
+
+# Eventos ao vivo pro frontend (Server-Sent Events em /api/stream) em vez de ficar consultando o dashboard.
+# Cada conexão é uma assinatura com a própria fila; publicar() entrega em todas as filas do processo.
+# Com vários workers, EVENTOS_IPC_DIR liga a entrega entre processos: cada worker com assinantes escuta num
+# socket unix de datagrama nessa pasta e quem publica manda o evento pra todos os sockets de lá (sem broker).
+# No servidor WSGI cada conexão segura uma thread; no modo ASGI (asgi.py) o /api/stream é uma corrotina por conexão.
+
+class Assinatura:
+    def __init__(self, tamanho, tipos, mercadoria_id):
+        self.fila = queue.Queue(tamanho)
+        self.tipos = tipos
+        self.mercadoria_id = mercadoria_id
+        self.atrasada = False
+
+    def quer(self, tipo, dados):
+        if self.tipos and tipo not in self.tipos:
+            return False
+        return self.mercadoria_id is None or dados.get('mercadoria_id') in (None, self.mercadoria_id)
+
+    # Põe o evento na fila; False se ela estiver cheia (cliente lento)
+    def colocar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+            return True
+        except queue.Full:
+            return False
+
+# Assinatura lida por uma corrotina (o /api/stream do modo ASGI, veja asgi.py): a fila é do asyncio e a entrega,
+# que vem da thread de quem gravou o movimento ou do socket de IPC, é agendada no loop dela
+class AssinaturaAssincrona(Assinatura):
+    def __init__(self, tamanho, tipos, mercadoria_id, loop):
+        super().__init__(tamanho, tipos, mercadoria_id)
+        self.fila = asyncio.Queue(tamanho)
+        self.loop = loop
+
+    def colocar(self, evento):
+        if self.atrasada or self.loop.is_closed():
+            return False
+        self.loop.call_soon_threadsafe(self.colocar_no_loop, evento)
+        return True
+
+    def colocar_no_loop(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.atrasada = True  # Quem lê a fila encerra a conexão; o canal cancela na próxima entrega
+
+class CanalEventos:
+    def __init__(self, tamanho_fila, pasta_ipc=None):
+        self.tamanho_fila = tamanho_fila
+        self.pasta_ipc = pasta_ipc
+        self.assinaturas = set()
+        self.trava = threading.Lock()
+        self.socket_escuta = None
+        self.pid_escuta = None
+        self.socket_envio = None
+
+    # Com loop (asyncio), a assinatura é lida por uma corrotina desse loop
+    def assinar(self, tipos=None, mercadoria_id=None, loop=None):
+        if loop is None:
+            assinatura = Assinatura(self.tamanho_fila, tipos, mercadoria_id)
+        else:
+            assinatura = AssinaturaAssincrona(self.tamanho_fila, tipos, mercadoria_id, loop)
+        with self.trava:
+            self.assinaturas.add(assinatura)
+            if self.pasta_ipc and self.pid_escuta != os.getpid():
+                self.escutar()
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self.trava:
+            self.assinaturas.discard(assinatura)
+
+    # Entrega nas filas do processo. Cliente lento que deixou a fila encher é desconectado (o navegador
+    # reconecta sozinho e recarrega o estado) em vez de segurar memória ou travar quem publica.
+    def entregar(self, tipo, dados):
+        with self.trava:
+            assinaturas = list(self.assinaturas)
+        for assinatura in assinaturas:
+            if not assinatura.quer(tipo, dados):
+                continue
+            if not assinatura.colocar((tipo, dados)):
+                assinatura.atrasada = True
+                self.cancelar(assinatura)
+
+    def publicar(self, tipo, dados):
+        self.entregar(tipo, dados)
+        if self.pasta_ipc:
+            self.enviar_aos_outros(json.dumps([tipo, dados]).encode())
+
+    # Socket do processo na pasta de IPC (criado na primeira assinatura, de novo depois de um fork)
+    def escutar(self):
+        os.makedirs(self.pasta_ipc, exist_ok=True)
+        caminho = os.path.join(self.pasta_ipc, f"{os.getpid()}.sock")
+        if os.path.exists(caminho):
+            os.remove(caminho)
+        self.socket_escuta = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket_escuta.bind(caminho)
+        self.pid_escuta = os.getpid()
+        threading.Thread(target=self.receber, args=(self.socket_escuta,), daemon=True).start()
+
+    def receber(self, escuta):
+        while True:
+            try:
+                tipo, dados = json.loads(escuta.recv(65536))
+            except (OSError, ValueError):
+                continue
+            self.entregar(tipo, dados)
+
+    def enviar_aos_outros(self, mensagem):
+        if self.socket_envio is None:
+            self.socket_envio = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.socket_envio.setblocking(False)
+        proprio = f"{os.getpid()}.sock"
+        try:
+            nomes = os.listdir(self.pasta_ipc)
+        except FileNotFoundError:
+            return
+        for nome in nomes:
+            if not nome.endswith('.sock') or nome == proprio:
+                continue
+            caminho = os.path.join(self.pasta_ipc, nome)
+            try:
+                self.socket_envio.sendto(mensagem, caminho)
+            except (ConnectionRefusedError, FileNotFoundError):  # Worker que já morreu
+                try:
+                    os.remove(caminho)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:  # Worker com a fila do socket cheia perde esse evento
+                pass
+
+# Cria o canal do app; chamado pelo create_app
+def iniciar_eventos(app):
+    app.extensions['eventos'] = CanalEventos(app.config['EVENTOS_FILA_MAX'], app.config['EVENTOS_IPC_DIR'])
+
+def publicar(tipo, dados):
+    current_app.extensions['eventos'].publicar(tipo, dados)
+
+def formatar_evento(tipo, dados):
+    return f"event: {tipo}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+TIPOS_EVENTO = {'movimento', 'saldo', 'estoque_baixo', 'estoque_normal', 'importacao'}
+
+# Filtros do /api/stream: (tipos ou None, mercadoria_id ou None); tipo desconhecido é ValueError
+def ler_filtros_stream(args):
+    tipos = {tipo for tipo in args.get('tipos', '').split(',') if tipo} or None
+    desconhecidos = (tipos or set()) - TIPOS_EVENTO
+    if desconhecidos:
+        raise ValueError(f"Tipos inválidos: {', '.join(sorted(desconhecidos))}")
+    return tipos, args.get('mercadoria_id', type=int)
+
+# Cabeçalhos da resposta do /api/stream (os mesmos no modo ASGI)
+CABECALHOS_STREAM = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Nginx não segura os eventos no buffer
+}
+
+# API pra receber os eventos ao vivo (Server-Sent Events): movimento, saldo, estoque_baixo e estoque_normal.
+# Opcionais: tipos (separados por vírgula) e mercadoria_id. Sem eventos, manda um comentário de heartbeat.
+@bp.route('/api/stream', methods=['GET'])
+def stream():
+    try:
+        tipos, mercadoria_id = ler_filtros_stream(request.args)
+    except ValueError as erro:
+        return jsonify({"error": str(erro)}), 400
+
+    canal = current_app.extensions['eventos']
+    heartbeat = current_app.config['EVENTOS_HEARTBEAT']
+    assinatura = canal.assinar(tipos, mercadoria_id)
+
+    # Não usa o contexto do app nem o banco: a conexão pode ficar aberta por horas sem segurar nada
+    def gerar():
+        try:
+            yield "retry: 3000\n\n"  # O navegador reconecta 3 s depois de cair
+            while not assinatura.atrasada:
+                try:
+                    tipo, dados = assinatura.fila.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield formatar_evento(tipo, dados)
+        finally:
+            canal.cancelar(assinatura)
+
+    return Response(gerar(), mimetype='text/event-stream', headers=CABECALHOS_STREAM)
@@ -0,0 +1,111 @@
+from flask import Blueprint, current_app, jsonify, request, send_file
+from io import BytesIO
+import click
+import hashlib
+import os
+import uuid
+
+from .banco import leitura_na_replica
+from .metricas import medir_renderizacao
+from .estoque import resumo_do_mes, totais_por_nome
+from .cache import gravar_arquivo_cache
+
+bp = Blueprint('graficos', __name__, cli_group=None)
+
+# Cache dos gráficos mensais em disco, compartilhado entre os workers.
+# Cada mês tem uma versão (arquivo .versao) que vai no nome dos PNGs; gravar um movimento no mês troca a versão,
+# então um gráfico só é servido do cache se foi gerado depois do último movimento daquele mês. Os PNGs de versões
+# antigas ficam sem uso na pasta até o limpar-graficos (a gravação não varre a pasta).
+def caminho_cache_grafico(ano, mes, sufixo):
+    return os.path.join(current_app.config['GRAFICO_CACHE_DIR'], f"grafico_{ano:04d}_{mes:02d}_{sufixo}")
+
+def versao_grafico(ano, mes):
+    try:
+        with open(caminho_cache_grafico(ano, mes, 'versao')) as arquivo:
+            return arquivo.read().strip()
+    except FileNotFoundError:
+        return 'inicial'
+
+def invalidar_graficos(meses):
+    for ano, mes in meses:
+        gravar_arquivo_cache(caminho_cache_grafico(ano, mes, 'versao'), uuid.uuid4().hex.encode())
+
+# Apaga os PNGs de versões antigas (ex.: no cron, junto do fechar-saldos)
+@bp.cli.command('limpar-graficos')
+def limpar_graficos():
+    pasta = current_app.config['GRAFICO_CACHE_DIR']
+    removidos = 0
+    for nome in os.listdir(pasta) if os.path.isdir(pasta) else []:
+        partes = nome.split('_')  # grafico_<ano>_<mes>_<versao>_<opcoes>.png
+        if len(partes) != 5 or not nome.endswith('.png'):
+            continue
+        if partes[3] != versao_grafico(int(partes[1]), int(partes[2])):
+            try:
+                os.remove(os.path.join(pasta, nome))
+                removidos += 1
+            except FileNotFoundError:
+                pass
+    click.echo(f"{removidos} gráfico(s) antigo(s) removido(s)")
+
+
+# Desenha o gráfico do mês com a API orientada a objetos do matplotlib (sem o estado global do pyplot)
+@medir_renderizacao('matplotlib')
+def desenhar_grafico(mes, ano, largura, altura, dpi):
+    from matplotlib.figure import Figure  # Import pesado, só no primeiro gráfico
+
+    # Agrupa por mercadoria
+    entradas_por_mercadoria, saidas_por_mercadoria = totais_por_nome(resumo_do_mes(mes, ano))
+
+    # Cria o gráfico
+    fig = Figure(figsize=(largura, altura))
+    ax = fig.subplots()
+    mercadorias_unicas = sorted(set(entradas_por_mercadoria) | set(saidas_por_mercadoria))
+    entradas_vals = [entradas_por_mercadoria.get(m, 0) for m in mercadorias_unicas]
+    saidas_vals = [saidas_por_mercadoria.get(m, 0) for m in mercadorias_unicas]
+
+    bar_width = 0.35
+    x = range(len(mercadorias_unicas))
+    ax.bar([i - bar_width/2 for i in x], entradas_vals, bar_width, label="Entradas", color="#007aff")
+    ax.bar([i + bar_width/2 for i in x], saidas_vals, bar_width, label="Saídas", color="#ff3b30")
+    ax.set_xticks(list(x))
+    ax.set_xticklabels(mercadorias_unicas, rotation=45)
+    ax.legend()
+    ax.set_title(f"Movimentações - Mês {mes}/{ano}")
+    ax.set_xlabel("Mercadoria")
+    ax.set_ylabel("Quantidade")
+    fig.tight_layout()
+    img = BytesIO()
+    fig.savefig(img, format='png', dpi=dpi)
+    return img.getvalue()
+
+# API pra gráfico (opcionais: largura e altura em polegadas, dpi)
+@bp.route('/api/grafico/<int:mes>/<int:ano>', methods=['GET'])
+@leitura_na_replica
+def gerar_grafico(mes, ano):
+    largura = request.args.get('largura', 10, type=float)
+    altura = request.args.get('altura', 5, type=float)
+    dpi = request.args.get('dpi', 100, type=int)
+    if not (1 <= largura <= 40 and 1 <= altura <= 40 and 50 <= dpi <= 300):
+        return jsonify({"error": "Dimensões do gráfico inválidas"}), 400
+    if not (1 <= mes <= 12 and 1 <= ano <= 9999):
+        return jsonify({"error": "Período inválido"}), 400
+
+    # A versão é lida antes dos dados: se chegar um movimento durante o desenho, o PNG já nasce desatualizado
+    versao = versao_grafico(ano, mes)
+    opcoes = hashlib.sha1(f"{largura}:{altura}:{dpi}".encode()).hexdigest()[:16]
+    caminho = caminho_cache_grafico(ano, mes, f"{versao}_{opcoes}.png")
+    try:
+        with open(caminho, 'rb') as arquivo:
+            png = arquivo.read()
+    except FileNotFoundError:
+        png = desenhar_grafico(mes, ano, largura, altura, dpi)
+        gravar_arquivo_cache(caminho, png)
+
+    resposta = send_file(
+        BytesIO(png),
+        mimetype='image/png',
+        etag=hashlib.sha1(png).hexdigest(),
+        last_modified=os.path.getmtime(caminho) if os.path.exists(caminho) else None
+    )
+    resposta.cache_control.no_cache = True  # O navegador revalida com If-None-Match/If-Modified-Since
+    return resposta
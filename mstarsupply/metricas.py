@@ -0,0 +1,157 @@
+from flask import Blueprint, Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import Counter
+import functools
+import threading
+import time
+
+bp = Blueprint('metricas', __name__)
+
+# Instrumentação: latência por rota, consultas SQL e tempo de banco por requisição e tempo de renderização
+# (matplotlib/reportlab), tudo exposto em /api/metrics no formato texto do Prometheus.
+# Os contadores são do processo: com vários workers do servidor, cada um expõe os seus.
+# Renderizações feitas no pool de relatórios contam nos processos do pool, não aparecem aqui.
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+trava_metricas = threading.Lock()
+histogramas = {}  # (nome, labels) -> [contagem por bucket..., soma, total]
+contadores = Counter()  # (nome, labels) -> valor
+
+def observar(nome, labels, valor, buckets=BUCKETS_SEGUNDOS):
+    with trava_metricas:
+        serie = histogramas.setdefault((nome, labels), [0] * len(buckets) + [0.0, 0])
+        for i, limite in enumerate(buckets):
+            if valor <= limite:
+                serie[i] += 1
+        serie[-2] += valor
+        serie[-1] += 1
+
+def incrementar(nome, labels, valor=1):
+    with trava_metricas:
+        contadores[(nome, labels)] += valor
+
+# Contagem e tempo das consultas, guardados no g do contexto atual (requisição ou job)
+@event.listens_for(Engine, 'before_cursor_execute')
+def antes_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.inicio_consulta = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def depois_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    if not has_app_context() or 'inicio_consulta' not in g:
+        return
+    g.consultas_sql = g.get('consultas_sql', 0) + 1
+    g.tempo_sql = g.get('tempo_sql', 0.0) + time.perf_counter() - g.pop('inicio_consulta')
+    if current_app.config['AVISO_N_MAIS_UM']:
+        g.setdefault('sql_repetidos', Counter())[statement] += 1
+
+# Decorator pra medir o tempo de renderização de uma função, sem contar o tempo gasto no banco dentro dela
+def medir_renderizacao(motor):
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            sql_antes = g.get('tempo_sql', 0.0) if has_app_context() else 0.0
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                sql_durante = (g.get('tempo_sql', 0.0) if has_app_context() else 0.0) - sql_antes
+                duracao = max(time.perf_counter() - inicio - sql_durante, 0.0)
+                observar('mstarsupply_renderizacao_segundos', (('motor', motor),), duracao)
+                if has_app_context():
+                    g.tempo_renderizacao = g.get('tempo_renderizacao', 0.0) + duracao
+        return medida
+    return decorador
+
+@bp.before_app_request
+def iniciar_medicao():
+    g.inicio_requisicao = time.perf_counter()
+
+# Devolve a medição da requisição também no cabeçalho Server-Timing (aparece no DevTools do navegador).
+# Em respostas em streaming o corpo ainda vai ser gerado: a medição só é registrada quando a resposta fecha
+# (send_file usa direct_passthrough, que não chama os callbacks de fechamento, e já tem o corpo pronto).
+@bp.after_app_request
+def cabecalho_server_timing(resposta):
+    if 'inicio_requisicao' not in g:
+        return resposta
+    resposta.headers['Server-Timing'] = server_timing(g)
+    g.status_resposta = resposta.status_code
+    if resposta.is_streamed and not resposta.direct_passthrough:
+        g.medicao_no_fechamento = True
+        resposta.call_on_close(functools.partial(
+            registrar_medicao, current_app._get_current_object(), request.url_rule, request.method, g._get_current_object()
+        ))
+    return resposta
+
+# Valor do Server-Timing da medição em andamento (g da requisição; o asgi.py usa nas rotas nativas)
+def server_timing(dados):
+    partes = [
+        f'db;dur={dados.get("tempo_sql", 0.0) * 1000:.1f};desc="{dados.get("consultas_sql", 0)} consultas"',
+        f'app;dur={(time.perf_counter() - dados.inicio_requisicao) * 1000:.1f}',
+    ]
+    if 'tempo_renderizacao' in dados:
+        partes.append(f'render;dur={dados.tempo_renderizacao * 1000:.1f}')
+    return ', '.join(partes)
+
+@bp.teardown_app_request
+def encerrar_medicao(erro=None):
+    if 'inicio_requisicao' in g and not g.get('medicao_no_fechamento'):
+        if erro is not None:
+            g.status_resposta = 500
+        registrar_medicao(current_app, request.url_rule, request.method, g)
+
+# Recebe o app porque nas respostas em streaming roda no fechamento, quando o contexto já saiu
+def registrar_medicao(app, regra, metodo, dados):
+    rota = regra.rule if regra else 'desconhecida'
+    labels = (('rota', rota), ('metodo', metodo))
+    consultas = dados.get('consultas_sql', 0)
+    tempo_sql = dados.get('tempo_sql', 0.0)
+    observar('mstarsupply_requisicao_segundos', labels, time.perf_counter() - dados.inicio_requisicao)
+    observar('mstarsupply_consultas_por_requisicao', labels, consultas, BUCKETS_CONSULTAS)
+    incrementar('mstarsupply_sql_consultas_total', labels, consultas)
+    incrementar('mstarsupply_sql_segundos_total', labels, tempo_sql)
+    if dados.get('status_resposta', 200) >= 500:
+        incrementar('mstarsupply_requisicao_erros_total', labels)
+
+    limite = app.config['AVISO_N_MAIS_UM']
+    if limite and consultas > limite:
+        repetidas = dados.get('sql_repetidos') or Counter({'': 0})
+        consulta, vezes = repetidas.most_common(1)[0]
+        app.logger.warning(
+            "Possível N+1 em %s %s: %d consultas (%.1f ms no banco); mais repetida (%dx): %s",
+            metodo, rota, consultas, tempo_sql * 1000, vezes, ' '.join(consulta.split())[:300]
+        )
+
+def formatar_labels(labels, extra=()):
+    pares = labels + extra
+    if not pares:
+        return ''
+    escapar = lambda valor: str(valor).replace('\\', '\\\\').replace('"', '\\"')
+    return '{' + ','.join(f'{nome}="{escapar(valor)}"' for nome, valor in pares) + '}'
+
+# API pra métricas no formato texto do Prometheus
+@bp.route('/api/metrics', methods=['GET'])
+def metricas():
+    with trava_metricas:
+        copia_histogramas = {chave: list(serie) for chave, serie in histogramas.items()}
+        copia_contadores = dict(contadores)
+
+    linhas = []
+    for nome in sorted({nome for nome, _ in copia_histogramas}):
+        buckets = BUCKETS_CONSULTAS if nome == 'mstarsupply_consultas_por_requisicao' else BUCKETS_SEGUNDOS
+        linhas.append(f'# TYPE {nome} histogram')
+        for (nome_serie, labels), serie in sorted(copia_histogramas.items()):
+            if nome_serie != nome:
+                continue
+            for limite, quantidade in zip(buckets, serie):
+                linhas.append(f'{nome}_bucket{formatar_labels(labels, (("le", limite),))} {quantidade}')
+            linhas.append(f'{nome}_bucket{formatar_labels(labels, (("le", "+Inf"),))} {serie[-1]}')
+            linhas.append(f'{nome}_sum{formatar_labels(labels)} {serie[-2]}')
+            linhas.append(f'{nome}_count{formatar_labels(labels)} {serie[-1]}')
+    for nome in sorted({nome for nome, _ in copia_contadores}):
+        linhas.append(f'# TYPE {nome} counter')
+        for (nome_serie, labels), valor in sorted(copia_contadores.items()):
+            if nome_serie == nome:
+                linhas.append(f'{nome}{formatar_labels(labels)} {valor}')
+    return Response('\n'.join(linhas) + '\n', mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,160 @@
+from .banco import db
+
+# Modelos das tabelas
+class Mercadoria(db.Model):
+    __tablename__ = 'Mercadorias'
+    __table_args__ = (
+        # Índice FULLTEXT da busca, só existe no MySQL
+        db.Index('ft_mercadorias_busca', 'nome', 'numero_registro', 'fabricante', 'tipo', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100), nullable=False, index=True)
+    numero_registro = db.Column(db.String(50), unique=True, nullable=False)
+    fabricante = db.Column(db.String(100), nullable=False)
+    tipo = db.Column(db.String(50), nullable=False)
+    descricao = db.Column(db.Text)
+    custo_unitario = db.Column(db.Float, nullable=False, default=0.0)  # Custo padrão das entradas que chegam sem custo
+
+class Entrada(db.Model):
+    __tablename__ = 'Entradas'
+    __table_args__ = (
+        db.Index('ix_entradas_data_hora_mercadoria', 'data_hora', 'mercadoria_id'),
+        db.Index('ix_entradas_mercadoria_data_hora', 'mercadoria_id', 'data_hora'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    mercadoria_id = db.Column(db.Integer, db.ForeignKey('Mercadorias.id'), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False)
+    data_hora = db.Column(db.DateTime, nullable=False)
+    local = db.Column(db.String(100), nullable=False)
+    # Custo unitário desta entrada (None nas entradas antigas: o razão usa o custo_unitario da mercadoria)
+    custo_unitario = db.Column(db.Float)
+
+class Saida(db.Model):
+    __tablename__ = 'Saidas'
+    __table_args__ = (
+        db.Index('ix_saidas_data_hora_mercadoria', 'data_hora', 'mercadoria_id'),
+        db.Index('ix_saidas_mercadoria_data_hora', 'mercadoria_id', 'data_hora'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    mercadoria_id = db.Column(db.Integer, db.ForeignKey('Mercadorias.id'), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False)
+    data_hora = db.Column(db.DateTime, nullable=False)
+    local = db.Column(db.String(100), nullable=False)
+    # Custo unitário da baixa pelo método de custeio (média ou fifo), calculado quando a saída foi gravada
+    custo_unitario = db.Column(db.Float)
+
+# Tabelas de arquivo (flask arquivar): entradas e saídas de meses antigos, já com saldo fechado, saem das tabelas
+# quentes pra cá com o mesmo id e as mesmas colunas. As leituras por período juntam as duas quando precisa.
+class EntradaArquivada(db.Model):
+    __tablename__ = 'EntradasArquivo'
+    __table_args__ = (
+        db.Index('ix_entradas_arquivo_data_hora_mercadoria', 'data_hora', 'mercadoria_id'),
+        db.Index('ix_entradas_arquivo_mercadoria_data_hora', 'mercadoria_id', 'data_hora'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    mercadoria_id = db.Column(db.Integer, db.ForeignKey('Mercadorias.id'), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False)
+    data_hora = db.Column(db.DateTime, nullable=False)
+    local = db.Column(db.String(100), nullable=False)
+    custo_unitario = db.Column(db.Float)
+
+class SaidaArquivada(db.Model):
+    __tablename__ = 'SaidasArquivo'
+    __table_args__ = (
+        db.Index('ix_saidas_arquivo_data_hora_mercadoria', 'data_hora', 'mercadoria_id'),
+        db.Index('ix_saidas_arquivo_mercadoria_data_hora', 'mercadoria_id', 'data_hora'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    mercadoria_id = db.Column(db.Integer, db.ForeignKey('Mercadorias.id'), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False)
+    data_hora = db.Column(db.DateTime, nullable=False)
+    local = db.Column(db.String(100), nullable=False)
+    custo_unitario = db.Column(db.Float)
+
+# Um registro por arquivamento: movimentos com data antes de corte podem estar nas tabelas de arquivo
+class Arquivamento(db.Model):
+    __tablename__ = 'Arquivamentos'
+    id = db.Column(db.Integer, primary_key=True)
+    corte = db.Column(db.DateTime, nullable=False, index=True)
+    iniciado_em = db.Column(db.DateTime, nullable=False)
+    concluido_em = db.Column(db.DateTime)
+    entradas = db.Column(db.Integer, nullable=False, default=0)  # Linhas movidas
+    saidas = db.Column(db.Integer, nullable=False, default=0)
+
+# Abaixo desse saldo a mercadoria entra em alerta de estoque baixo
+LIMITE_ESTOQUE_BAIXO = 5
+
+# Saldo materializado por mercadoria, atualizado junto com cada entrada/saída.
+# valor é o custo do que está em estoque (o razão de custos): custo médio = valor / saldo.
+class SaldoMercadoria(db.Model):
+    __tablename__ = 'SaldosMercadorias'
+    mercadoria_id = db.Column(db.Integer, db.ForeignKey('Mercadorias.id'), primary_key=True)
+    total_entradas = db.Column(db.Integer, nullable=False, default=0)
+    total_saidas = db.Column(db.Integer, nullable=False, default=0)
+    saldo = db.Column(db.Integer, nullable=False, default=0, index=True)
+    valor = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+
+# Camadas do custeio fifo: o que resta de cada entrada com o custo dela, consumidas da mais antiga pra mais
+# nova pelas saídas. Só são mantidas com CUSTEIO = 'fifo'.
+class CamadaCusto(db.Model):
+    __tablename__ = 'CamadasCusto'
+    __table_args__ = (
+        db.Index('ix_camadas_custo_mercadoria_data_hora', 'mercadoria_id', 'data_hora', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    mercadoria_id = db.Column(db.Integer, db.ForeignKey('Mercadorias.id'), nullable=False)
+    data_hora = db.Column(db.DateTime, nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False)  # Quanto ainda resta da entrada
+    custo_unitario = db.Column(db.Float, nullable=False)
+
+# Totais mensais por mercadoria (entradas, saídas e custo), mantidos a cada movimento gravado.
+# custo_entradas soma o custo de cada entrada e custo_saidas o custo das baixas pelo razão; saldo_final e
+# valor_final são o saldo e o valor do estoque da mercadoria no fim do mês (a valorização do mês).
+class ResumoMensal(db.Model):
+    __tablename__ = 'ResumosMensais'
+    mercadoria_id = db.Column(db.Integer, db.ForeignKey('Mercadorias.id'), primary_key=True)
+    ano = db.Column(db.Integer, primary_key=True)
+    mes = db.Column(db.Integer, primary_key=True)
+    entradas = db.Column(db.Integer, nullable=False, default=0)
+    saidas = db.Column(db.Integer, nullable=False, default=0)
+    custo_entradas = db.Column(db.Float, nullable=False, default=0.0)
+    custo_saidas = db.Column(db.Float, nullable=False, default=0.0)
+    saldo_final = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    valor_final = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    __table_args__ = (
+        db.Index('ix_resumos_mensais_periodo', 'ano', 'mes', 'mercadoria_id'),
+    )
+
+# Fechamentos de saldo: o saldo de cada mercadoria já movimentada no fim de cada mês encerrado (flask fechar-saldos).
+# Ao contrário dos resumos mensais, todo mês fechado tem a linha de todas as mercadorias, então o saldo numa data
+# é o fechamento anterior mais os movimentos desde ele.
+class FechamentoSaldo(db.Model):
+    __tablename__ = 'FechamentosSaldos'
+    mercadoria_id = db.Column(db.Integer, db.ForeignKey('Mercadorias.id'), primary_key=True)
+    ano = db.Column(db.Integer, primary_key=True)
+    mes = db.Column(db.Integer, primary_key=True)
+    saldo = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index('ix_fechamentos_saldos_periodo', 'ano', 'mes', 'mercadoria_id'),
+    )
+
+# Fila de relatórios gerados em segundo plano (uma linha por pedido, deduplicada pela chave)
+class RelatorioJob(db.Model):
+    __tablename__ = 'RelatoriosJobs'
+    __table_args__ = (
+        db.Index('ix_relatorios_jobs_periodo', 'ano', 'mes'),  # invalidar_relatorios, a cada movimento gravado
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    chave = db.Column(db.String(100), unique=True, nullable=False)  # tipo:ano:mes
+    tipo = db.Column(db.String(50), nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    ano = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, processando, concluido, desatualizado, erro
+    # Sobe quando chega movimento no mês com o job em andamento: o arquivo gerado antes disso é descartado e refeito
+    versao = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    arquivo = db.Column(db.String(255))
+    erro = db.Column(db.Text)
+    criado_em = db.Column(db.DateTime, nullable=False)
+    # Último aviso do processo que tem o job na fila de que ele continua vivo (sem aviso há 3 pulsos, é retomado)
+    pulso_em = db.Column(db.DateTime)
+    concluido_em = db.Column(db.DateTime)
@@ -0,0 +1,293 @@
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from io import BytesIO
+from datetime import datetime
+from itertools import accumulate
+import threading
+
+from reportlab import rl_config
+from reportlab.graphics.shapes import Drawing, Rect, String
+from reportlab.lib.colors import Color
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import BaseDocTemplate, Flowable, Frame, HRFlowable, KeepTogether, PageTemplate, Paragraph
+
+# Motor dos relatórios em PDF (platypus). Importa o reportlab, então só é importado dentro das funções
+# que geram PDF (os workers sobem sem ele).
+# O cabeçalho (título, mês e a linha) e o rodapé ficam no PageTemplate: são desenhados uma vez num form
+# XObject e cada página só carimba o form e o número. As linhas vão na TabelaLonga, com as cores por coluna
+# e por faixa de linhas, em vez de um setFillColorRGB/drawString por célula.
+
+# Streams comprimidos em binário, sem a codificação ASCII85 (lenta e só aumenta o arquivo). O reportlab só tem isso
+# na config global (rl_config.useA85, lida durante o build), então é desligado só enquanto algum PDF daqui está sendo
+# montado e volta ao valor de antes quando o último termina (outros usos do reportlab no processo não mudam).
+trava_ascii85 = threading.Lock()
+montando = {"pdfs": 0, "useA85": None}
+
+@contextmanager
+def sem_ascii85():
+    with trava_ascii85:
+        if montando["pdfs"] == 0:
+            montando["useA85"] = rl_config.useA85
+            rl_config.useA85 = 0
+        montando["pdfs"] += 1
+    try:
+        yield
+    finally:
+        with trava_ascii85:
+            montando["pdfs"] -= 1
+            if montando["pdfs"] == 0:
+                rl_config.useA85 = montando["useA85"]
+
+MARGEM = 40
+LARGURA_PAGINA, ALTURA_PAGINA = 612, 792  # letter
+LARGURA_UTIL = LARGURA_PAGINA - 2 * MARGEM
+ALTURA_CABECALHO = 65  # Título, mês e a linha de separação
+
+PRETO = Color(0, 0, 0)
+AZUL = Color(0, 0.48, 1)
+VERMELHO = Color(1, 0.23, 0.19)
+VERDE = Color(0, 0.5, 0)
+CINZA_ESCURO = Color(0.2, 0.2, 0.2)
+CINZA_MEDIO = Color(0.3, 0.3, 0.3)
+CINZA_TEXTO = Color(0.4, 0.4, 0.4)
+CINZA_RODAPE = Color(0.6, 0.6, 0.6)
+CINZA_LINHA = Color(0.9, 0.9, 0.9)
+CINZA_FUNDO = Color(0.95, 0.95, 0.95)
+
+def texto_gerado_em():
+    return f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+
+def numerar_pagina(tela, numero):
+    tela.setFont("Helvetica", 8)
+    tela.setFillColor(CINZA_RODAPE)
+    tela.drawString(LARGURA_PAGINA - MARGEM - 50, MARGEM - 10, f"Página {numero}")
+
+# Monta o PDF em destino (arquivo ou buffer) com os elementos (flowables) e devolve o número de páginas.
+# numerar=False deixa o número da página de fora (as partes geradas em paralelo são numeradas depois de juntar).
+def gerar_pdf(destino, titulo, mes, ano, elementos, gerado_em=None, numerar=True):
+    gerado_em = gerado_em or texto_gerado_em()
+
+    def moldura(tela, documento):
+        if not tela.hasForm('moldura'):
+            tela.beginForm('moldura')
+            topo = ALTURA_PAGINA - MARGEM
+            tela.setFont("Helvetica-Bold", 20)
+            tela.setFillColor(PRETO)
+            tela.drawString(MARGEM, topo, titulo)
+            tela.setFont("Helvetica", 12)
+            tela.setFillColor(CINZA_TEXTO)
+            tela.drawString(MARGEM, topo - 25, f"Mês {mes:02d}/{ano}")
+            tela.setStrokeColor(CINZA_LINHA)
+            tela.setLineWidth(0.5)
+            tela.line(MARGEM, topo - 45, LARGURA_PAGINA - MARGEM, topo - 45)
+            tela.setFont("Helvetica", 8)
+            tela.setFillColor(CINZA_RODAPE)
+            tela.drawString(MARGEM, MARGEM - 10, gerado_em)
+            tela.endForm()
+        tela.doForm('moldura')
+        if numerar:
+            numerar_pagina(tela, documento.page)
+
+    documento = BaseDocTemplate(destino, pagesize=(LARGURA_PAGINA, ALTURA_PAGINA), title=titulo)
+    quadro = Frame(MARGEM, MARGEM, LARGURA_UTIL, ALTURA_PAGINA - 2 * MARGEM - ALTURA_CABECALHO,
+                   leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+    documento.addPageTemplates([PageTemplate(id='pagina', frames=[quadro], onPage=moldura)])
+    with sem_ascii85():
+        documento.build(elementos)
+    return documento.page
+
+# Junta os PDFs das partes (bytes, na ordem) e numera as páginas do resultado; precisa do pypdf
+def juntar_pdfs(partes, destino):
+    from pypdf import PdfReader, PdfWriter
+
+    escritor = PdfWriter()
+    for parte in partes:
+        escritor.append(PdfReader(BytesIO(parte)))
+
+    # Uma página só com o número pra cada página do resultado, carimbada por cima
+    numeros = BytesIO()
+    with sem_ascii85():
+        carimbos = canvas.Canvas(numeros, pagesize=(LARGURA_PAGINA, ALTURA_PAGINA))
+        for numero in range(1, len(escritor.pages) + 1):
+            numerar_pagina(carimbos, numero)
+            carimbos.showPage()
+        carimbos.save()
+    for pagina, carimbo in zip(escritor.pages, PdfReader(numeros).pages):
+        pagina.merge_page(carimbo)
+        pagina.compress_content_streams()  # O merge descomprime o conteúdo da página
+    escritor.write(destino)
+    return len(escritor.pages)
+
+def paragrafo(texto, tamanho=10, negrito=False, cor=PRETO, recuo=0, antes=0, depois=0):
+    estilo = ParagraphStyle(
+        'texto', fontName="Helvetica-Bold" if negrito else "Helvetica", fontSize=tamanho, leading=20 if tamanho > 10 else 15,
+        textColor=cor, leftIndent=recuo, spaceBefore=antes, spaceAfter=depois,
+    )
+    return Paragraph(texto.replace('&', '&amp;').replace('<', '&lt;'), estilo)
+
+def separador(espaco=20):
+    return HRFlowable(width='100%', thickness=0.5, color=CINZA_LINHA, spaceBefore=espaco / 2, spaceAfter=espaco / 2)
+
+# Tabela paginada sem custo quadrático e desenhada em lote. A Table do reportlab, a cada quebra de página,
+# monta outra Table com todas as linhas que sobraram, e desenha cada célula com o próprio objeto de texto.
+# Aqui as alturas das linhas são fixas: a quebra é uma busca no acumulado das alturas e cada página vira uma
+# fatia [inicio, fim) dos mesmos dados, desenhada com um objeto de texto só (fonte e cor trocadas só quando
+# mudam), a grade num path só e o cabeçalho repetido no topo.
+# colunas: [(título, largura, alinhamento 'LEFT' ou 'CENTER', cor)]; alturas: altura de cada linha.
+# faixas: [(primeira, ultima, estilo)] por índice das linhas, em ordem (faixas da mesma linha podem se repetir);
+# estilo é um dict com fonte (nome, tamanho), cor (todas as colunas), cores ({coluna: cor}), recuo, fundo e
+# linha_abaixo (espessura).
+class TabelaLonga(Flowable):
+    def __init__(self, colunas, linhas, alturas, faixas=(), grade=True, cabecalho=("Helvetica-Bold", 9, CINZA_ESCURO, 20),
+                 antes=0, inicio=0, fim=None, acumulado=None, fins=None):
+        super().__init__()
+        self.colunas = colunas
+        self.linhas = linhas
+        self.alturas = alturas
+        self.faixas = faixas
+        self.grade = grade
+        self.cabecalho = cabecalho
+        self.spaceBefore = antes
+        self.inicio = inicio
+        self.fim = len(linhas) if fim is None else fim
+        self.acumulado = acumulado or [0] + list(accumulate(alturas))
+        self.fins = fins or [ultima for _, ultima, _ in faixas]
+
+    def fatia(self, inicio, fim, antes=0):
+        return TabelaLonga(self.colunas, self.linhas, self.alturas, self.faixas, self.grade, self.cabecalho,
+                           antes, inicio, fim, self.acumulado, self.fins)
+
+    def wrap(self, largura_disponivel, altura_disponivel):
+        self.width = sum(largura for _, largura, _, _ in self.colunas)
+        self.height = self.cabecalho[3] + self.acumulado[self.fim] - self.acumulado[self.inicio]
+        return self.width, self.height
+
+    def split(self, largura_disponivel, altura_disponivel):
+        espaco = altura_disponivel - self.cabecalho[3]
+        fim = min(bisect_right(self.acumulado, self.acumulado[self.inicio] + espaco) - 1, self.fim)
+        if fim <= self.inicio:
+            return []  # Não cabe nem uma linha: vai inteira pra próxima página
+        return [self.fatia(self.inicio, fim, self.spaceBefore), self.fatia(fim, self.fim)]
+
+    # Estilos das faixas que caem nesta fatia, por linha
+    def estilos_das_linhas(self):
+        estilos = {}
+        for primeira, ultima, estilo in self.faixas[bisect_left(self.fins, self.inicio):]:
+            if primeira >= self.fim:
+                break
+            for indice in range(max(primeira, self.inicio), min(ultima, self.fim - 1) + 1):
+                estilos.setdefault(indice, []).append(estilo)
+        return estilos
+
+    def draw(self):
+        tela = self.canv
+        fonte_cabecalho, tamanho_cabecalho, cor_cabecalho, altura_cabecalho = self.cabecalho
+        xs = [0] + list(accumulate(largura for _, largura, _, _ in self.colunas))
+        recuo_padrao = 5 if self.grade else 0
+        texto = tela.beginText()
+        atual = {}  # Fonte e cor em uso no objeto de texto
+
+        def escrever(celulas, base, fonte, tamanho, cores, recuo):
+            if atual.get('fonte') != (fonte, tamanho):
+                texto.setFont(fonte, tamanho)
+                atual['fonte'] = (fonte, tamanho)
+            for indice, celula in enumerate(celulas):
+                if not celula:
+                    continue
+                if atual.get('cor') != cores[indice]:
+                    texto.setFillColor(cores[indice])
+                    atual['cor'] = cores[indice]
+                _, largura, alinhamento, _ = self.colunas[indice]
+                if alinhamento == 'CENTER':
+                    x = xs[indice] + (largura - stringWidth(celula, fonte, tamanho)) / 2
+                else:
+                    x = xs[indice] + recuo
+                texto.setTextOrigin(x, base)
+                texto.textOut(celula)
+
+        y = self.height
+        grossas = []
+        if self.grade:
+            tela.setFillColor(CINZA_FUNDO)
+            tela.rect(0, y - altura_cabecalho, xs[-1], altura_cabecalho, fill=1, stroke=0)
+            grossas.append(y - altura_cabecalho)
+        escrever([titulo for titulo, _, _, _ in self.colunas], y - altura_cabecalho / 2 - tamanho_cabecalho * 0.35,
+                 fonte_cabecalho, tamanho_cabecalho, [cor_cabecalho] * len(self.colunas), recuo_padrao)
+        y -= altura_cabecalho
+        ys = [self.height, y]
+
+        cores_padrao = [cor for _, _, _, cor in self.colunas]
+        estilos = self.estilos_das_linhas()
+        for indice in range(self.inicio, self.fim):
+            fonte, tamanho, cores, recuo = "Helvetica", 9, cores_padrao, recuo_padrao
+            for estilo in estilos.get(indice, ()):
+                fonte, tamanho = estilo.get('fonte', (fonte, tamanho))
+                recuo = estilo.get('recuo', recuo)
+                if 'cor' in estilo:
+                    cores = [estilo['cor']] * len(cores)
+                if 'cores' in estilo:
+                    cores = [estilo['cores'].get(coluna, cor) for coluna, cor in enumerate(cores)]
+                if 'fundo' in estilo:
+                    tela.setFillColor(estilo['fundo'])
+                    tela.rect(0, y - self.alturas[indice], xs[-1], self.alturas[indice], fill=1, stroke=0)
+                if 'linha_abaixo' in estilo:
+                    grossas.append(y - self.alturas[indice])
+            escrever(self.linhas[indice], y - 7.5 - tamanho * 0.35, fonte, tamanho, cores, recuo)
+            y -= self.alturas[indice]
+            ys.append(y)
+        tela.drawText(texto)
+
+        if self.grade:
+            tela.setStrokeColor(CINZA_LINHA)
+            tela.setLineWidth(0.5)
+            tela.grid(xs, ys)
+            tela.setLineWidth(1.0)
+            tela.lines([(0, linha, xs[-1], linha) for linha in grossas])
+
+# Tabela com a grade clara e o cabeçalho cinza em cada página.
+# colunas: [(título, largura, alinhamento)]; cores: {coluna: cor} (o resto em cinza); faixas: estilos por
+# linha (veja TabelaLonga); total: linha final em negrito com fundo cinza.
+def tabela(colunas, linhas, cores=None, faixas=(), total=None):
+    cores = cores or {}
+    colunas = [(titulo, largura, alinhamento, cores.get(indice, CINZA_MEDIO))
+               for indice, (titulo, largura, alinhamento) in enumerate(colunas)]
+    faixas = list(faixas)
+    if total is not None:
+        linhas = linhas + [total]
+        faixas.append((len(linhas) - 1, len(linhas) - 1, {
+            "fonte": ("Helvetica-Bold", 9), "cores": {0: PRETO}, "fundo": CINZA_FUNDO, "linha_abaixo": 1.0,
+        }))
+    return TabelaLonga(colunas, linhas, [15] * len(linhas), faixas)
+
+# Lista de linhas de texto numa coluna só (histórico), com o título repetido no topo de cada página.
+# linhas: [(texto, tamanho, negrito, cor, recuo, altura)]; linhas seguidas com o mesmo estilo viram uma faixa só.
+def lista(titulo, linhas, antes=20):
+    faixas = []
+    inicio = 0
+    for indice in range(1, len(linhas) + 1):
+        if indice == len(linhas) or linhas[indice][1:5] != linhas[inicio][1:5]:
+            tamanho, negrito, cor, recuo = linhas[inicio][1:5]
+            faixas.append((inicio, indice - 1, {
+                "fonte": ("Helvetica-Bold" if negrito else "Helvetica", tamanho), "cor": cor, "recuo": recuo,
+            }))
+            inicio = indice
+    return TabelaLonga([(titulo, LARGURA_UTIL, 'LEFT', PRETO)], [[linha[0]] for linha in linhas],
+                       [linha[5] for linha in linhas], faixas, grade=False,
+                       cabecalho=("Helvetica-Bold", 14, PRETO, 20), antes=antes)
+
+# Gráfico de barras simples (valores: [(rótulo, total)]) com o título, sem quebrar entre páginas
+def grafico_barras(titulo, valores, largura_barra=60, espaco=20, altura_maxima=150):
+    maior = max((total for _, total in valores), default=1) or 1
+    topo = altura_maxima + 10
+    desenho = Drawing(LARGURA_UTIL, altura_maxima + 25)
+    x = 0
+    for rotulo, total in valores:
+        altura = total / maior * altura_maxima
+        desenho.add(Rect(x, topo - altura, largura_barra, altura, fillColor=CINZA_RODAPE, strokeColor=None))
+        for texto, y in ((rotulo[:10], topo + 5), (str(total), topo - altura - 10)):
+            desenho.add(String(x + largura_barra / 2, y, texto, fontName="Helvetica", fontSize=8,
+                               fillColor=CINZA_MEDIO, textAnchor='middle'))
+        x += largura_barra + espaco
+    return KeepTogether([paragrafo(titulo, 14, negrito=True, antes=20), desenho])
@@ -0,0 +1,677 @@
+from flask import Blueprint, Response, current_app, g, jsonify, request, send_file, stream_with_context
+from io import StringIO
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy.exc import IntegrityError
+import csv
+import os
+import threading
+import time
+
+from .banco import db, ler_na_replica, leitura_na_replica
+from .metricas import medir_renderizacao
+from .modelos import Mercadoria, Entrada, Saida, RelatorioJob
+from .estoque import filtro_do_mes, movimentos_do_mes, linhas_resumo_do_mes, novo_total_geral, somar_no_total, resumo_do_mes, totais_por_nome
+from .cache import gravar_arquivo_cache, resposta_em_cache
+
+# Relatórios mensais (PDF e CSV) e a fila de relatórios em segundo plano
+bp = Blueprint('relatorios', __name__)
+
+# Filtros dos movimentos do mês; de/ate limitam a uma faixa de ids de mercadoria (as fatias do histórico
+# geradas em paralelo)
+def filtros_historico(modelo, mes, ano, de=None, ate=None):
+    filtros = [filtro_do_mes(modelo.data_hora, mes, ano)]
+    if de is not None:
+        filtros.append(modelo.mercadoria_id.between(de, ate))
+    return filtros
+
+# Entradas e saídas do mês agrupadas por mercadoria numa passada só: {id: ([entradas], [saidas])}, cada
+# movimento com quantidade, data_hora e local (só as colunas, sem montar objetos do ORM).
+# Com limite > 0 ficam só as limite maiores movimentações de cada tipo por mercadoria (o corte é feito no
+# banco), e cada linha traz também total_movimentos e total_quantidade da mercadoria no mês.
+def historico_do_mes(mes, ano, de=None, ate=None, limite=0):
+    historico = {}
+    for posicao, modelo in enumerate((Entrada, Saida)):
+        modelo = movimentos_do_mes(db.session, modelo, mes, ano)
+        colunas = [modelo.mercadoria_id, modelo.quantidade, modelo.data_hora, modelo.local]
+        filtros = filtros_historico(modelo, mes, ano, de, ate)
+        if limite:
+            movimentos = db.select(
+                *colunas, modelo.id,
+                db.func.row_number().over(partition_by=modelo.mercadoria_id,
+                                          order_by=(modelo.quantidade.desc(), modelo.id)).label('ordem'),
+                db.func.count().over(partition_by=modelo.mercadoria_id).label('total_movimentos'),
+                db.func.sum(modelo.quantidade).over(partition_by=modelo.mercadoria_id).label('total_quantidade'),
+            ).where(*filtros).subquery()
+            consulta = db.select(movimentos).where(movimentos.c.ordem <= limite).order_by(
+                movimentos.c.mercadoria_id, movimentos.c.id)
+        else:
+            consulta = db.select(*colunas).where(*filtros).order_by(modelo.mercadoria_id, modelo.id)
+        for movimento in db.session.execute(consulta):
+            historico.setdefault(movimento.mercadoria_id, ([], []))[posicao].append(movimento)
+    return historico
+
+# Totais do mês por mercadoria e dia, somados no banco: {id: ([entradas], [saidas])}, cada linha com dia,
+# quantidade e movimentos
+def historico_diario(mes, ano, de=None, ate=None):
+    historico = {}
+    for posicao, modelo in enumerate((Entrada, Saida)):
+        modelo = movimentos_do_mes(db.session, modelo, mes, ano)
+        dia = db.func.date(modelo.data_hora).label('dia')
+        consulta = db.select(
+            modelo.mercadoria_id, dia, db.func.sum(modelo.quantidade).label('quantidade'), db.func.count().label('movimentos')
+        ).where(*filtros_historico(modelo, mes, ano, de, ate)).group_by(modelo.mercadoria_id, dia).order_by(modelo.mercadoria_id, dia)
+        for linha in db.session.execute(consulta):
+            historico.setdefault(linha.mercadoria_id, ([], []))[posicao].append(linha)
+    return historico
+
+# Como o histórico entra no PDF mensal: completo (uma linha por movimento, limitado ou não), diario (totais
+# por dia) ou nenhum (só o resumo). O detalhe completo fica no anexo (/api/relatorio/<mes>/<ano>/anexo).
+HISTORICOS_RELATORIO = ('completo', 'diario', 'nenhum')
+HISTORICO_COMPLETO = {"historico": "completo", "limite": 0}
+
+# Opções do histórico vindas da query string (?historico=diario&limite=20), com os padrões da configuração
+def opcoes_historico(args):
+    historico = args.get('historico', current_app.config['RELATORIO_HISTORICO'])
+    if historico not in HISTORICOS_RELATORIO:
+        raise ValueError(f"historico inválido: use {', '.join(HISTORICOS_RELATORIO)}")
+    try:
+        limite = int(args.get('limite', current_app.config['RELATORIO_HISTORICO_LIMITE']))
+    except ValueError:
+        raise ValueError("limite deve ser um número inteiro")
+    if limite < 0:
+        raise ValueError("limite não pode ser negativo")
+    return {"historico": historico, "limite": limite}
+
+TITULO_RELATORIO = "Relatório de Estoque - MStarSupply"
+TITULO_ANEXO = "Anexo - Relatório de Estoque - MStarSupply"
+COLUNAS_RELATORIO = [
+    ("Código", 40, 'LEFT'),
+    ("Descrição", 110, 'LEFT'),
+    ("U.M.", 30, 'LEFT'),
+    ("Entradas", 50, 'CENTER'),
+    ("Custo (R$)", 50, 'CENTER'),
+    ("Saídas", 50, 'CENTER'),
+    ("Custo (R$)", 50, 'CENTER'),
+    ("Saldo", 50, 'CENTER'),
+]
+
+# Resumo geral e a tabela de totais por mercadoria (saldo em vermelho abaixo de 5, alerta de estoque baixo)
+def secao_resumo(resumo):
+    from .pdf import AZUL, CINZA_MEDIO, VERDE, VERMELHO, paragrafo, separador, tabela  # Importa o reportlab
+
+    linhas, faixas = [], []
+    for linha in resumo["linhas"]:
+        if linha["nome"] is None:  # Só inclui mercadorias cadastradas (o resumo já traz só as movimentadas)
+            continue
+        saldo = linha["entradas"] - linha["saidas"]
+        linhas.append([
+            str(linha["id"]), linha["nome"][:18], "UNID",  # Limita o tamanho do nome
+            str(linha["entradas"]), f"{linha['custo_entradas']:.2f}",  # Custo já valorizado no resumo do mês
+            str(linha["saidas"]), f"{linha['custo_saidas']:.2f}", str(saldo),
+        ])
+        if saldo < 5:
+            faixas.append((len(linhas) - 1, len(linhas) - 1, {"cores": {7: VERMELHO}}))
+
+    saldo_geral = resumo["total_entradas"] - resumo["total_saidas"]
+    if saldo_geral < 5:
+        faixas.append((len(linhas), len(linhas), {"cores": {7: VERMELHO}}))
+    total = ["Total Geral", "", "", str(resumo["total_entradas"]), f"{resumo['custo_entradas']:.2f}",
+             str(resumo["total_saidas"]), f"{resumo['custo_saidas']:.2f}", str(saldo_geral)]
+    return [
+        paragrafo("Resumo Geral", 14, negrito=True),
+        paragrafo(f"Mercadorias Movimentadas: {resumo['mercadorias_movimentadas']}", cor=CINZA_MEDIO, recuo=10),
+        paragrafo(f"Total Entradas: {resumo['total_entradas']}", cor=AZUL, recuo=10),
+        paragrafo(f"Total Saídas: {resumo['total_saidas']}", cor=VERMELHO, recuo=10),
+        separador(),
+        tabela(COLUNAS_RELATORIO, linhas, {3: AZUL, 5: VERMELHO, 7: VERDE}, faixas, total),
+    ]
+
+# Histórico de movimentações agrupado por mercadoria: uma linha por entrada e saída (com limite, as maiores e
+# uma linha dizendo quanto ficou pro anexo) ou, no modo diario, uma linha por dia com os totais
+def secao_historico(resumo, historico, opcoes=HISTORICO_COMPLETO):
+    from .pdf import AZUL, CINZA_TEXTO, PRETO, VERMELHO, lista
+
+    diario, limite = opcoes["historico"] == 'diario', opcoes["limite"]
+    linhas = []
+    for mercadoria in resumo["linhas"]:
+        entradas_mercadoria, saidas_mercadoria = historico.get(mercadoria["id"], ([], []))
+        if mercadoria["nome"] is None or not (entradas_mercadoria or saidas_mercadoria):
+            continue
+        linhas.append((f"Mercadoria: {mercadoria['nome']}", 10, True, PRETO, 10, 15))
+        for tipo, movimentos, cor in (("Entrada", entradas_mercadoria, AZUL), ("Saída", saidas_mercadoria, VERMELHO)):
+            if diario:
+                linhas += [
+                    (f"{tipo}s em {datetime.strptime(str(m.dia), '%Y-%m-%d').strftime('%d/%m/%Y')}: {m.quantidade} unidades"
+                     f" ({m.movimentos} movimentações)", 9, False, cor, 20, 15)
+                    for m in movimentos
+                ]
+                continue
+            linhas += [
+                (f"{tipo}: {m.quantidade} unidades - {m.data_hora.strftime('%d/%m/%Y %H:%M')} - {m.local}", 9, False, cor, 20, 15)
+                for m in movimentos
+            ]
+            if limite and movimentos and movimentos[0].total_movimentos > len(movimentos):
+                faltam = movimentos[0].total_movimentos - len(movimentos)
+                unidades = movimentos[0].total_quantidade - sum(m.quantidade for m in movimentos)
+                linhas.append((f"... mais {faltam} {tipo.lower()}s ({unidades} unidades) no anexo", 9, False, CINZA_TEXTO, 20, 15))
+        linhas[-1] = linhas[-1][:5] + (25,)  # Espaço antes da próxima mercadoria
+    titulo = "Histórico de Movimentações"
+    if diario:
+        titulo += " (totais por dia)"
+    elif limite:
+        titulo += f" (até {limite} maiores de cada tipo)"
+    return [lista(titulo, linhas)]
+
+# Histórico do mês no formato das opções (veja opcoes_historico)
+def dados_historico(mes, ano, opcoes, de=None, ate=None):
+    if opcoes["historico"] == 'diario':
+        return historico_diario(mes, ano, de, ate)
+    return historico_do_mes(mes, ano, de, ate, opcoes["limite"])
+
+# Arquivo dos PDFs grandes: fica na memória até RELATORIO_SPOOL_MAX bytes e depois passa pra um temporário em disco
+def arquivo_temporario():
+    return SpooledTemporaryFile(max_size=current_app.config['RELATORIO_SPOOL_MAX'])
+
+# Devolve o PDF (BytesIO ou arquivo temporário) pra download com o Content-Length (o send_file só descobre
+# o tamanho de BytesIO e de caminhos)
+def enviar_pdf(arquivo, nome):
+    tamanho = arquivo.seek(0, os.SEEK_END)
+    arquivo.seek(0)
+    resposta = send_file(arquivo, as_attachment=True, download_name=nome, mimetype='application/pdf')
+    resposta.content_length = tamanho
+    return resposta
+
+# Gera uma seção do relatório num processo do pool (veja secoes_em_paralelo) e devolve o PDF dela sem numerar
+def renderizar_secao(mes, ano, titulo, secao, fatia, gerado_em, opcoes):
+    from .pdf import gerar_pdf
+
+    with app_do_processo.app_context():
+        def gerar():
+            resumo = resumo_do_mes(mes, ano)
+            if secao == 'resumo':
+                elementos = secao_resumo(resumo)
+            else:
+                elementos = secao_historico(resumo, dados_historico(mes, ano, opcoes, *(fatia or ())), opcoes)
+            buffer = BytesIO()
+            gerar_pdf(buffer, titulo, mes, ano, elementos, gerado_em, numerar=False)
+            return buffer.getvalue()
+        return ler_na_replica(gerar)
+
+# Seções independentes geradas ao mesmo tempo no pool de relatórios: o resumo com a tabela (se com_resumo)
+# e o histórico dividido no resto das partes em fatias de mercadorias (cada fatia começa numa página nova)
+def secoes_em_paralelo(mes, ano, partes, titulo, opcoes, com_resumo=True):
+    from .pdf import texto_gerado_em
+
+    ids = [linha["id"] for linha in resumo_do_mes(mes, ano)["linhas"] if linha["nome"] is not None]
+    tamanho = max(1, -(-len(ids) // (partes - 1 if com_resumo else partes)))
+    fatias = [(ids[i], ids[min(i + tamanho, len(ids)) - 1]) for i in range(0, len(ids), tamanho)] or [None]
+    secoes = ([('resumo', None)] if com_resumo else []) + [('historico', fatia) for fatia in fatias]
+    gerado_em = texto_gerado_em()
+    pool = pool_relatorios()
+    futuros = [pool.submit(renderizar_secao, mes, ano, titulo, secao, fatia, gerado_em, opcoes) for secao, fatia in secoes]
+    return [futuro.result() for futuro in futuros]
+
+# Monta o PDF do relatório mensal de estoque num arquivo temporário, com o histórico conforme as opções
+# (padrão da configuração). Com RELATORIO_PARTES > 1 as seções são geradas em paralelo e juntadas (pypdf);
+# dentro dos processos do pool (jobs e modo ASGI) é sempre sequencial.
+@medir_renderizacao('reportlab')
+def pdf_relatorio(mes, ano, opcoes=None):
+    from .pdf import CINZA_TEXTO, gerar_pdf, juntar_pdfs, paragrafo
+
+    opcoes = opcoes or opcoes_historico({})
+    arquivo = arquivo_temporario()
+    partes = current_app.config['RELATORIO_PARTES']
+    if opcoes["historico"] == 'nenhum':
+        elementos = secao_resumo(resumo_do_mes(mes, ano))
+        elementos.append(paragrafo(f"Histórico de movimentações no anexo: /api/relatorio/{mes}/{ano}/anexo", 9,
+                                   cor=CINZA_TEXTO, antes=20))
+        gerar_pdf(arquivo, TITULO_RELATORIO, mes, ano, elementos)
+    elif partes > 1 and app_do_processo is None:
+        juntar_pdfs(secoes_em_paralelo(mes, ano, partes, TITULO_RELATORIO, opcoes), arquivo)
+    else:
+        resumo = resumo_do_mes(mes, ano)
+        gerar_pdf(arquivo, TITULO_RELATORIO, mes, ano,
+                  secao_resumo(resumo) + secao_historico(resumo, dados_historico(mes, ano, opcoes), opcoes))
+    arquivo.seek(0)
+    return arquivo
+
+# API pra relatório PDF (?historico=completo|diario|nenhum e ?limite=N resumem o histórico; o detalhe fica no anexo)
+@bp.route('/api/relatorio/<int:mes>/<int:ano>', methods=['GET'])
+@resposta_em_cache('mes-{ano}-{mes:02d}')
+@leitura_na_replica
+def gerar_relatorio(mes, ano):
+    try:
+        opcoes = opcoes_historico(request.args)
+    except ValueError as erro:
+        return jsonify({"error": str(erro)}), 400
+    return enviar_pdf(pdf_relatorio(mes, ano, opcoes), f"relatorio_{mes}_{ano}.pdf")
+
+# Monta o anexo do relatório mensal: o histórico completo, uma linha por movimento, sem o resumo
+@medir_renderizacao('reportlab')
+def pdf_anexo_relatorio(mes, ano):
+    from .pdf import gerar_pdf, juntar_pdfs
+
+    arquivo = arquivo_temporario()
+    partes = current_app.config['RELATORIO_PARTES']
+    if partes > 1 and app_do_processo is None:
+        juntar_pdfs(secoes_em_paralelo(mes, ano, partes, TITULO_ANEXO, HISTORICO_COMPLETO, com_resumo=False), arquivo)
+    else:
+        resumo = resumo_do_mes(mes, ano)
+        gerar_pdf(arquivo, TITULO_ANEXO, mes, ano, secao_historico(resumo, historico_do_mes(mes, ano)))
+    arquivo.seek(0)
+    return arquivo
+
+# API pra anexo do relatório PDF (histórico completo do mês; em meses grandes, prefira pedir em segundo plano)
+@bp.route('/api/relatorio/<int:mes>/<int:ano>/anexo', methods=['GET'])
+@resposta_em_cache('mes-{ano}-{mes:02d}')
+@leitura_na_replica
+def gerar_anexo_relatorio(mes, ano):
+    return enviar_pdf(pdf_anexo_relatorio(mes, ano), f"relatorio_{mes}_{ano}_anexo.pdf")
+
+# Monta o PDF do relatório gerencial (mercadorias mais movimentadas)
+@medir_renderizacao('reportlab')
+def pdf_relatorio_gerencial(mes, ano):
+    from .pdf import AZUL, CINZA_TEXTO, VERMELHO, gerar_pdf, grafico_barras, paragrafo, tabela
+
+    # Dados agrupados por mercadoria
+    entradas_por_mercadoria, saidas_por_mercadoria = totais_por_nome(resumo_do_mes(mes, ano), "Desconhecido (ID: {id})")
+
+    # Mercadorias mais movimentadas (top 5)
+    movimentacoes = {}
+    todas_mercadorias = set(list(entradas_por_mercadoria.keys()) + list(saidas_por_mercadoria.keys()))
+    for mercadoria in todas_mercadorias:
+        total_movimentacao = entradas_por_mercadoria.get(mercadoria, 0) + saidas_por_mercadoria.get(mercadoria, 0)
+        movimentacoes[mercadoria] = total_movimentacao
+
+    top_mercadorias = sorted(movimentacoes.items(), key=lambda x: x[1], reverse=True)[:5]
+
+    # Se não houver movimentações, exibe uma mensagem
+    if not top_mercadorias:
+        elementos = [paragrafo("Nenhuma movimentação encontrada para o período selecionado.", 12, cor=CINZA_TEXTO)]
+    else:
+        colunas = [("Mercadoria", 232, 'LEFT'), ("Entradas", 100, 'CENTER'), ("Saídas", 100, 'CENTER'), ("Total", 100, 'CENTER')]
+        linhas = [
+            [mercadoria, str(entradas_por_mercadoria.get(mercadoria, 0)), str(saidas_por_mercadoria.get(mercadoria, 0)), str(total)]
+            for mercadoria, total in top_mercadorias
+        ]
+        elementos = [
+            paragrafo("Mercadorias Mais Movimentadas", 14, negrito=True),
+            tabela(colunas, linhas, {1: AZUL, 2: VERMELHO}),
+            grafico_barras("Gráfico de Movimentações", top_mercadorias),
+        ]
+
+    buffer = BytesIO()
+    gerar_pdf(buffer, "Relatório Gerencial - MStarSupply", mes, ano, elementos)
+    buffer.seek(0)
+    return buffer
+
+# API pra relatório gerencial (mercadorias mais movimentadas)
+@bp.route('/api/relatorio_gerencial/<int:mes>/<int:ano>', methods=['GET'])
+@resposta_em_cache('mes-{ano}-{mes:02d}')
+@leitura_na_replica
+def gerar_relatorio_gerencial(mes, ano):
+    return send_file(pdf_relatorio_gerencial(mes, ano), as_attachment=True, download_name=f"relatorio_gerencial_{mes}_{ano}.pdf")
+
+# Escreve uma linha de CSV e devolve os bytes (a primeira chamada começa com o BOM pro Excel abrir em UTF-8)
+def escritor_csv():
+    output = StringIO()
+    writer = csv.writer(output, lineterminator='\n', delimiter=',', quoting=csv.QUOTE_MINIMAL)
+    output.write('\ufeff')  # BOM pra UTF-8
+
+    def escrever(linha):
+        writer.writerow(linha)
+        dados = output.getvalue().encode('utf-8')
+        output.seek(0)
+        output.truncate()
+        return dados
+    return escrever
+
+# Gera o CSV do relatório mensal em pedaços, conforme as linhas saem do banco
+def csv_relatorio(mes, ano):
+    escrever = escritor_csv()
+    yield escrever(["Código", "Descrição", "U.M.", "Entradas", "Custo (R$)", "Saídas", "Custo (R$)", "Saldo"])
+
+    total = novo_total_geral()
+    pendentes = []
+    for mercadoria in linhas_resumo_do_mes(mes, ano):
+        somar_no_total(total, mercadoria)
+        if mercadoria["nome"] is not None:
+            total_entradas = mercadoria["entradas"]
+            total_saidas = mercadoria["saidas"]
+            saldo = total_entradas - total_saidas
+            custo_entradas = mercadoria["custo_entradas"]  # Custo já valorizado no resumo do mês
+            custo_saidas = mercadoria["custo_saidas"]
+            pendentes.append(escrever([
+                str(mercadoria["id"]),
+                mercadoria["nome"],
+                "UNID",
+                str(total_entradas),
+                f"{custo_entradas:.2f}",
+                str(total_saidas),
+                f"{custo_saidas:.2f}",
+                str(saldo)
+            ]))
+            if len(pendentes) >= 500:  # Manda em blocos pra não fazer um write por linha
+                yield b''.join(pendentes)
+                pendentes = []
+    if pendentes:
+        yield b''.join(pendentes)
+
+    # Total Geral
+    total_saldo_geral = total["total_entradas"] - total["total_saidas"]
+    yield escrever([
+        "Total Geral", "", "", str(total["total_entradas"]), f"{total['custo_entradas']:.2f}", str(total["total_saidas"]), f"{total['custo_saidas']:.2f}", str(total_saldo_geral)
+    ])
+
+# Gera o CSV com cada entrada e saída do mês (sem agrupar), em ordem de data
+def csv_movimentacoes(mes, ano):
+    escrever = escritor_csv()
+    yield escrever(["Tipo", "Código", "Descrição", "Quantidade", "Data/Hora", "Local"])
+
+    movimentos = db.union_all(*[
+        db.select(
+            db.literal(tipo).label('tipo'), modelo.id, modelo.mercadoria_id, modelo.quantidade, modelo.data_hora, modelo.local
+        ).where(filtro_do_mes(modelo.data_hora, mes, ano))
+        for tipo, modelo in (("Entrada", movimentos_do_mes(db.session, Entrada, mes, ano)),
+                             ("Saída", movimentos_do_mes(db.session, Saida, mes, ano)))
+    ]).subquery()
+    consulta = db.select(
+        movimentos.c.tipo, movimentos.c.mercadoria_id, Mercadoria.nome,
+        movimentos.c.quantidade, movimentos.c.data_hora, movimentos.c.local
+    ).outerjoin(Mercadoria, Mercadoria.id == movimentos.c.mercadoria_id).order_by(
+        movimentos.c.data_hora, movimentos.c.tipo, movimentos.c.id
+    )
+    pendentes = []
+    for tipo, mercadoria_id, nome, quantidade, data_hora, local in db.session.execute(
+        consulta.execution_options(stream_results=True, yield_per=1000)
+    ):
+        pendentes.append(escrever([
+            tipo, str(mercadoria_id), nome or "Desconhecido", str(quantidade), data_hora.strftime('%d/%m/%Y %H:%M:%S'), local
+        ]))
+        if len(pendentes) >= 500:
+            yield b''.join(pendentes)
+            pendentes = []
+    if pendentes:
+        yield b''.join(pendentes)
+
+# API pra exportar relatório em CSV (modo=movimentacoes exporta cada movimento em vez dos totais)
+@bp.route('/api/relatorio_csv/<int:mes>/<int:ano>', methods=['GET'])
+@leitura_na_replica
+def exportar_relatorio_csv(mes, ano):
+    modo = request.args.get('modo', 'resumo')
+    if modo == 'resumo':
+        gerar, nome = csv_relatorio, f"relatorio_{mes}_{ano}.csv"
+    elif modo == 'movimentacoes':
+        gerar, nome = csv_movimentacoes, f"movimentacoes_{mes}_{ano}.csv"
+    else:
+        return jsonify({"error": "Modo inválido!"}), 400
+    return Response(
+        stream_with_context(gerar(mes, ano)),
+        mimetype='text/csv',
+        headers={"Content-Disposition": f"attachment; filename={nome}"}
+    )
+
+# Relatórios gerados em segundo plano: tipo -> (função que monta o arquivo, nome do download, mimetype)
+TIPOS_RELATORIO = {
+    'relatorio': (pdf_relatorio, "relatorio_{mes}_{ano}.pdf", 'application/pdf'),
+    'relatorio_anexo': (pdf_anexo_relatorio, "relatorio_{mes}_{ano}_anexo.pdf", 'application/pdf'),
+    'relatorio_gerencial': (pdf_relatorio_gerencial, "relatorio_gerencial_{mes}_{ano}.pdf", 'application/pdf'),
+    'relatorio_csv': (csv_relatorio, "relatorio_{mes}_{ano}.csv", 'text/csv'),
+    'movimentacoes_csv': (csv_movimentacoes, "movimentacoes_{mes}_{ano}.csv", 'text/csv'),
+}
+
+# Pool de processos que gera os relatórios, criado no primeiro pedido
+executor_relatorios = None
+
+# App do processo do pool, montado com a mesma configuração do app que criou o pool.
+# Cada processo abre as próprias conexões em vez de reaproveitar as herdadas do processo pai.
+app_do_processo = None
+
+def iniciar_processo_relatorios(configuracao):
+    global app_do_processo
+    from . import create_app
+    app_do_processo = create_app(configuracao)
+
+def pool_relatorios():
+    global executor_relatorios
+    if executor_relatorios is None:
+        executor_relatorios = ProcessPoolExecutor(
+            max_workers=current_app.config['RELATORIOS_WORKERS'],
+            initializer=iniciar_processo_relatorios,
+            initargs=(dict(current_app.config),)
+        )
+    return executor_relatorios
+
+# Jobs que este processo mandou pro pool e ainda não terminaram. A fila do pool é só da memória do processo: se ele
+# reinicia (deploy, OOM) os jobs pendentes e em geração se perdem. Por isso uma thread renova o pulso_em deles a cada
+# RELATORIOS_PULSO segundos, e job sem pulso há 3 avisos é retomado por quem pedir ou consultar ele.
+jobs_do_processo = set()
+trava_jobs = threading.Lock()
+thread_pulso = None
+
+def submeter_job_relatorio(job_id):
+    with trava_jobs:
+        jobs_do_processo.add(job_id)
+    iniciar_pulso(current_app._get_current_object())
+    futuro = pool_relatorios().submit(executar_job_relatorio, job_id)
+    futuro.add_done_callback(lambda _: descartar_job_do_processo(job_id))
+
+def descartar_job_do_processo(job_id):
+    with trava_jobs:
+        jobs_do_processo.discard(job_id)
+
+def iniciar_pulso(app):
+    global thread_pulso
+    with trava_jobs:
+        if thread_pulso is None or not thread_pulso.is_alive():
+            thread_pulso = threading.Thread(target=manter_pulso, args=(app,), daemon=True)
+            thread_pulso.start()
+
+def manter_pulso(app):
+    while True:
+        time.sleep(app.config['RELATORIOS_PULSO'])
+        try:
+            renovar_pulso(app)
+        except Exception:
+            app.logger.exception("Falha ao renovar o pulso dos jobs de relatório")
+
+def renovar_pulso(app):
+    with trava_jobs:
+        ids = list(jobs_do_processo)
+    if not ids:
+        return
+    with app.app_context():
+        db.session.execute(db.update(RelatorioJob).where(
+            RelatorioJob.id.in_(ids), RelatorioJob.status.in_(['pendente', 'processando'])
+        ).values(pulso_em=datetime.now()))
+        db.session.commit()
+
+# Jobs em andamento cujo processo parou de avisar (pulso vencido)
+def filtro_abandonados():
+    limite = datetime.now() - timedelta(seconds=3 * current_app.config['RELATORIOS_PULSO'])
+    return db.and_(RelatorioJob.status.in_(['pendente', 'processando']),
+                   db.func.coalesce(RelatorioJob.pulso_em, RelatorioJob.criado_em) < limite)
+
+# Põe de volta na fila (deste processo) o job abandonado e devolve ele atualizado. O UPDATE condicional faz só um
+# pedido retomar; a versão nova descarta o arquivo de uma geração antiga que ainda chegue a terminar.
+def retomar_se_abandonado(job):
+    if job.status not in ('pendente', 'processando'):
+        return job
+    agora = datetime.now()
+    retomado = db.session.execute(db.update(RelatorioJob).where(RelatorioJob.id == job.id, filtro_abandonados()).values(
+        status='pendente', versao=RelatorioJob.versao + 1, criado_em=agora, pulso_em=agora
+    )).rowcount == 1
+    db.session.commit()
+    if retomado:
+        current_app.logger.warning("Job de relatório %s abandonado, gerando de novo", job.id)
+        submeter_job_relatorio(job.id)
+    db.session.refresh(job)
+    return job
+
+# Atende uma requisição de gráfico ou PDF inteira num processo do pool (modo ASGI, veja asgi.py), pra
+# renderização pesada não segurar o event loop nem o GIL do processo do servidor
+def renderizar_no_processo(caminho, query_string, cabecalhos):
+    resposta = app_do_processo.test_client().get(caminho, query_string=query_string, headers=cabecalhos)
+    return resposta.status_code, list(resposta.headers.items()), resposta.get_data()
+
+# Grava o resultado do job (status, arquivo ou erro) se ele ainda existir e, com versao, se nenhum movimento do mês
+# chegou desde que a geração começou. Devolve se gravou.
+def finalizar_job_relatorio(job_id, versao=None, **valores):
+    atualizacao = db.update(RelatorioJob).where(RelatorioJob.id == job_id)
+    if versao is not None:
+        atualizacao = atualizacao.where(RelatorioJob.versao == versao)
+    gravou = db.session.execute(atualizacao.values(concluido_em=datetime.now(), **valores)).rowcount == 1
+    db.session.commit()
+    return gravou
+
+# Executa um job da fila (roda dentro de um processo do pool). Se chegar movimento do mês durante a geração
+# (invalidar_relatorios sobe a versão do job) o arquivo é refeito, até RELATORIOS_TENTATIVAS vezes; se o job
+# foi removido nesse meio tempo o arquivo é apagado.
+def executar_job_relatorio(job_id):
+    with app_do_processo.app_context():
+        # Assume o job num UPDATE condicional: removido ou já assumido por outro processo, não gera de novo
+        assumiu = db.session.execute(db.update(RelatorioJob).where(
+            RelatorioJob.id == job_id, RelatorioJob.status == 'pendente'
+        ).values(status='processando', pulso_em=datetime.now())).rowcount == 1
+        db.session.commit()
+        if not assumiu:
+            return
+        job = db.session.get(RelatorioJob, job_id)
+        gerar = TIPOS_RELATORIO[job.tipo][0]
+        mes, ano = job.mes, job.ano
+        caminho = os.path.join(current_app.config['RELATORIOS_DIR'], f"{job.id}_{job.tipo}_{ano}_{mes:02d}")
+
+        def gravar_relatorio():
+            conteudo = gerar(mes, ano)
+            try:
+                gravar_arquivo_cache(caminho, conteudo)
+            finally:
+                conteudo.close()  # Apaga o temporário do PDF (ou fecha o gerador do CSV)
+
+        for _ in range(current_app.config['RELATORIOS_TENTATIVAS']):
+            versao = db.session.scalar(db.select(RelatorioJob.versao).where(RelatorioJob.id == job_id))
+            if versao is None:
+                return  # Job removido antes de gerar
+            try:
+                # Só a geração vai pra réplica; o job em si é lido e gravado no primário
+                ler_na_replica(gravar_relatorio)
+                g.usar_replica = False
+            except Exception as erro:
+                g.usar_replica = False
+                db.session.rollback()
+                finalizar_job_relatorio(job_id, status='erro', erro=str(erro))
+                return
+            if finalizar_job_relatorio(job_id, versao, status='concluido', arquivo=caminho):
+                return
+            if db.session.get(RelatorioJob, job_id) is None:
+                break  # Removido durante a geração: o arquivo não é de ninguém
+        else:
+            finalizar_job_relatorio(job_id, status='erro', erro="O mês recebeu movimentos durante todas as tentativas de gerar o relatório")
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+# Remove jobs vencidos: concluídos há mais que o TTL, desatualizados ou presos em andamento além do tempo limite
+def limpar_jobs_relatorio():
+    agora = datetime.now()
+    vencidos = RelatorioJob.query.filter(db.or_(
+        RelatorioJob.status == 'desatualizado',
+        db.and_(RelatorioJob.status.in_(['concluido', 'erro']),
+                RelatorioJob.concluido_em < agora - timedelta(seconds=current_app.config['RELATORIOS_TTL'])),
+        db.and_(RelatorioJob.status.in_(['pendente', 'processando']),
+                RelatorioJob.criado_em < agora - timedelta(seconds=current_app.config['RELATORIOS_TIMEOUT'])),
+    )).all()
+    remover_jobs_relatorio(vencidos)
+
+def remover_jobs_relatorio(jobs):
+    for job in jobs:
+        if job.arquivo and os.path.exists(job.arquivo):
+            os.remove(job.arquivo)
+        db.session.delete(job)
+    db.session.commit()
+
+# Relatórios de um mês ficam desatualizados quando chega movimento novo. Roda na transação do movimento, sem commit:
+# um UPDATE só, pelo índice de ano e mês (no caso comum, mês sem job, não acha nada). Os jobs em andamento ganham uma
+# versão nova, pra geração que já começou ser refeita em vez de gravar um arquivo velho; os concluídos passam a
+# desatualizado e o arquivo é apagado no próximo limpar_jobs_relatorio, fora do caminho da gravação.
+def invalidar_relatorios(meses):
+    if not meses:
+        return
+    db.session.execute(db.update(RelatorioJob).where(
+        db.or_(*(db.and_(RelatorioJob.ano == ano, RelatorioJob.mes == mes) for ano, mes in meses)),
+        RelatorioJob.status.in_(['pendente', 'processando', 'concluido'])
+    ).values(
+        versao=RelatorioJob.versao + 1,
+        status=db.case((RelatorioJob.status == 'concluido', 'desatualizado'), else_=RelatorioJob.status)
+    ))
+
+def job_json(job):
+    dados = {
+        "id": job.id,
+        "tipo": job.tipo,
+        "mes": job.mes,
+        "ano": job.ano,
+        "status": job.status,
+        "criado_em": job.criado_em.isoformat(),
+        "concluido_em": job.concluido_em.isoformat() if job.concluido_em else None,
+    }
+    if job.status == 'concluido':
+        dados["download"] = f"/api/relatorios/{job.id}/arquivo"
+    if job.status == 'erro':
+        dados["erro"] = job.erro
+    return dados
+
+# API pra pedir um relatório em segundo plano: {"tipo": "relatorio|relatorio_anexo|relatorio_gerencial|relatorio_csv|movimentacoes_csv", "mes": 5, "ano": 2024}
+# Pedidos iguais enquanto o job existir caem no mesmo job (retomado se o processo que tinha ele na fila parou).
+@bp.route('/api/relatorios', methods=['POST'])
+def criar_job_relatorio():
+    data = request.json or {}
+    tipo = data.get('tipo')
+    try:
+        mes, ano = int(data.get('mes')), int(data.get('ano'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Mês e ano obrigatórios"}), 400
+    if tipo not in TIPOS_RELATORIO or not 1 <= mes <= 12:
+        return jsonify({"error": "Tipo de relatório ou período inválido"}), 400
+
+    limpar_jobs_relatorio()
+    chave = f"{tipo}:{ano}:{mes:02d}"
+    job = RelatorioJob.query.filter_by(chave=chave).first()
+    if job is not None and job.status in ('erro', 'desatualizado'):
+        remover_jobs_relatorio([job])  # Pedido novo depois de uma falha ou de movimento novo no mês gera de novo
+        job = None
+    if job is not None:
+        return jsonify(job_json(retomar_se_abandonado(job))), 200
+
+    agora = datetime.now()
+    job = RelatorioJob(chave=chave, tipo=tipo, mes=mes, ano=ano, status='pendente', criado_em=agora, pulso_em=agora)
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:  # Outro pedido igual criou o job ao mesmo tempo
+        db.session.rollback()
+        return jsonify(job_json(RelatorioJob.query.filter_by(chave=chave).one())), 200
+
+    submeter_job_relatorio(job.id)
+    return jsonify(job_json(job)), 202, {"Location": f"/api/relatorios/{job.id}"}
+
+# API pra consultar o status de um job de relatório
+@bp.route('/api/relatorios/<int:id>', methods=['GET'])
+def consultar_job_relatorio(id):
+    job = db.session.get(RelatorioJob, id)
+    if job is None:
+        return jsonify({"error": "Relatório não encontrado"}), 404
+    return jsonify(job_json(retomar_se_abandonado(job)))
+
+# API pra baixar o arquivo de um job concluído
+@bp.route('/api/relatorios/<int:id>/arquivo', methods=['GET'])
+def baixar_job_relatorio(id):
+    job = db.session.get(RelatorioJob, id)
+    if job is None:
+        return jsonify({"error": "Relatório não encontrado"}), 404
+    if job.status != 'concluido':
+        return jsonify(job_json(job)), 409
+    _, nome, mimetype = TIPOS_RELATORIO[job.tipo]
+    return send_file(job.arquivo, as_attachment=True, download_name=nome.format(mes=job.mes, ano=job.ano), mimetype=mimetype)
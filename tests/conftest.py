@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mstarsupply import create_app  # noqa: E402
+
+# Configuração extra do app; um módulo de testes sobrescreve esta fixture pra mudar o padrão (ex.: ligar o cache)
+@pytest.fixture
+def configuracao():
+    return {}
+
+# Um app por teste, num SQLite em arquivo (as threads dos testes de concorrência abrem conexões próprias),
+# com o cache de respostas desligado e as pastas de gráficos e relatórios no temporário do teste
+@pytest.fixture
+def app(tmp_path, configuracao):
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'teste.db'}",
+        "CACHE_RESPOSTAS": 'desligado',
+        "GRAFICO_CACHE_DIR": str(tmp_path / 'graficos'),
+        "RELATORIOS_DIR": str(tmp_path / 'relatorios'),
+        **configuracao,
+    })
+    resultado = app.test_cli_runner().invoke(args=['criar-tabelas'])
+    assert resultado.exit_code == 0, resultado.output
+    yield app
+    with app.app_context():
+        from mstarsupply.banco import db
+        db.engine.dispose()
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+# Roda um comando do flask e devolve o resultado do click (exit_code e output)
+@pytest.fixture
+def comando(app):
+    def rodar(*args):
+        return app.test_cli_runner().invoke(args=list(args))
+    return rodar
+
+# Cadastra uma mercadoria e devolve o id
+@pytest.fixture
+def mercadoria(cliente, app):
+    def cadastrar(nome='Luva cirúrgica', custo_unitario=10.0):
+        resposta = cliente.post('/api/mercadorias', json={
+            "nome": nome, "numero_registro": f"REG-{nome}", "fabricante": 'Fabricante', "tipo": 'Insumo',
+            "custo_unitario": custo_unitario,
+        })
+        assert resposta.status_code == 201
+        with app.app_context():
+            from mstarsupply.modelos import Mercadoria
+            return Mercadoria.query.filter_by(nome=nome).one().id
+    return cadastrar
+
+# Registra uma entrada ou saída (tipo 'entradas' ou 'saidas') e devolve a resposta
+@pytest.fixture
+def movimentar(cliente):
+    def registrar(tipo, mercadoria_id, quantidade, data_hora, custo_unitario=None, local='Depósito Central'):
+        corpo = {"mercadoria_id": mercadoria_id, "quantidade": quantidade, "data_hora": data_hora, "local": local}
+        if custo_unitario is not None:
+            corpo["custo_unitario"] = custo_unitario
+        return cliente.post(f'/api/{tipo}', json=corpo)
+    return registrar
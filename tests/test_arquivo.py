@@ -0,0 +1,101 @@
+from mstarsupply.banco import db
+from mstarsupply.modelos import Entrada, Saida, EntradaArquivada, SaidaArquivada
+
+# Leituras por período que passam por movimentos_do_periodo, incluindo meses que vão pro arquivo
+LEITURAS = [
+    ('/api/movimentacoes/1/2024', {}),
+    ('/api/movimentacoes/2/2024', {'local': 'Doca'}),
+    ('/api/movimentacoes/3/2024', {}),
+    ('/api/movimentacoes/1/2024', {'formato': 'ndjson'}),
+    ('/api/movimentacoes/2/2024', {'tipo': 'entradas', 'limit': 1}),
+    ('/api/disponibilidade', {}),
+    ('/api/disponibilidade', {'em': '2024-01-15'}),
+    ('/api/disponibilidade', {'em': '2024-02-29 23:59:59'}),
+    ('/api/disponibilidade', {'em': '2024-03-10'}),
+    ('/api/analytics', {'de': '2024-01-01', 'ate': '2024-04-30', 'agrupar': 'mercadoria,mes'}),
+    ('/api/analytics', {'de': '2024-02-10', 'ate': '2024-03-10', 'agrupar': 'local'}),
+    ('/api/busca', {'tipo': 'saidas', 'q': 'Luva', 'de': '2024-01-01'}),
+    ('/api/busca', {'tipo': 'entradas', 'q': '2024-02-12'}),
+    ('/api/relatorio_csv/1/2024', {'modo': 'movimentacoes'}),
+    ('/api/relatorio_csv/2/2024', {}),
+    ('/api/valorizacao/2/2024', {}),
+]
+
+def ler_tudo(cliente):
+    respostas = {}
+    for url, args in LEITURAS:
+        resposta = cliente.get(url, query_string=args)
+        assert resposta.status_code == 200, (url, args, resposta.data)
+        cabecalhos = {nome: valor for nome, valor in resposta.headers.items() if nome.startswith('X-')}
+        respostas[(url, tuple(sorted(args.items())))] = (resposta.data, cabecalhos)
+    return respostas
+
+def movimentar_quatro_meses(mercadoria, movimentar):
+    luva, gaze = mercadoria('Luva cirúrgica'), mercadoria('Gaze estéril')
+    for mes in range(1, 5):
+        assert movimentar('entradas', luva, 20, f'2024-{mes:02d}-02 08:00:00', custo_unitario=10 + mes).status_code == 201
+        assert movimentar('entradas', gaze, 15, f'2024-{mes:02d}-12 09:30:00', local='Doca 2').status_code == 201
+        assert movimentar('saidas', luva, 7, f'2024-{mes:02d}-20 14:00:00', local='Doca 1').status_code == 201
+        assert movimentar('saidas', gaze, 4, f'2024-{mes:02d}-28 23:59:59').status_code == 201
+    return luva, gaze
+
+def contar(modelo):
+    return db.session.scalar(db.select(db.func.count()).select_from(modelo))
+
+def test_leituras_iguais_antes_e_depois_de_arquivar(app, cliente, comando, mercadoria, movimentar):
+    movimentar_quatro_meses(mercadoria, movimentar)
+    assert comando('fechar-saldos', '--ate', '2024-02').exit_code == 0
+    antes = ler_tudo(cliente)
+
+    resultado = comando('arquivar', '--ate', '2024-02')
+    assert resultado.exit_code == 0, resultado.output
+    with app.app_context():
+        assert (contar(EntradaArquivada), contar(SaidaArquivada)) == (4, 4)
+        assert (contar(Entrada), contar(Saida)) == (4, 4)
+
+    assert ler_tudo(cliente) == antes
+    for verificacao in ('recalcular-saldos', 'recalcular-resumos', 'recalcular-custos', 'fechar-saldos'):
+        resultado = comando(verificacao, '--verificar')
+        assert resultado.exit_code == 0, (verificacao, resultado.output)
+
+def test_movimento_com_data_arquivada_aparece_nas_leituras(app, cliente, comando, mercadoria, movimentar):
+    luva, _ = movimentar_quatro_meses(mercadoria, movimentar)
+    assert comando('fechar-saldos', '--ate', '2024-02').exit_code == 0
+    assert comando('arquivar', '--ate', '2024-02').exit_code == 0
+
+    # Gravado na tabela quente com data de um mês já arquivado: as leituras do período juntam as duas tabelas
+    assert movimentar('entradas', luva, 3, '2024-01-15 10:00:00', local='Doca 3').status_code == 201
+    janeiro = cliente.get('/api/movimentacoes/1/2024', query_string={'tipo': 'entradas'}).get_json()['entradas']
+    assert [entrada['local'] for entrada in janeiro].count('Doca 3') == 1
+    assert len(janeiro) == 3
+    em_janeiro = cliente.get('/api/disponibilidade', query_string={'em': '2024-01-31'}).get_json()
+    assert next(linha for linha in em_janeiro if linha['id'] == luva)['disponibilidade'] == 20 - 7 + 3
+
+    # Rodar de novo com o mesmo corte leva só esse movimento pro arquivo, sem mudar as leituras (com uma entrada
+    # depois dele, já que o maior id sempre fica na tabela quente)
+    assert movimentar('entradas', luva, 1, '2024-04-25 10:00:00').status_code == 201
+    antes = ler_tudo(cliente)
+    resultado = comando('arquivar', '--ate', '2024-02')
+    assert resultado.exit_code == 0, resultado.output
+    assert 'Entradas: 1 movimento(s) arquivado(s)' in resultado.output
+    with app.app_context():
+        assert contar(EntradaArquivada) == 5
+    assert ler_tudo(cliente) == antes
+
+def test_busca_sem_data_fica_nos_meses_quentes(cliente, comando, mercadoria, movimentar):
+    movimentar_quatro_meses(mercadoria, movimentar)
+    assert comando('fechar-saldos', '--ate', '2024-02').exit_code == 0
+    assert comando('arquivar', '--ate', '2024-02').exit_code == 0
+
+    datas = [linha['data_hora'] for linha in cliente.get('/api/busca', query_string={'tipo': 'saidas', 'q': 'Luva'}).get_json()]
+    assert datas == ['2024-04-20T14:00:00', '2024-03-20T14:00:00']
+    com_periodo = cliente.get('/api/busca', query_string={'tipo': 'saidas', 'q': 'Luva', 'de': '2024-01-01'}).get_json()
+    assert len(com_periodo) == 4
+
+def test_arquivar_exige_mes_fechado(comando, mercadoria, movimentar):
+    movimentar_quatro_meses(mercadoria, movimentar)
+    assert comando('fechar-saldos', '--ate', '2024-01').exit_code == 0
+
+    resultado = comando('arquivar', '--ate', '2024-02')
+    assert resultado.exit_code != 0
+    assert 'ainda não foi fechado' in resultado.output
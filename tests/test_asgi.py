@@ -0,0 +1,94 @@
+import asyncio
+import importlib
+import os
+
+import pytest
+
+pytest.importorskip('a2wsgi')
+pytest.importorskip('aiosqlite')
+
+ORIGEM = 'http://localhost:3000'
+
+# O asgi.py monta o app na importação a partir do ambiente, então a base é apontada antes de importar
+@pytest.fixture(scope='module')
+def asgi(tmp_path_factory):
+    anteriores = {nome: os.environ.get(nome) for nome in ('DATABASE_URL', 'CACHE_RESPOSTAS')}
+    os.environ['DATABASE_URL'] = f"sqlite:///{tmp_path_factory.mktemp('asgi') / 'teste.db'}"
+    os.environ['CACHE_RESPOSTAS'] = 'memoria'
+    try:
+        modulo = importlib.import_module('asgi')
+    finally:
+        for nome, valor in anteriores.items():
+            if valor is None:
+                os.environ.pop(nome, None)
+            else:
+                os.environ[nome] = valor
+    assert modulo.flask_app.test_cli_runner().invoke(args=['criar-tabelas']).exit_code == 0
+    return modulo
+
+# Faz uma requisição direto no app ASGI e devolve (status, cabeçalhos, corpo). Com primeiro_pedaco o cliente
+# desconecta assim que chega o primeiro pedaço do corpo (pro /api/stream, que não termina sozinho).
+def chamar(app, caminho, metodo='GET', cabecalhos=(), query_string=b'', primeiro_pedaco=False):
+    async def requisitar():
+        resposta = {"cabecalhos": {}, "corpo": b''}
+        terminou = asyncio.Event()
+        pedido = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if pedido:
+                return pedido.pop()
+            await terminou.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(mensagem):
+            if mensagem['type'] == 'http.response.start':
+                resposta["status"] = mensagem['status']
+                resposta["cabecalhos"] = {nome.decode().lower(): valor.decode() for nome, valor in mensagem['headers']}
+            elif mensagem['type'] == 'http.response.body':
+                resposta["corpo"] += mensagem.get('body', b'')
+                if primeiro_pedaco or not mensagem.get('more_body'):
+                    terminou.set()
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': metodo, 'scheme': 'http',
+            'path': caminho, 'raw_path': caminho.encode(), 'query_string': query_string, 'root_path': '',
+            'headers': [(nome.lower().encode(), valor.encode()) for nome, valor in cabecalhos],
+            'client': ('127.0.0.1', 50000), 'server': ('localhost', 8000),
+        }
+        await asyncio.wait_for(app(scope, receive, send), 10)
+        return resposta["status"], resposta["cabecalhos"], resposta["corpo"]
+    return asyncio.run(requisitar())
+
+# Rotas nativas (sem passar pelo Flask) e rotas que caem no app Flask
+@pytest.mark.parametrize('caminho, query_string, primeiro_pedaco', [
+    ('/api/dashboard', b'', False),
+    ('/api/disponibilidade', b'', False),
+    ('/api/movimentacoes/5/2024', b'', False),
+    ('/api/busca', b'tipo=mercadorias&q=luva', False),
+    ('/api/stream', b'', True),
+    ('/api/mercadorias', b'', False),
+    ('/api/valorizacao/5/2024', b'', False),
+])
+def test_cors_e_server_timing_nas_rotas_nativas_e_no_flask(asgi, caminho, query_string, primeiro_pedaco):
+    status, cabecalhos, _ = chamar(asgi.app, caminho, cabecalhos=[('Origin', ORIGEM)], query_string=query_string,
+                                   primeiro_pedaco=primeiro_pedaco)
+    assert status == 200
+    assert cabecalhos['access-control-allow-origin'] == ORIGEM
+    assert 'app;dur=' in cabecalhos['server-timing']
+
+    # Origem fora das CORS_ORIGENS não ganha o cabeçalho, como no flask_cors
+    _, cabecalhos, _ = chamar(asgi.app, caminho, cabecalhos=[('Origin', 'http://outro.exemplo')],
+                              query_string=query_string, primeiro_pedaco=primeiro_pedaco)
+    assert 'access-control-allow-origin' not in cabecalhos
+
+def test_cors_em_resposta_do_cache_e_em_erro(asgi):
+    for _ in range(2):  # A segunda sai do cache de respostas
+        status, cabecalhos, _ = chamar(asgi.app, '/api/dashboard', cabecalhos=[('Origin', ORIGEM)])
+        assert status == 200
+        assert cabecalhos['access-control-allow-origin'] == ORIGEM
+        assert 'app;dur=' in cabecalhos['server-timing']
+
+    status, cabecalhos, _ = chamar(asgi.app, '/api/disponibilidade', cabecalhos=[('Origin', ORIGEM)],
+                                   query_string=b'alerta=nenhum')
+    assert status == 400
+    assert cabecalhos['access-control-allow-origin'] == ORIGEM
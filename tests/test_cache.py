@@ -0,0 +1,82 @@
+import re
+
+import pytest
+
+# Os testes rodam com o cache em memória e em disco
+@pytest.fixture(params=['memoria', 'disco'])
+def configuracao(request, tmp_path):
+    return {"CACHE_RESPOSTAS": request.param, "CACHE_RESPOSTAS_DIR": str(tmp_path / 'respostas')}
+
+# Consultas SQL feitas pela requisição, lidas do Server-Timing (0 quando a resposta saiu do cache)
+def consultas(resposta):
+    return int(re.search(r'desc="(\d+) consultas"', resposta.headers['Server-Timing']).group(1))
+
+def test_etag_e_304(cliente, mercadoria, movimentar):
+    movimentar('entradas', mercadoria(), 10, '2024-05-02 08:00:00')
+    primeira = cliente.get('/api/dashboard')
+    assert primeira.status_code == 200 and consultas(primeira) > 0
+    assert primeira.headers['Cache-Control'] == 'no-cache'
+    etag = primeira.headers['ETag']
+
+    segunda = cliente.get('/api/dashboard')
+    assert consultas(segunda) == 0
+    assert (segunda.data, segunda.headers['ETag']) == (primeira.data, etag)
+
+    revalidada = cliente.get('/api/dashboard', headers={'If-None-Match': etag})
+    assert revalidada.status_code == 304 and revalidada.data == b''
+    assert consultas(revalidada) == 0
+    assert cliente.get('/api/dashboard', headers={'If-None-Match': '"outra"'}).status_code == 200
+
+    # Depois de um movimento a resposta é refeita e o ETag antigo não vale mais
+    movimentar('entradas', mercadoria('Gaze'), 3, '2024-05-03 08:00:00')
+    nova = cliente.get('/api/dashboard', headers={'If-None-Match': etag})
+    assert nova.status_code == 200 and consultas(nova) > 0
+    assert nova.headers['ETag'] != etag
+
+def test_parametros_diferentes_sao_entradas_diferentes(cliente, mercadoria):
+    mercadoria(), mercadoria('Gaze')
+    assert consultas(cliente.get('/api/mercadorias', query_string={'limit': 1})) > 0
+    assert consultas(cliente.get('/api/mercadorias', query_string={'limit': 2})) > 0
+    assert consultas(cliente.get('/api/mercadorias', query_string={'limit': 1})) == 0
+
+# Um movimento em maio derruba o que depende de maio e de movimentos, mas não o cache de abril nem o das mercadorias
+def test_invalidacao_por_tag(cliente, mercadoria, movimentar):
+    id = mercadoria()
+    movimentar('entradas', id, 10, '2024-04-02 08:00:00')
+    movimentar('entradas', id, 10, '2024-05-02 08:00:00')
+    urls = ['/api/movimentacoes/4/2024', '/api/movimentacoes/5/2024', '/api/mercadorias', '/api/disponibilidade',
+            f'/api/mercadorias/{id}/disponibilidade']
+    antes = {url: cliente.get(url) for url in urls}
+    assert all(consultas(cliente.get(url)) == 0 for url in urls)
+
+    assert movimentar('saidas', id, 4, '2024-05-20 08:00:00').status_code == 201
+    depois = {url: cliente.get(url) for url in urls}
+    assert [url for url in urls if consultas(depois[url]) > 0] == \
+        ['/api/movimentacoes/5/2024', '/api/disponibilidade', f'/api/mercadorias/{id}/disponibilidade']
+    assert depois['/api/movimentacoes/4/2024'].data == antes['/api/movimentacoes/4/2024'].data
+    assert len(depois['/api/movimentacoes/5/2024'].get_json()['saidas']) == 1
+    assert depois[f'/api/mercadorias/{id}/disponibilidade'].get_json() == {"disponibilidade": 16}
+
+    # Mercadoria nova derruba as listagens de mercadorias (e a disponibilidade, que lista todas), não os meses
+    mercadoria('Gaze')
+    refeitas = [url for url in urls if consultas(cliente.get(url)) > 0]
+    assert refeitas == ['/api/mercadorias', '/api/disponibilidade']
+    assert len(cliente.get('/api/mercadorias').get_json()) == 2
+
+def test_importacao_invalida_os_meses_do_lote(cliente, mercadoria):
+    id = mercadoria()
+    assert consultas(cliente.get('/api/movimentacoes/5/2024')) > 0
+    assert consultas(cliente.get('/api/movimentacoes/6/2024')) > 0
+    resposta = cliente.post('/api/entradas/bulk', json=[
+        {"mercadoria_id": id, "quantidade": 2, "data_hora": '2024-05-10 08:00:00', "local": 'Doca 1'},
+    ])
+    assert resposta.get_json()['registradas'] == 1
+    maio = cliente.get('/api/movimentacoes/5/2024')
+    assert consultas(maio) > 0 and len(maio.get_json()['entradas']) == 1
+    assert consultas(cliente.get('/api/movimentacoes/6/2024')) == 0
+
+def test_ttl_vencido_refaz_a_resposta(app, cliente, mercadoria):
+    mercadoria()
+    app.config['CACHE_RESPOSTAS_TTL'] = 0
+    assert consultas(cliente.get('/api/mercadorias')) > 0
+    assert consultas(cliente.get('/api/mercadorias')) > 0
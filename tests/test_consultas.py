@@ -0,0 +1,192 @@
+import pytest
+
+# O fim do intervalo é o dia seguinte ao ate, que não existe em 9999-12-31
+@pytest.mark.parametrize('args', [
+    {'de': '2024-01-01', 'ate': '9999-12-31'},
+    {'de': '9999-12-31', 'ate': '9999-12-31', 'agrupar': 'mercadoria'},
+])
+def test_analytics_com_ate_no_ultimo_dia_possivel(cliente, args):
+    resposta = cliente.get('/api/analytics', query_string=args)
+    assert resposta.status_code == 400
+    assert 'error' in resposta.get_json()
+
+@pytest.mark.parametrize('args', [
+    {'tipo': 'entradas', 'q': '31/12/9999'},
+    {'tipo': 'saidas', 'q': '9999-12-31'},
+    {'tipo': 'saidas', 'q': 'Luva', 'ate': '9999-12-31'},
+    {'tipo': 'entradas', 'de': '9999-12-31'},
+])
+def test_busca_com_data_no_ultimo_dia_possivel(cliente, args):
+    resposta = cliente.get('/api/busca', query_string=args)
+    assert resposta.status_code == 400
+    assert 'Data inválida' in resposta.get_json()['error']
+
+def buscar(cliente, **args):
+    resposta = cliente.get('/api/busca', query_string=args)
+    assert resposta.status_code == 200, resposta.data
+    return resposta
+
+def nomes(resposta):
+    return [linha.get('nome', linha.get('mercadoria')) for linha in resposta.get_json()]
+
+@pytest.fixture
+def catalogo(mercadoria):
+    return {nome: mercadoria(nome) for nome in ('Luva cirúrgica', 'Luva', 'Avental', 'Máscara com luva', 'Luvas 50%')}
+
+# Nome igual ao termo, depois começando por ele, depois o termo em qualquer posição; empate pelo id
+def test_busca_de_mercadorias_por_relevancia(cliente, catalogo):
+    assert nomes(buscar(cliente, q='Luva')) == ['Luva', 'Luva cirúrgica', 'Luvas 50%', 'Máscara com luva']
+    assert nomes(buscar(cliente, q='cirúrgica')) == ['Luva cirúrgica']
+    assert nomes(buscar(cliente, q='luva máscara')) == ['Máscara com luva']  # Todas as palavras, em qualquer ordem
+    assert nomes(buscar(cliente, q='REG-Avental')) == ['Avental']  # Número de registro
+    assert len(nomes(buscar(cliente, q='insumo fabricante'))) == 5  # Tipo e fabricante
+    assert nomes(buscar(cliente, q='xyz')) == []
+    assert len(nomes(buscar(cliente, q=''))) == 5
+
+# Curingas do LIKE no termo são literais
+def test_busca_escapa_curingas(cliente, catalogo):
+    assert nomes(buscar(cliente, q='%')) == nomes(buscar(cliente, q=''))  # Sem palavras: não filtra
+    assert nomes(buscar(cliente, q='50%')) == ['Luvas 50%']
+    assert nomes(buscar(cliente, q='_uva')) == []
+
+def test_busca_paginada(cliente, catalogo):
+    primeira = buscar(cliente, q='Luva', por_pagina=3)
+    assert nomes(primeira) == ['Luva', 'Luva cirúrgica', 'Luvas 50%']
+    assert primeira.headers['X-Proxima-Pagina'] == '2'
+    segunda = buscar(cliente, q='Luva', por_pagina=3, pagina=2)
+    assert nomes(segunda) == ['Máscara com luva']
+    assert 'X-Proxima-Pagina' not in segunda.headers
+
+# No MySQL a busca usa o FULLTEXT; palavra menor que o token mínimo (3 letras) cai no LIKE, como nos outros bancos
+@pytest.mark.parametrize('termo, fulltext', [
+    ('luva cirúrgica', True),
+    ('luv', True),
+    ('lu', False),
+    ('luva de látex', False),
+    ('', False),
+])
+def test_busca_no_mysql_cai_no_like_com_palavras_curtas(termo, fulltext):
+    from sqlalchemy.dialects import mysql
+    from mstarsupply.consultas import busca_mercadoria
+    filtro, relevancia = busca_mercadoria(termo, 'mysql')
+    sql = str(filtro.compile(dialect=mysql.dialect()))
+    assert ('MATCH' in sql) == fulltext
+    assert ('LIKE' in sql) == (not fulltext and bool(termo))
+
+def test_busca_de_movimentos_por_nome_data_e_local(cliente, catalogo, movimentar):
+    movimentar('entradas', catalogo['Luva'], 5, '2024-05-02 08:00:00', local='Doca 1')
+    movimentar('entradas', catalogo['Avental'], 3, '2024-05-02 18:00:00', local='Doca 2')
+    movimentar('entradas', catalogo['Luva cirúrgica'], 2, '2024-05-03 08:00:00', local='Almoxarifado')
+    assert nomes(buscar(cliente, tipo='entradas', q='luva')) == ['Luva cirúrgica', 'Luva']  # Mais recentes primeiro
+    assert nomes(buscar(cliente, tipo='entradas', q='02/05/2024')) == ['Avental', 'Luva']
+    assert nomes(buscar(cliente, tipo='entradas', q='2024-05-02', local='Doca')) == ['Avental', 'Luva']
+    assert nomes(buscar(cliente, tipo='entradas', local='Doca 1')) == ['Luva']
+    assert nomes(buscar(cliente, tipo='entradas', q='luva', de='2024-05-03', ate='2024-05-03')) == ['Luva cirúrgica']
+    assert nomes(buscar(cliente, tipo='saidas', q='luva')) == []
+    assert cliente.get('/api/busca', query_string={'tipo': 'compras'}).status_code == 400
+
+# Movimentos de maio de 2024: (tipo, mercadoria, quantidade, data_hora, local)
+MOVIMENTOS_ANALYTICS = [
+    ('entradas', 'Luva', 10, '2024-05-01 08:00:00', 'Doca 1'),
+    ('entradas', 'Luva', 5, '2024-05-06 09:00:00', 'Doca 2'),
+    ('entradas', 'Gaze', 8, '2024-05-12 10:00:00', 'Doca 1'),
+    ('saidas', 'Luva', 4, '2024-05-06 23:59:59', 'Doca 1'),
+    ('saidas', 'Gaze', 3, '2024-05-13 00:00:00', 'Doca 2'),
+    ('entradas', 'Gaze', 2, '2024-06-01 00:00:00', 'Doca 1'),  # Fora do período
+]
+
+@pytest.fixture
+def movimentos_analytics(mercadoria, movimentar):
+    from datetime import datetime
+    ids = {'Luva': mercadoria('Luva'), 'Gaze': mercadoria('Gaze')}
+    for tipo, nome, quantidade, data_hora, local in MOVIMENTOS_ANALYTICS:
+        assert movimentar(tipo, ids[nome], quantidade, data_hora, local=local).status_code == 201
+    return [(tipo, ids[nome], nome, quantidade, datetime.strptime(data_hora, '%Y-%m-%d %H:%M:%S'), local)
+            for tipo, nome, quantidade, data_hora, local in MOVIMENTOS_ANALYTICS]
+
+# Agrupa os movimentos um a um, pra comparar com a API
+def agrupar_na_mao(movimentos, campos, de, ate):
+    from datetime import date, timedelta
+    series = {}
+    for tipo, id, nome, quantidade, data_hora, local in movimentos:
+        if not date.fromisoformat(de) <= data_hora.date() <= date.fromisoformat(ate):
+            continue
+        chave = []
+        for campo in campos:
+            if campo == 'mercadoria':
+                chave += [('mercadoria_id', id), ('nome', nome)]
+            elif campo == 'tipo':
+                chave.append(('tipo', 'Insumo'))
+            elif campo == 'fabricante':
+                chave.append(('fabricante', 'Fabricante'))
+            elif campo == 'local':
+                chave.append(('local', local))
+            elif campo == 'dia':
+                chave.append(('dia', data_hora.date().isoformat()))
+            elif campo == 'semana':
+                chave.append(('semana', (data_hora.date() - timedelta(days=data_hora.weekday())).isoformat()))
+            else:
+                chave.append(('mes', data_hora.strftime('%Y-%m')))
+        totais = series.setdefault(tuple(chave), [0, 0])
+        totais[tipo == 'saidas'] += quantidade
+    return sorted((tuple(sorted(chave)), entradas, saidas) for chave, (entradas, saidas) in series.items())
+
+@pytest.mark.parametrize('agrupar', [
+    'mercadoria', 'local', 'dia', 'semana', 'mes', 'mercadoria,local', 'local,semana', 'tipo,fabricante', 'mercadoria,dia',
+])
+def test_analytics_agrupa_como_na_mao(cliente, movimentos_analytics, agrupar):
+    corpo = cliente.get('/api/analytics', query_string={'de': '2024-05-01', 'ate': '2024-05-31', 'agrupar': agrupar}).get_json()
+    assert corpo['totais'] == {"entradas": 23, "saidas": 7, "saldo": 16}
+    series = sorted((tuple(sorted(serie['chave'].items())), serie['entradas'], serie['saidas']) for serie in corpo['series'])
+    assert series == agrupar_na_mao(movimentos_analytics, agrupar.split(','), '2024-05-01', '2024-05-31')
+    assert all(serie['saldo'] == serie['entradas'] - serie['saidas'] for serie in corpo['series'])
+
+def test_analytics_filtra_movimento_e_periodo(cliente, movimentos_analytics):
+    corpo = cliente.get('/api/analytics', query_string={
+        'de': '2024-05-06', 'ate': '2024-05-12', 'agrupar': 'dia', 'movimento': 'entradas'
+    }).get_json()
+    assert corpo['totais'] == {"entradas": 13, "saidas": 0, "saldo": 13}
+    assert [(serie['chave']['dia'], serie['entradas']) for serie in corpo['series']] == [('2024-05-06', 5), ('2024-05-12', 8)]
+
+# Período sem movimentos, com e sem mercadorias cadastradas: séries vazias em vez de erro
+@pytest.mark.parametrize('agrupar', ['', 'mercadoria', 'tipo', 'local', 'semana', 'mercadoria,local,dia', 'fabricante,mes'])
+@pytest.mark.parametrize('com_mercadoria', [False, True])
+def test_analytics_sem_movimentos(cliente, mercadoria, agrupar, com_mercadoria):
+    if com_mercadoria:
+        mercadoria()
+    resposta = cliente.get('/api/analytics', query_string={'de': '2024-05-01', 'ate': '2024-05-31', 'agrupar': agrupar})
+    assert resposta.status_code == 200, resposta.data
+    corpo = resposta.get_json()
+    assert corpo['totais'] == {"entradas": 0, "saidas": 0, "saldo": 0}
+    assert corpo['series'] == []
+
+# Movimento de mercadoria apagada: as chaves da mercadoria ficam como Desconhecido
+def test_analytics_com_mercadoria_inexistente(app, cliente, movimentos_analytics):
+    from mstarsupply.banco import db
+    from mstarsupply.modelos import Entrada
+    with app.app_context():
+        db.session.execute(db.update(Entrada).where(Entrada.quantidade == 8).values(mercadoria_id=9999))
+        db.session.commit()
+    corpo = cliente.get('/api/analytics', query_string={'de': '2024-05-01', 'ate': '2024-05-31', 'agrupar': 'mercadoria,tipo'}).get_json()
+    desconhecida = next(serie for serie in corpo['series'] if serie['chave']['mercadoria_id'] == 9999)
+    assert desconhecida['chave'] == {"mercadoria_id": 9999, "nome": "Desconhecido", "tipo": "Desconhecido"}
+    assert desconhecida['entradas'] == 8
+
+@pytest.mark.parametrize('args', [
+    {'de': '2024-05-01'},
+    {'de': '2024-05-31', 'ate': '2024-05-01'},
+    {'de': '2024-05-01', 'ate': '2024-05-31', 'agrupar': 'cor'},
+    {'de': '2024-05-01', 'ate': '2024-05-31', 'agrupar': 'dia,mes'},
+    {'de': '2024-05-01', 'ate': '2024-05-31', 'agrupar': 'local,local'},
+    {'de': '2024-05-01', 'ate': '2024-05-31', 'movimento': 'devolucoes'},
+])
+def test_analytics_parametros_invalidos(cliente, args):
+    assert cliente.get('/api/analytics', query_string=args).status_code == 400
+
+def test_analytics_limite_de_grupos(app, cliente, movimentos_analytics):
+    app.config['ANALYTICS_MAX_GRUPOS'] = 3
+    args = {'de': '2024-05-01', 'ate': '2024-05-31'}
+    assert cliente.get('/api/analytics', query_string=dict(args, agrupar='mercadoria')).status_code == 200
+    resposta = cliente.get('/api/analytics', query_string=dict(args, agrupar='dia'))
+    assert resposta.status_code == 400
+    assert '4 grupos' in resposta.get_json()['error']
@@ -0,0 +1,104 @@
+import pytest
+
+# Entradas 10 a 10,00 e 10 a 20,00, depois saídas de 5 e de 10, tudo em maio de 2024
+def movimentar_maio(movimentar, id):
+    assert movimentar('entradas', id, 10, '2024-05-01 08:00:00', custo_unitario=10).status_code == 201
+    assert movimentar('entradas', id, 10, '2024-05-10 08:00:00', custo_unitario=20).status_code == 201
+    assert movimentar('saidas', id, 5, '2024-05-20 08:00:00').status_code == 201
+    assert movimentar('saidas', id, 10, '2024-05-25 08:00:00').status_code == 201
+
+def custos_das_saidas(cliente):
+    saidas = cliente.get('/api/movimentacoes/5/2024', query_string={'tipo': 'saidas'}).get_json()['saidas']
+    return [round(saida['custo_unitario'], 4) for saida in sorted(saidas, key=lambda saida: saida['data_hora'])]
+
+def valorizacao_maio(cliente, id):
+    corpo = cliente.get('/api/valorizacao/5/2024').get_json()
+    return next(m for m in corpo['mercadorias'] if m['id'] == id)
+
+# Custo médio: 20 unidades valendo 300,00 (15,00 cada); as saídas levam 75,00 e 150,00 e sobram 5 valendo 75,00.
+# FIFO: a saída de 5 sai da camada de 10,00 (50,00) e a de 10 leva as 5 restantes dela e 5 da de 20,00 (150,00),
+# sobrando 5 a 20,00.
+@pytest.mark.parametrize('custeio, custos, valor, custo_saidas', [
+    ('media', [15.0, 15.0], 75.0, 225.0),
+    ('fifo', [10.0, 15.0], 100.0, 200.0),
+])
+def test_custo_das_saidas_e_valorizacao(app, cliente, comando, mercadoria, movimentar, custeio, custos, valor, custo_saidas):
+    app.config['CUSTEIO'] = custeio
+    id = mercadoria()
+    movimentar_maio(movimentar, id)
+
+    assert custos_das_saidas(cliente) == custos
+    linha = valorizacao_maio(cliente, id)
+    assert (linha['saldo'], linha['valor'], linha['custo_entradas'], linha['custo_saidas']) == (5, valor, 300.0, custo_saidas)
+
+    # O razão gravado a cada movimento bate com o replay do histórico
+    resultado = comando('recalcular-custos', '--verificar')
+    assert resultado.exit_code == 0, resultado.output
+    assert '0 divergência(s)' in resultado.output
+
+# Movimento com data anterior não refaz o custo das saídas já gravadas; o recalcular-custos refaz na ordem cronológica
+@pytest.mark.parametrize('custeio, custos, valor', [
+    # Replay: 10 a 5,00 em abril e 10 a 10,00 em maio valem 150,00, a saída de 5 sai a 7,50 e sobram 112,50
+    ('media', [7.5], 112.5),
+    # Replay: a saída de 5 consome a camada de abril (5,00) e sobram 5 a 5,00 e 10 a 10,00
+    ('fifo', [5.0], 125.0),
+])
+def test_recalcular_custos_refaz_entrada_com_data_anterior(app, cliente, comando, mercadoria, movimentar, custeio, custos, valor):
+    app.config['CUSTEIO'] = custeio
+    id = mercadoria()
+    assert movimentar('entradas', id, 10, '2024-05-01 08:00:00', custo_unitario=10).status_code == 201
+    assert movimentar('saidas', id, 5, '2024-05-20 08:00:00').status_code == 201
+    assert custos_das_saidas(cliente) == [10.0]
+    assert movimentar('entradas', id, 10, '2024-04-28 08:00:00', custo_unitario=5).status_code == 201
+
+    resultado = comando('recalcular-custos', '--verificar')
+    assert resultado.exit_code == 1
+    assert '0 divergência(s)' not in resultado.output
+
+    resultado = comando('recalcular-custos')
+    assert resultado.exit_code == 0, resultado.output
+    assert custos_das_saidas(cliente) == custos
+    linha = valorizacao_maio(cliente, id)
+    assert (linha['saldo'], linha['valor'], linha['custo_entradas']) == (15, valor, 100.0)
+    assert comando('recalcular-custos', '--verificar').exit_code == 0
+
+# Trocar o CUSTEIO e rodar o recalcular-custos refaz os custos já gravados pelo método novo
+def test_troca_de_custeio_com_recalcular_custos(app, cliente, comando, mercadoria, movimentar):
+    id = mercadoria()
+    movimentar_maio(movimentar, id)
+    assert custos_das_saidas(cliente) == [15.0, 15.0]
+
+    app.config['CUSTEIO'] = 'fifo'
+    assert comando('recalcular-custos', '--verificar').exit_code == 1
+    assert comando('recalcular-custos').exit_code == 0
+    assert custos_das_saidas(cliente) == [10.0, 15.0]
+    assert valorizacao_maio(cliente, id)['valor'] == 100.0
+
+    # As próximas saídas continuam das camadas reconstruídas (sobraram 5 a 20,00)
+    assert movimentar('saidas', id, 2, '2024-05-28 08:00:00').status_code == 201
+    assert custos_das_saidas(cliente)[-1] == 20.0
+    assert comando('recalcular-custos', '--verificar').exit_code == 0
+
+# Cada mercadoria sai do último mês movimentado até o período, inclusive de anos anteriores; movimentos depois
+# do período não entram
+def test_valorizacao_usa_o_ultimo_mes_de_cada_mercadoria(cliente, mercadoria, movimentar):
+    luva, gaze, soro = mercadoria('Luva'), mercadoria('Gaze', custo_unitario=2.0), mercadoria('Soro')
+    assert movimentar('entradas', luva, 10, '2023-11-02 08:00:00', custo_unitario=10).status_code == 201
+    assert movimentar('entradas', luva, 10, '2024-03-02 08:00:00', custo_unitario=20).status_code == 201
+    assert movimentar('saidas', luva, 4, '2024-05-02 08:00:00').status_code == 201
+    assert movimentar('entradas', gaze, 7, '2023-12-31 23:59:59').status_code == 201
+    assert movimentar('entradas', soro, 3, '2024-06-01 00:00:00').status_code == 201
+
+    corpo = cliente.get('/api/valorizacao/4/2024').get_json()
+    linhas = {linha['id']: linha for linha in corpo['mercadorias']}
+    assert set(linhas) == {luva, gaze}
+    assert (linhas[luva]['saldo'], linhas[luva]['valor'], linhas[luva]['custo_entradas']) == (20, 300.0, 0.0)
+    assert (linhas[gaze]['saldo'], linhas[gaze]['valor']) == (7, 14.0)
+    assert corpo['valor_total'] == 314.0
+
+    maio = cliente.get('/api/valorizacao/5/2024').get_json()
+    assert [(linha['id'], linha['saldo'], linha['custo_saidas']) for linha in maio['mercadorias']] == \
+        [(luva, 16, 60.0), (gaze, 7, 0.0)]
+    assert [linha['id'] for linha in cliente.get('/api/valorizacao/6/2024').get_json()['mercadorias']] == [luva, gaze, soro]
+    filtrada = cliente.get('/api/valorizacao/12/2023', query_string={'mercadoria_id': gaze}).get_json()
+    assert [(linha['id'], linha['custo_entradas']) for linha in filtrada['mercadorias']] == [(gaze, 14.0)]
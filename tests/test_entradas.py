@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from mstarsupply.banco import db
+from mstarsupply.estoque import atualizar_saldo
+from mstarsupply.modelos import Entrada, SaldoMercadoria
+
+def test_entrada_de_mercadoria_inexistente(app, cliente, mercadoria, movimentar):
+    id = mercadoria()
+    resposta = movimentar('entradas', id + 1, 10, '2024-05-02 08:00:00')
+    assert resposta.status_code == 404
+    assert resposta.get_json() == {"error": "Mercadoria não encontrada"}
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(Entrada)) == 0
+        assert db.session.get(SaldoMercadoria, id + 1) is None
+
+    # Com custo informado também (sem ele o custo da mercadoria já não existiria)
+    resposta = movimentar('entradas', id + 1, 10, '2024-05-02 08:00:00', custo_unitario=5)
+    assert resposta.status_code == 404
+    assert movimentar('entradas', id, 10, '2024-05-02 08:00:00').status_code == 201
+
+# INSERT que falha sem ser corrida (a linha não existe nem depois) não pode seguir como se tivesse somado
+def test_somar_ou_criar_repassa_erro_que_nao_e_corrida(app):
+    with app.app_context():
+        db.session.execute(db.text('PRAGMA foreign_keys = ON'))  # No SQLite a chave estrangeira só vale ligada
+        with pytest.raises(IntegrityError):
+            atualizar_saldo(12345, entradas=1)
+        db.session.rollback()
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+INSTANTES = ['2023-12-31', '2024-01-31', '2024-02-15 12:00:00', '2024-02-29', '2024-03-31 23:59:59', '2024-04-10']
+
+# Saldo de cada mercadoria no instante somando os movimentos um a um (o ?em= só com a data vale o dia inteiro)
+def saldos_na_forca(movimentos, em):
+    ate = datetime.strptime(em, '%Y-%m-%d %H:%M:%S') + timedelta(seconds=1) if ' ' in em else \
+        datetime.strptime(em, '%Y-%m-%d') + timedelta(days=1)
+    saldos = {}
+    for tipo, id, quantidade, data_hora in movimentos:
+        if datetime.strptime(data_hora, '%Y-%m-%d %H:%M:%S') < ate:
+            saldos[id] = saldos.get(id, 0) + (quantidade if tipo == 'entradas' else -quantidade)
+    return saldos
+
+def saldos_da_api(cliente, em):
+    resposta = cliente.get('/api/disponibilidade', query_string={'em': em})
+    assert resposta.status_code == 200
+    return {linha['id']: linha['disponibilidade'] for linha in resposta.get_json()}
+
+def test_fechamentos_acompanham_movimentos_com_data_anterior(cliente, comando, mercadoria, movimentar):
+    luva, gaze, soro = mercadoria('Luva'), mercadoria('Gaze'), mercadoria('Soro')
+    movimentos = [
+        ('entradas', luva, 50, '2024-01-05 08:00:00'),
+        ('entradas', gaze, 30, '2024-01-20 08:00:00'),
+        ('saidas', luva, 10, '2024-02-03 08:00:00'),
+        ('entradas', luva, 5, '2024-03-01 00:00:00'),
+        ('saidas', gaze, 12, '2024-03-31 23:59:59'),
+        ('entradas', gaze, 7, '2024-04-02 08:00:00'),
+    ]
+    for movimento in movimentos:
+        assert movimentar(*movimento).status_code == 201
+    resultado = comando('fechar-saldos', '--ate', '2024-03')
+    assert resultado.exit_code == 0, resultado.output
+    assert '3 mês(es) fechado(s)' in resultado.output
+
+    # Depois dos fechamentos: movimentos em meses já fechados, inclusive antes do primeiro e de uma mercadoria
+    # que ainda não tinha fechamento nenhum
+    atrasados = [
+        ('entradas', luva, 8, '2024-01-10 08:00:00'),
+        ('saidas', gaze, 4, '2024-02-15 12:00:00'),
+        ('entradas', soro, 20, '2024-02-20 08:00:00'),
+        ('saidas', soro, 3, '2024-03-15 08:00:00'),
+        ('entradas', gaze, 2, '2023-12-28 08:00:00'),
+        ('saidas', luva, 1, '2024-04-05 08:00:00'),
+    ]
+    for movimento in atrasados:
+        assert movimentar(*movimento).status_code == 201
+    movimentos += atrasados
+
+    resultado = comando('fechar-saldos', '--verificar')
+    assert resultado.exit_code == 0, resultado.output
+    assert '0 fechamento(s) divergente(s)' in resultado.output
+
+    for em in INSTANTES:
+        esperado = saldos_na_forca(movimentos, em)
+        assert saldos_da_api(cliente, em) == {id: esperado.get(id, 0) for id in (luva, gaze, soro)}, em
+
+    # O próximo fechamento parte do último gravado, já acertado
+    assert comando('fechar-saldos', '--ate', '2024-04').exit_code == 0
+    assert comando('fechar-saldos', '--verificar').exit_code == 0
+    esperado = saldos_na_forca(movimentos, '2024-04-30')
+    assert saldos_da_api(cliente, '2024-04-30') == {id: esperado.get(id, 0) for id in (luva, gaze, soro)}
+
+def test_verificar_aponta_fechamento_divergente(app, comando, mercadoria, movimentar):
+    luva = mercadoria('Luva')
+    movimentar('entradas', luva, 50, '2024-01-05 08:00:00')
+    movimentar('saidas', luva, 10, '2024-02-03 08:00:00')
+    assert comando('fechar-saldos', '--ate', '2024-02').exit_code == 0
+
+    with app.app_context():
+        from mstarsupply.banco import db
+        from mstarsupply.modelos import FechamentoSaldo
+        db.session.execute(db.update(FechamentoSaldo).where(FechamentoSaldo.mes == 1).values(saldo=FechamentoSaldo.saldo + 1))
+        db.session.commit()
+
+    resultado = comando('fechar-saldos', '--verificar')
+    assert resultado.exit_code == 1
+    assert '1 fechamento(s) divergente(s)' in resultado.output
+    assert comando('fechar-saldos', '--refazer', '--ate', '2024-02').exit_code == 0
+    assert comando('fechar-saldos', '--verificar').exit_code == 0
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+pytest.importorskip('matplotlib')
+
+def pngs(app):
+    pasta = app.config['GRAFICO_CACHE_DIR']
+    return sorted(nome for nome in os.listdir(pasta) if nome.endswith('.png'))
+
+def test_movimento_troca_a_versao_e_limpar_graficos_apaga_os_antigos(app, cliente, comando, mercadoria, movimentar):
+    id = mercadoria()
+    movimentar('entradas', id, 10, '2024-05-02 08:00:00')
+    movimentar('entradas', id, 10, '2024-06-02 08:00:00')
+    primeiro = cliente.get('/api/grafico/5/2024')
+    assert primeiro.status_code == 200
+    assert cliente.get('/api/grafico/6/2024').status_code == 200
+    assert cliente.get('/api/grafico/5/2024').data == primeiro.data  # Do cache
+    antigos = pngs(app)
+    assert len(antigos) == 2
+
+    # O movimento só troca a versão do mês: o PNG antigo continua na pasta, mas não é mais servido
+    movimentar('saidas', id, 4, '2024-05-20 08:00:00')
+    assert pngs(app) == antigos
+    novo = cliente.get('/api/grafico/5/2024')
+    assert novo.status_code == 200 and novo.data != primeiro.data
+    assert len(pngs(app)) == 3
+
+    resultado = comando('limpar-graficos')
+    assert resultado.exit_code == 0, resultado.output
+    assert '1 gráfico(s) antigo(s) removido(s)' in resultado.output
+    assert len(pngs(app)) == 2
+    assert cliente.get('/api/grafico/5/2024').data == novo.data
+    assert cliente.get('/api/grafico/6/2024').status_code == 200
+    assert len(pngs(app)) == 2
@@ -0,0 +1,117 @@
+import pytest
+
+from mstarsupply import cadastros
+from mstarsupply.banco import db
+from mstarsupply.modelos import Saida
+
+@pytest.fixture
+def configuracao():
+    return {"TAMANHO_LOTE_IMPORTACAO": 2}  # Vários lotes mesmo com poucas linhas
+
+def linha(mercadoria_id, quantidade, data_hora='2024-05-02 08:00:00', local='Doca 1', **extra):
+    return dict(mercadoria_id=mercadoria_id, quantidade=quantidade, data_hora=data_hora, local=local, **extra)
+
+def saldo(cliente, id):
+    return cliente.get(f'/api/mercadorias/{id}/disponibilidade').get_json()['disponibilidade']
+
+# Linhas inválidas ou de mercadoria inexistente viram erros com o número da linha; as outras são gravadas
+def test_entradas_com_falhas_parciais(cliente, mercadoria):
+    id = mercadoria()
+    resposta = cliente.post('/api/entradas/bulk', json=[
+        linha(id, 5),
+        linha(id, 0),
+        linha(id + 99, 3),
+        linha(id, 2, custo_unitario=4),
+        {"mercadoria_id": id, "quantidade": 1, "data_hora": '2024-05-02 08:00:00'},
+        linha(id, 1, data_hora='02/05/2024'),
+        'não é um objeto',
+        linha(id, 7, data_hora='2024-06-30 23:59:59'),
+    ])
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert (corpo['recebidas'], corpo['registradas'], corpo['total_erros']) == (8, 3, 5)
+    assert [erro['linha'] for erro in corpo['erros']] == [2, 3, 5, 6, 7]
+    assert corpo['erros'][1]['erro'] == 'Mercadoria não encontrada'
+    assert saldo(cliente, id) == 14
+    valor = cliente.get('/api/valorizacao/6/2024').get_json()['valor_total']
+    assert valor == 5 * 10 + 2 * 4 + 7 * 10
+
+def test_entradas_em_csv(app, cliente, mercadoria):
+    id = mercadoria()
+    corpo = "mercadoria_id,quantidade,data_hora,local\n" \
+        f"{id},4,2024-05-02 08:00:00,Doca 1\n{id},x,2024-05-02 08:00:00,Doca 1\n{id},6,2024-05-03 08:00:00,Doca 2\n"
+    resposta = cliente.post('/api/entradas/bulk', data=corpo.encode('utf-8-sig'), content_type='text/csv')
+    assert resposta.get_json()['registradas'] == 2
+    assert [erro['linha'] for erro in resposta.get_json()['erros']] == [2]
+    assert saldo(cliente, id) == 10
+
+    # Bytes inválidos no meio: as linhas lidas antes (inclusive as do lote ainda não gravado) ficam gravadas e o
+    # erro aponta a última linha lida
+    app.config['TAMANHO_LOTE_IMPORTACAO'] = 1000
+    validas = ''.join(f"{id},1,2024-05-04 08:00:00,Doca 1\n" for _ in range(501))
+    resposta = cliente.post('/api/entradas/bulk', data=f"mercadoria_id,quantidade,data_hora,local\n{validas}".encode()
+                            + b'\xff\xfe\n' * 10, content_type='text/csv')
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert 0 < corpo['registradas'] == corpo['recebidas'] < 501  # Até o pedaço do arquivo que não decodifica
+    assert corpo['total_erros'] == 1
+    assert corpo['erros'][0]['linha'] == corpo['recebidas'] and corpo['erros'][0]['erro'].startswith('CSV inválido')
+    assert saldo(cliente, id) == 10 + corpo['registradas']
+
+def test_corpo_que_nao_e_lista(cliente):
+    assert cliente.post('/api/entradas/bulk', json={"mercadoria_id": 1}).status_code == 400
+
+# A disponibilidade vale na ordem das linhas, inclusive entre lotes
+def test_saidas_respeitam_a_ordem_das_linhas(app, cliente, mercadoria, movimentar):
+    id, outra = mercadoria(), mercadoria('Gaze')
+    movimentar('entradas', id, 10, '2024-05-01 08:00:00')
+    resposta = cliente.post('/api/saidas/bulk', json=[
+        linha(id, 4), linha(id, 7), linha(id, 6), linha(outra, 1), linha(id + 99, 1),
+    ])
+    corpo = resposta.get_json()
+    assert corpo['registradas'] == 2
+    assert [(erro['linha'], erro['erro']) for erro in corpo['erros']] == [
+        (2, 'Quantidade insuficiente em estoque'), (4, 'Quantidade insuficiente em estoque'), (5, 'Mercadoria não encontrada'),
+    ]
+    assert saldo(cliente, id) == 0
+    with app.app_context():
+        assert sorted(db.session.scalars(db.select(Saida.quantidade))) == [4, 6]
+
+# Saldo alterado por uma saída concorrente entre a leitura e a reserva: o lote é desfeito e repetido
+@pytest.mark.parametrize('falhas, registradas', [(1, 2), (2, 2), (3, 0)])
+def test_lote_de_saidas_repetido_depois_de_conflito(app, cliente, mercadoria, movimentar, monkeypatch, falhas, registradas):
+    id = mercadoria()
+    movimentar('entradas', id, 10, '2024-05-01 08:00:00')
+    reservar_saldo = cadastros.reservar_saldo
+    chamadas = []
+
+    def reservar_com_conflito(mercadoria_id, quantidade):
+        chamadas.append(quantidade)
+        return len(chamadas) > falhas and reservar_saldo(mercadoria_id, quantidade)
+
+    monkeypatch.setattr(cadastros, 'reservar_saldo', reservar_com_conflito)
+    corpo = cliente.post('/api/saidas/bulk', json=[linha(id, 3), linha(id, 2)]).get_json()
+    assert len(chamadas) == min(falhas + 1, 3)
+    assert corpo['registradas'] == registradas
+    if registradas:
+        assert corpo['erros'] == []
+    else:
+        assert [erro['erro'] for erro in corpo['erros']] == ['Conflito de concorrência, reenvie a linha'] * 2
+
+    # As tentativas desfeitas não deixam saídas nem baixas pela metade
+    assert saldo(cliente, id) == 10 - 5 * bool(registradas)
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(Saida)) == (2 if registradas else 0)
+    assert cliente.get('/api/valorizacao/5/2024').get_json()['mercadorias'][0]['saldo'] == 10 - 5 * bool(registradas)
+
+# Um lote que esgota as tentativas não impede os seguintes
+def test_conflito_num_lote_nao_afeta_os_outros(cliente, mercadoria, movimentar, monkeypatch):
+    id = mercadoria()
+    movimentar('entradas', id, 10, '2024-05-01 08:00:00')
+    reservar_saldo = cadastros.reservar_saldo
+    monkeypatch.setattr(cadastros, 'reservar_saldo', lambda mercadoria_id, quantidade:
+                        quantidade != 3 and reservar_saldo(mercadoria_id, quantidade))
+    corpo = cliente.post('/api/saidas/bulk', json=[linha(id, 2), linha(id, 1), linha(id, 4)]).get_json()  # Lotes de 3 e 4
+    assert corpo['registradas'] == 1
+    assert [erro['linha'] for erro in corpo['erros']] == [1, 2]
+    assert saldo(cliente, id) == 6
@@ -0,0 +1,161 @@
+import os
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import pytest
+
+from mstarsupply import relatorios
+from mstarsupply.banco import db
+from mstarsupply.modelos import RelatorioJob
+
+# Pool de relatórios de mentira: guarda os jobs submetidos e roda quando o teste pede, neste processo
+class PoolDoTeste:
+    def __init__(self):
+        self.pendentes = []
+
+    def submit(self, funcao, *args):
+        futuro = Future()
+        self.pendentes.append((funcao, args, futuro))
+        return futuro
+
+    def rodar(self):
+        while self.pendentes:
+            funcao, args, futuro = self.pendentes.pop(0)
+            futuro.set_result(funcao(*args))
+
+@pytest.fixture
+def pool(app, monkeypatch):
+    pool = PoolDoTeste()
+    monkeypatch.setattr(relatorios, 'pool_relatorios', lambda: pool)
+    monkeypatch.setattr(relatorios, 'app_do_processo', app, raising=False)
+    monkeypatch.setattr(relatorios, 'jobs_do_processo', set())
+    monkeypatch.setattr(relatorios, 'iniciar_pulso', lambda app: None)  # O pulso é renovado na mão nos testes
+    return pool
+
+# Simula o reinício do processo: a fila do pool some e o pulso dos jobs para (fica velho no banco)
+def reiniciar_processo(app, pool):
+    pool.pendentes.clear()
+    relatorios.jobs_do_processo.clear()
+    with app.app_context():
+        db.session.execute(db.update(RelatorioJob).values(pulso_em=datetime.now() - timedelta(minutes=10)))
+        db.session.commit()
+
+def pedir(cliente, mes=5, ano=2024, tipo='relatorio_csv'):
+    return cliente.post('/api/relatorios', json={"tipo": tipo, "mes": mes, "ano": ano})
+
+def job(app, id):
+    with app.app_context():
+        return db.session.get(RelatorioJob, id)
+
+def test_movimento_no_mes_desatualiza_relatorio_concluido(app, cliente, pool, mercadoria, movimentar):
+    id = mercadoria()
+    movimentar('entradas', id, 10, '2024-05-02 08:00:00')
+    resposta = pedir(cliente)
+    assert resposta.status_code == 202
+    pool.rodar()
+    concluido = job(app, resposta.get_json()['id'])
+    assert concluido.status == 'concluido'
+    assert os.path.exists(concluido.arquivo)
+
+    # Movimento em outro mês não mexe no job; no mesmo mês ele fica desatualizado (o arquivo sai na limpeza)
+    movimentar('entradas', id, 1, '2024-06-02 08:00:00')
+    assert job(app, concluido.id).status == 'concluido'
+    movimentar('entradas', id, 3, '2024-05-20 08:00:00')
+    assert job(app, concluido.id).status == 'desatualizado'
+    assert cliente.get(f'/api/relatorios/{concluido.id}/arquivo').status_code == 409
+
+    # O próximo pedido limpa o desatualizado e gera de novo, já com o movimento novo
+    resposta = pedir(cliente)
+    assert resposta.status_code == 202
+    assert not os.path.exists(concluido.arquivo)
+    pool.rodar()
+    novo = resposta.get_json()['id']
+    assert job(app, novo).status == 'concluido'
+    assert b'13' in cliente.get(f'/api/relatorios/{novo}/arquivo').data
+
+def test_movimento_durante_a_geracao_refaz_o_arquivo(app, cliente, pool, mercadoria, movimentar, monkeypatch):
+    id = mercadoria()
+    movimentar('entradas', id, 10, '2024-05-02 08:00:00')
+    gerar, nome, mimetype = relatorios.TIPOS_RELATORIO['relatorio_csv']
+    geracoes = []
+
+    # A primeira geração recebe um movimento do mês no meio (como uma gravação concorrente)
+    def gerar_com_movimento(mes, ano):
+        conteudo = gerar(mes, ano)
+        geracoes.append(b''.join(conteudo))
+        if len(geracoes) == 1:
+            assert movimentar('entradas', id, 5, '2024-05-10 08:00:00').status_code == 201
+        return BytesIO(geracoes[-1])
+
+    monkeypatch.setitem(relatorios.TIPOS_RELATORIO, 'relatorio_csv', (gerar_com_movimento, nome, mimetype))
+    resposta = pedir(cliente)
+    pool.rodar()
+
+    concluido = job(app, resposta.get_json()['id'])
+    assert (concluido.status, concluido.versao, len(geracoes)) == ('concluido', 1, 2)
+    assert b'15' in geracoes[1] and b'15' not in geracoes[0]
+    with open(concluido.arquivo, 'rb') as arquivo:
+        assert arquivo.read() == geracoes[1]
+
+def test_gravacao_sem_job_no_mes_nao_faz_commit_extra(app, mercadoria, movimentar):
+    id = mercadoria()
+    commits = []
+    with app.app_context():
+        from sqlalchemy import event
+        event.listen(db.engine, 'commit', lambda conexao: commits.append(1))
+    movimentar('entradas', id, 10, '2024-05-02 08:00:00')
+    movimentar('saidas', id, 1, '2024-05-03 08:00:00')
+    assert len(commits) == 2
+
+@pytest.mark.parametrize('retomar', [
+    lambda cliente, id: pedir(cliente),  # Pedido igual cai no job abandonado
+    lambda cliente, id: cliente.get(f'/api/relatorios/{id}'),  # Cliente acompanhando o status
+])
+@pytest.mark.parametrize('status', ['pendente', 'processando'])
+def test_job_abandonado_num_reinicio_e_retomado(app, cliente, pool, mercadoria, movimentar, retomar, status):
+    movimentar('entradas', mercadoria(), 10, '2024-05-02 08:00:00')
+    id = pedir(cliente).get_json()['id']
+    with app.app_context():
+        db.session.execute(db.update(RelatorioJob).values(status=status))
+        db.session.commit()
+    reiniciar_processo(app, pool)
+
+    resposta = retomar(cliente, id)
+    assert resposta.status_code == 200
+    assert resposta.get_json()['status'] == 'pendente'
+    assert len(pool.pendentes) == 1
+    assert job(app, id).versao == 1
+
+    # Os próximos pedidos não retomam de novo: o job voltou a ter pulso
+    assert pedir(cliente).status_code == 200
+    assert cliente.get(f'/api/relatorios/{id}').status_code == 200
+    assert len(pool.pendentes) == 1
+    pool.rodar()
+    assert job(app, id).status == 'concluido'
+
+def test_job_vivo_nao_e_retomado(app, cliente, pool, mercadoria, movimentar):
+    movimentar('entradas', mercadoria(), 10, '2024-05-02 08:00:00')
+    id = pedir(cliente).get_json()['id']
+    assert relatorios.jobs_do_processo == {id}
+
+    # Mesmo com o pedido antigo, o pulso renovado mantém o job com o processo que tem ele na fila
+    with app.app_context():
+        db.session.execute(db.update(RelatorioJob).values(pulso_em=datetime.now() - timedelta(minutes=10)))
+        db.session.commit()
+    relatorios.renovar_pulso(app)
+    assert pedir(cliente).status_code == 200
+    assert len(pool.pendentes) == 1
+
+    pool.rodar()
+    assert relatorios.jobs_do_processo == set()
+    assert job(app, id).status == 'concluido'
+
+def test_job_ja_assumido_nao_e_gerado_duas_vezes(app, cliente, pool, mercadoria, movimentar):
+    movimentar('entradas', mercadoria(), 10, '2024-05-02 08:00:00')
+    id = pedir(cliente).get_json()['id']
+    funcao, args, _ = pool.pendentes[0]
+    pool.pendentes.append((funcao, args, Future()))  # O mesmo job submetido duas vezes
+    pool.rodar()
+    concluido = job(app, id)
+    assert (concluido.status, concluido.versao) == ('concluido', 0)
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from mstarsupply.banco import db
+from mstarsupply.modelos import Saida, SaldoMercadoria
+
+def test_saidas_concorrentes_nao_deixam_saldo_negativo(app, mercadoria, movimentar):
+    id = mercadoria()
+    assert movimentar('entradas', id, 10, '2024-05-01 08:00:00').status_code == 201
+
+    # Cada thread com o seu cliente (e a sua conexão), todas pedindo a mesma mercadoria
+    def sair(_):
+        return app.test_client().post('/api/saidas', json={
+            "mercadoria_id": id, "quantidade": 1, "data_hora": '2024-05-02 10:00:00', "local": 'Doca 1'
+        }).status_code
+
+    with ThreadPoolExecutor(16) as executor:
+        status = list(executor.map(sair, range(40)))
+
+    assert status.count(201) == 10
+    assert status.count(400) == 30
+    with app.app_context():
+        saldo = db.session.get(SaldoMercadoria, id)
+        assert (saldo.total_entradas, saldo.total_saidas, saldo.saldo) == (10, 10, 0)
+        assert db.session.scalar(db.select(db.func.sum(Saida.quantidade))) == 10
+
+def test_saida_maior_que_o_saldo_nao_e_gravada(app, mercadoria, movimentar):
+    id = mercadoria()
+    movimentar('entradas', id, 5, '2024-05-01 08:00:00')
+
+    resposta = movimentar('saidas', id, 6, '2024-05-02 10:00:00')
+    assert resposta.status_code == 400
+    assert resposta.get_json() == {"error": "Quantidade insuficiente em estoque"}
+    with app.app_context():
+        assert db.session.get(SaldoMercadoria, id).saldo == 5
+        assert db.session.scalar(db.select(db.func.count()).select_from(Saida)) == 0
+
+def test_movimentos_validados_como_na_importacao(app, cliente, mercadoria, movimentar):
+    id = mercadoria()
+    for corpo in (
+        {"mercadoria_id": id, "quantidade": 0, "data_hora": '2024-05-01 08:00:00', "local": 'Doca 1'},
+        {"mercadoria_id": id, "quantidade": -3, "data_hora": '2024-05-01 08:00:00', "local": 'Doca 1'},
+        {"mercadoria_id": id, "quantidade": 'muitas', "data_hora": '2024-05-01 08:00:00', "local": 'Doca 1'},
+        {"mercadoria_id": id, "quantidade": 1, "data_hora": '01/05/2024', "local": 'Doca 1'},
+        {"mercadoria_id": id, "quantidade": 1, "data_hora": '2024-05-01 08:00:00'},
+    ):
+        assert cliente.post('/api/entradas', json=corpo).status_code == 400
+        assert cliente.post('/api/saidas', json=corpo).status_code == 400
+    assert cliente.post('/api/entradas', data='nada', content_type='application/json').status_code == 400
+
+    # Quantidade como texto numérico é aceita, como nas linhas do CSV
+    assert movimentar('entradas', id, '3', '2024-05-01 08:00:00').status_code == 201
+    assert movimentar('saidas', id, '2', '2024-05-02 08:00:00').status_code == 201
+    with app.app_context():
+        assert db.session.get(SaldoMercadoria, id).saldo == 1